@@ -1 +1,12 @@
-from eeglibrary.src import *
+import eeglibrary.src as _src
+
+__all__ = _src.__all__
+
+
+def __getattr__(name):
+    # Same names as eeglibrary.src, loaded on first access
+    return getattr(_src, name)
+
+
+def __dir__():
+    return _src.__dir__()
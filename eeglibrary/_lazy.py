@@ -0,0 +1,23 @@
+import importlib
+
+
+def attach(package_name, exports):
+    """
+    Lazy attribute loading for a package (PEP 562). exports maps submodule name to the public names it provides.
+    A submodule, and its heavy dependencies, are imported on first access of one of its names.
+    Returns (__getattr__, __dir__, __all__) for the package namespace.
+    """
+    name_to_module = {name: module for module, names in exports.items() for name in names}
+
+    def __getattr__(name):
+        if name in name_to_module:
+            module = importlib.import_module(f'{package_name}.{name_to_module[name]}')
+            return getattr(module, name)
+        if name in exports:
+            return importlib.import_module(f'{package_name}.{name}')
+        raise AttributeError(f'module {package_name!r} has no attribute {name!r}')
+
+    def __dir__():
+        return sorted(set(name_to_module) | set(exports))
+
+    return __getattr__, __dir__, sorted(name_to_module)
@@ -1,9 +1,49 @@
-from eeglibrary.src.eeg import *
-from eeglibrary.src.eeg_dataloader import *
-from eeglibrary.src.eeg_dataset import *
-from eeglibrary.src.eeg_loader import *
-from eeglibrary.src.eeg_parser import *
-from eeglibrary.src.metrics import *
-from eeglibrary.src.preprocessor import *
-from eeglibrary.src.test import *
-from eeglibrary.src.train import *
+# Names are resolved on first access, so importing a light module (e.g. eeglibrary.src.eeg) does not import
+# torch, sklearn or the ml package through train and test. See eeglibrary/_lazy.py
+from eeglibrary._lazy import attach
+
+_EXPORTS = {
+    'eeg': ['FILE_FORMAT', 'MONTAGES', 'select_channels', 'parse_channels', 'sample_slice', 'EEG'],
+    'eeg_dataloader': ['EEGDataLoader', 'set_dataloader', 'set_sequence_dataloader'],
+    'eeg_dataset': ['EEGDataSet'],
+    'eeg_loader': ['is_mat_v73', 'H5Values', 'from_mat_v73', 'from_mat', 'detect_mat_value_col',
+                   'convert_mat_archive', 'from_eeg'],
+    'eeg_parser': ['parse_eeg'],
+    'metrics': ['false_detection_rate'],
+    'preprocessor': ['eeg_preprocess_args', 'EEGPreprocessor'],
+    'test': ['inference'],
+    'train': ['train_model', 'save_model', 'update_by_epoch', 'record_log'],
+    'feature_cache': ['PREPROCESS_KEYS', 'preprocess_key', 'FeatureCache'],
+    'search': ['NOT_SEARCHED', 'parse_search_space', 'expand_grid', 'SuccessiveHalvingSearch', 'run_search'],
+    'resources': ['THREAD_ENVS', 'available_cores', 'limit_threads', 'WorkerInit', 'ResourcePlan', 'current_plan',
+                  'resolve_n_jobs', 'worker_threads', 'joblib_context', 'candidate_plans', 'benchmark_plans',
+                  'best_plan'],
+    'folds': ['patient_manifests', 'make_folds', 'build_fold_manifests', 'FoldOrchestrator', 'aggregate_fold_metrics'],
+    'quality': ['QUALITY_FLAGS', 'OK_FLAGS', 'scan_windows', 'scan_eeg', 'quality_mask_path', 'save_quality_mask',
+                'load_quality_mask', 'scan_manifest'],
+    'stats': ['RunningStats', 'compute_stats', 'fit_normalization'],
+    'ingest': ['RECORDING_FORMAT', 'PHASES', 'find_recordings', 'recording_name', 'load_recording', 'split_recordings',
+               'IngestPipeline'],
+    'profiling': ['current_rss', 'MemoryProfiler', 'ProfiledCollate', 'aggregate_memory_report'],
+    'collate': ['BatchBufferPool', 'EEGBatch', 'BufferedCollate'],
+    'sampler': ['recording_blocks', 'LocalityWeightedSampler'],
+    'augmentation': ['load_noise_bank', 'BatchAugmentor', 'mixup_loss', 'set_augmentor'],
+    'checkpoint': ['snapshot', 'atomic_save', 'CheckpointWriter', 'load_checkpoint', 'checkpoint_path'],
+    'spectral': ['BANDS', 'Spectrum'],
+    'filters': ['BTYPES', 'design_sos', 'FilterBank', 'StreamingFilter', 'filter_bank_from_conf'],
+    'ensemble': ['VOTINGS', 'parse_ensemble', 'load_model', 'Ensemble', 'set_ensemble'],
+    'window': ['RecordingMeta', 'meta_name', 'meta_path', 'save_recording_meta', 'load_recording_meta', 'EEGWindow',
+               'resolve_window', 'WindowTable'],
+    'path_table': ['TABLE_FILES', 'manifest_bounds_path', 'save_manifest_bounds', 'load_manifest_bounds',
+                   'PathTable'],
+    'knn': ['TREES', 'IndexedKNN'],
+    'quantize': ['QUANTIZED_SUFFIX', 'quantized_path', 'is_quantized_path', 'quantize_dynamic', 'quantize_static',
+                 'quantize_model', 'save_quantized', 'load_quantized', 'model_size_mb', 'compare_models'],
+    'scan': ['window_starts', 'iter_window_batches', 'FilteredValues', 'overlap_add', 'merge_events',
+             'RecordingScanner'],
+    'sequence': ['BucketBatchSampler', 'SequenceBatch', 'PackedCollate', 'WindowSequenceRNN'],
+    'interval_index': ['INDEX_FILES', 'EVENT_COLUMNS', 'parse_window_name', 'patient_of', 'WindowIndex'],
+    'incremental': ['JOURNAL_NAME', 'ChangeJournal', 'IncrementalStore'],
+}
+
+__getattr__, __dir__, __all__ = attach(__name__, _EXPORTS)
@@ -0,0 +1,137 @@
+from pathlib import Path
+
+import numpy as np
+import torch
+
+
+def load_noise_bank(noise_dir, min_len=0) -> torch.Tensor:
+    """
+    Loads every EEG pickle or .npy under noise_dir once, as rows of 1 channel noise signals (n_signal x time).
+    Signals are cut to the shortest one and normalized to unit std. BatchAugmentor tiles them if inputs are longer.
+    """
+    from eeglibrary.src.eeg import EEG
+
+    signals = []
+    for path in sorted(Path(noise_dir).glob('**/*')):
+        if path.suffix == '.pkl':
+            values = np.asarray(EEG.load_pkl(str(path)).values)
+        elif path.suffix == '.npy':
+            values = np.load(path)
+        else:
+            continue
+        signals.extend(np.atleast_2d(values))
+    assert signals, f'No noise found in {noise_dir}'
+
+    length = min(len(signal) for signal in signals)
+    assert length >= min_len, f'Noise signals must be longer than {min_len} samples'
+    bank = np.stack([signal[:length] for signal in signals]).astype(np.float32)
+    bank = (bank - bank.mean(axis=1, keepdims=True)) / (bank.std(axis=1, keepdims=True) + 1e-8)
+    return torch.from_numpy(bank)
+
+
+class BatchAugmentor:
+    """
+    Augments whole batches after collation, with one vectorized random draw per augmentation.
+    inputs: batch x channel x time, or batch x channel x freq x time. Time is always the last axis.
+    - noise: bank noise added to a noise_prob fraction of samples with level from noise_levels (raw waves only)
+    - time_shift: random circular shift up to time_shift of the length, per sample
+    - crop: random crop of (1 - crop) of the length per sample. The rest is zeroed, so the shape is kept
+    - channel_dropout: probability to zero each channel
+    - amp_scale: (min, max) of random amplitude scale per sample
+    - mixup_alpha: Beta(alpha, alpha) mixup of samples in the batch, 0 disables it
+    """
+    def __init__(self, noise_bank=None, noise_prob=0.4, noise_levels=(0.0, 0.5), time_shift=0.0, crop=0.0,
+                 channel_dropout=0.0, amp_scale=(1.0, 1.0), mixup_alpha=0.0, seed=None):
+        self.noise_bank = noise_bank
+        self.noise_prob = noise_prob
+        self.noise_levels = noise_levels
+        self.time_shift = time_shift
+        self.crop = crop
+        self.channel_dropout = channel_dropout
+        self.amp_scale = amp_scale
+        self.mixup_alpha = mixup_alpha
+        self.generator = torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        # torch has no Beta sampling with a generator, so mixup draws from numpy seeded by the same generator
+        self.rng = np.random.default_rng(self.generator.initial_seed())
+
+    def _rand(self, *size):
+        return torch.rand(*size, generator=self.generator)
+
+    def _add_noise(self, x):
+        batch_size, n_channels, length = x.shape
+        bank = self.noise_bank.to(x.dtype)
+        if bank.size(1) < length:
+            bank = bank.repeat(1, -(-length // bank.size(1)))
+        rows = torch.randint(len(bank), (batch_size, n_channels), generator=self.generator)
+        offsets = torch.randint(bank.size(1) - length + 1, (batch_size, n_channels, 1), generator=self.generator)
+        noise = bank[rows.unsqueeze(-1), offsets + torch.arange(length)].to(x.device)
+
+        low, high = self.noise_levels
+        levels = (low + (high - low) * self._rand(batch_size, 1, 1)) * (self._rand(batch_size, 1, 1) < self.noise_prob)
+        return x + levels.to(x.device, x.dtype) * x.std(dim=-1, keepdim=True) * noise
+
+    def _shift(self, x):
+        length = x.size(-1)
+        max_shift = int(length * self.time_shift)
+        shifts = torch.randint(-max_shift, max_shift + 1, (x.size(0),), generator=self.generator)
+        index = (torch.arange(length) - shifts.view(-1, 1)) % length
+        index = index.view(x.size(0), *[1] * (x.dim() - 2), length).expand_as(x).to(x.device)
+        return x.gather(-1, index)
+
+    def _crop(self, x):
+        length = x.size(-1)
+        crop_len = max(1, int(round(length * (1 - self.crop))))
+        starts = torch.randint(length - crop_len + 1, (x.size(0), 1), generator=self.generator)
+        position = torch.arange(length)
+        keep = (position >= starts) & (position < starts + crop_len)
+        return x * keep.view(x.size(0), *[1] * (x.dim() - 2), length).to(x.device, x.dtype)
+
+    def __call__(self, inputs, labels=None):
+        """
+        Returns augmented inputs and mix. mix is None, or (labels of mixed samples, lam) for mixup_loss
+        """
+        x = inputs
+        shape = (x.size(0), *[1] * (x.dim() - 1))
+
+        if self.noise_bank is not None and x.dim() == 3 and self.noise_prob > 0:
+            x = self._add_noise(x)
+        if self.time_shift > 0:
+            x = self._shift(x)
+        if self.crop > 0:
+            x = self._crop(x)
+        if self.channel_dropout > 0:
+            keep = self._rand(x.size(0), x.size(1)) >= self.channel_dropout
+            x = x * keep.view(x.size(0), x.size(1), *[1] * (x.dim() - 2)).to(x.device, x.dtype)
+        if self.amp_scale[0] != 1.0 or self.amp_scale[1] != 1.0:
+            low, high = self.amp_scale
+            x = x * (low + (high - low) * self._rand(*shape)).to(x.device, x.dtype)
+
+        mix = None
+        if self.mixup_alpha > 0 and labels is not None:
+            lam = float(self.rng.beta(self.mixup_alpha, self.mixup_alpha))
+            perm = torch.randperm(x.size(0), generator=self.generator).to(x.device)
+            x = lam * x + (1 - lam) * x[perm]
+            mix = (labels[perm], lam)
+
+        return x, mix
+
+
+def mixup_loss(criterion, outputs, labels, mix):
+    if mix is None:
+        return criterion(outputs, labels)
+    mixed_labels, lam = mix
+    return lam * criterion(outputs, labels) + (1 - lam) * criterion(outputs, mixed_labels)
+
+
+def set_augmentor(args):
+    # None when no augmentation is enabled
+    noise_bank = load_noise_bank(args.noise_dir) if getattr(args, 'noise_dir', None) else None
+    amp_scale = tuple(map(float, str(getattr(args, 'amp_scale', '1.0-1.0')).split('-')))
+    crop = getattr(args, 'crop', 0.0)
+    augmentor = BatchAugmentor(noise_bank, args.noise_prob, (args.noise_min, args.noise_max), args.time_shift, crop,
+                               args.channel_dropout, amp_scale, args.mixup_alpha, seed=args.seed)
+    enabled = noise_bank is not None or args.time_shift > 0 or crop > 0 or args.channel_dropout > 0 \
+        or amp_scale != (1.0, 1.0) or args.mixup_alpha > 0
+    return augmentor if enabled else None
@@ -1,17 +1,20 @@
 import numpy as np
-from scipy import signal
-from scipy.signal import butter, lfilter
+from scipy.signal import sosfilt
+from eeglibrary.src.filters import design_sos
+from eeglibrary.src.spectral import Spectrum
 
 
-def createSpec(signals, sr, n_channels=22):
+def createSpec(signals, sr, n_channels=22, spectrum=None):
     # Reference: https://github.com/MesSem/CNNs-on-CHB-MIT, DataSetToSpectrogram
 
     n_channels = min(n_channels, 22)
+    # Spectrogram of all channels at once, shared through spectrum with other features of the same window
+    if spectrum is None:
+        spectrum = Spectrum(signals[:n_channels], sr)
+    spectrograms = spectrum.spectrogram(nfft=sr, return_onesided=True, noverlap=128)[2]
 
     for channel in range(n_channels):
-        y = signals[channel]
-
-        Pxx = signal.spectrogram(y, nfft=sr, fs=sr, return_onesided=True, noverlap=128)[2]
+        Pxx = spectrograms[channel]
         Pxx = np.delete(Pxx, np.s_[117:123 + 1], axis=0)
         Pxx = np.delete(Pxx, np.s_[57:63 + 1], axis=0)
         Pxx = np.delete(Pxx, 0, axis=0)
@@ -28,20 +31,10 @@ def createSpec(signals, sr, n_channels=22):
     return spect
 
 
-# Filtro taglia banda
+# Filtro taglia banda. Designs are cached, and data may be channel x time
 def butter_bandstop_filter(data, lowcut, highcut, fs, order):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-
-    i, u = butter(order, [low, high], btype='bandstop')
-    y = lfilter(i, u, data)
-    return y
+    return sosfilt(design_sos('bandstop', (lowcut, highcut), fs, order), data, axis=-1)
 
 # Filtro taglia banda, passa alta
 def butter_highpass_filter(data, cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = butter(order, normal_cutoff, btype='high', analog=False)
-    y = lfilter(b, a, data)
-    return y
+    return sosfilt(design_sos('highpass', cutoff, fs, order), data, axis=-1)
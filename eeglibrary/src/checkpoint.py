@@ -0,0 +1,93 @@
+import os
+import queue
+import threading
+from pathlib import Path
+
+import torch
+
+
+def snapshot(state):
+    # CPU copy of a (nested) state dict, so training can keep updating parameters while it is written
+    if isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return state
+
+
+def atomic_save(state, path):
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    """
+    Serializes checkpoints on a background thread. The training thread only pays for the snapshot copy.
+    A file is written to a temporary name and renamed, so a preempted job never leaves a broken checkpoint.
+    With max_pending=1, a new save waits only if the previous one is still being written.
+    """
+    def __init__(self, max_pending=1):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            state, path = item
+            try:
+                atomic_save(state, path)
+            except Exception as e:
+                self.error = e
+            self.queue.task_done()
+
+    def save_state(self, state, path):
+        if self.error:
+            raise self.error
+        self.queue.put((snapshot(state), str(path)))
+
+    def save(self, path, model, optimizer=None, epoch=0, iteration=0, sampler_state=None, **extra):
+        # iteration: number of batches already done in epoch. sampler_state: position of the sampler in the epoch
+        state = dict(model=model.state_dict(), epoch=epoch, iteration=iteration, **extra)
+        if optimizer is not None:
+            state['optimizer'] = optimizer.state_dict()
+        if sampler_state is not None:
+            state['sampler'] = sampler_state
+        self.save_state(state, path)
+
+    def wait(self):
+        self.queue.join()
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def load_checkpoint(path, model, optimizer=None, sampler=None, device='cpu'):
+    # Returns (epoch, iteration) to resume from
+    state = torch.load(path, map_location=device)
+    model.load_state_dict(state['model'])
+    if optimizer is not None and 'optimizer' in state:
+        optimizer.load_state_dict(state['optimizer'])
+    if sampler is not None and 'sampler' in state and hasattr(sampler, 'load_state_dict'):
+        sampler.load_state_dict(state['sampler'])
+    print(f"Resumed from {path}: epoch {state['epoch']}, iteration {state['iteration']}")
+    return state['epoch'], state['iteration']
+
+
+def checkpoint_path(model_path) -> Path:
+    model_path = Path(model_path)
+    return model_path.with_name(f'{model_path.stem}_checkpoint{model_path.suffix}')
@@ -0,0 +1,130 @@
+import numbers
+import sys
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+
+class BatchBufferPool:
+    """
+    Small pool of preallocated batch tensors. A buffer is handed out again only when nothing outside the pool
+    references it anymore, i.e. the training loop has dropped the previous batch.
+    Inputs must be consumed synchronously (e.g. .to(device) without non_blocking) before the batch is dropped.
+    """
+    def __init__(self, sample_shape, batch_size, dtype=torch.float32, pin_memory=False, pool_size=4):
+        self.shape = (batch_size, *sample_shape)
+        self.dtype = dtype
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.pool_size = pool_size
+        self.buffers = []
+
+    def _allocate(self):
+        return torch.empty(self.shape, dtype=self.dtype, pin_memory=self.pin_memory)
+
+    def get(self, n=None):
+        n = n or self.shape[0]
+        for buffer in self.buffers:
+            # References: self.buffers, the loop variable and getrefcount's argument
+            if sys.getrefcount(buffer) <= 3:
+                return buffer[:n] if n != self.shape[0] else buffer
+        buffer = self._allocate()
+        if len(self.buffers) < self.pool_size:
+            self.buffers.append(buffer)
+        return buffer[:n] if n != self.shape[0] else buffer
+
+
+# Pinned pools live in the main process, where DataLoader pins batches coming from workers
+_PINNED_POOLS = {}
+
+
+def _pinned_pool(sample_shape, batch_size, dtype):
+    key = (tuple(sample_shape), batch_size, dtype)
+    if key not in _PINNED_POOLS:
+        _PINNED_POOLS[key] = BatchBufferPool(sample_shape, batch_size, dtype, pin_memory=True)
+    return _PINNED_POOLS[key]
+
+
+class EEGBatch:
+    """
+    Batch of inputs with int64 labels or an array of paths (batch x n_use_eeg).
+    Iterates like the tuples of the default collate, so `for inputs, labels in dataloader` keeps working.
+    DataLoader(pin_memory=True) calls pin_memory(), which copies inputs into a recycled pinned buffer.
+    """
+    __slots__ = ['inputs', 'labels', 'paths']
+
+    def __init__(self, inputs, labels=None, paths=None):
+        self.inputs = inputs
+        self.labels = labels
+        self.paths = paths
+
+    def __iter__(self):
+        yield self.inputs
+        yield self.labels if self.labels is not None else self.paths
+
+    def __len__(self):
+        return self.inputs.size(0)
+
+    def pin_memory(self):
+        if self.inputs.is_pinned() or not torch.cuda.is_available():
+            return self
+        pool = _pinned_pool(self.inputs.shape[1:], self.inputs.size(0), self.inputs.dtype)
+        buffer = pool.get()
+        buffer.copy_(self.inputs)
+        labels = self.labels.pin_memory() if self.labels is not None else None
+        return EEGBatch(buffer, labels, self.paths)
+
+
+class BufferedCollate:
+    """
+    Writes samples directly into one batch buffer instead of stacking them.
+    In the main process (num_workers=0) the buffer comes from a recycled, optionally pinned pool. In DataLoader
+    workers it is allocated in shared memory, so sending it to the main process needs no further copy.
+    """
+    def __init__(self, sample_shape=None, batch_size=32, dtype=torch.float64, pin_memory=False, pool_size=4):
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.pin_memory = pin_memory
+        self.pool_size = pool_size
+        self.pools = {}
+        if sample_shape is not None:
+            self._pool(tuple(sample_shape), dtype).get()
+
+    def _pool(self, sample_shape, dtype):
+        key = (sample_shape, dtype)
+        if key not in self.pools:
+            self.pools[key] = BatchBufferPool(sample_shape, self.batch_size, dtype, self.pin_memory, self.pool_size)
+        return self.pools[key]
+
+    def _buffer(self, sample_shape, dtype, n):
+        if get_worker_info() is not None:
+            return torch.empty((n, *sample_shape), dtype=dtype).share_memory_()
+        return self._pool(sample_shape, dtype).get(n)
+
+    def __getstate__(self):
+        # Pools are per process and never sent to workers
+        state = self.__dict__.copy()
+        state['pools'] = {}
+        return state
+
+    def __call__(self, batch):
+        with_meta = isinstance(batch[0], tuple)
+        xs = [item[0] for item in batch] if with_meta else batch
+        sample_shape = tuple(xs[0].shape)
+        dtype = xs[0].dtype if isinstance(xs[0], torch.Tensor) else self.dtype
+
+        inputs = self._buffer(sample_shape, dtype, len(xs))
+        for i, x in enumerate(xs):
+            inputs[i].copy_(x if isinstance(x, torch.Tensor) else torch.as_tensor(x))
+
+        if not with_meta:
+            return inputs
+
+        meta = [item[1] for item in batch]
+        if isinstance(meta[0], numbers.Integral):
+            return EEGBatch(inputs, labels=torch.from_numpy(np.asarray(meta, dtype=np.int64)))
+        if isinstance(meta[0], numbers.Number):
+            return EEGBatch(inputs, labels=torch.from_numpy(np.asarray(meta)))
+        if isinstance(meta[0], str):
+            return EEGBatch(inputs, labels=np.array(meta))
+        return EEGBatch(inputs, paths=np.array([list(paths) for paths in meta], dtype=str))
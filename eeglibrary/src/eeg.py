@@ -1,13 +1,68 @@
 import copy
 import pickle
 import numpy as np
-import scipy
-from tqdm import tqdm
 from collections import OrderedDict
-from joblib import Parallel, delayed
 
 
 FILE_FORMAT = ['.mat', '.pkl']
+# Channel sets by name. The CHB-MIT models use the first 22 bipolar channels.
+MONTAGES = {
+    'chbmit': ['FP1-F7', 'F7-T7', 'T7-P7', 'P7-O1', 'FP1-F3', 'F3-C3', 'C3-P3', 'P3-O1', 'FP2-F4', 'F4-C4', 'C4-P4',
+               'P4-O2', 'FP2-F8', 'F8-T8', 'T8-P8', 'P8-O2', 'FZ-CZ', 'CZ-PZ', 'P7-T7', 'T7-FT9', 'FT9-FT10',
+               'FT10-T8'],
+}
+
+
+def _channel_name(channel):
+    # Channel names from .mat files come as nested numpy arrays
+    while isinstance(channel, np.ndarray):
+        channel = channel.ravel()[0]
+    return str(channel)
+
+
+def select_channels(channel_list, channels=None) -> list:
+    """
+    Indices of channels to load.
+    channels: None (all), int (first n channels), montage name in MONTAGES, or a list of channel names or indices
+    """
+    if channels is None:
+        return list(range(len(channel_list)))
+    if isinstance(channels, int):
+        return list(range(min(channels, len(channel_list))))
+    if isinstance(channels, str):
+        channels = MONTAGES[channels]
+
+    names = [_channel_name(c).upper() for c in channel_list]
+    indices = []
+    for channel in channels:
+        if isinstance(channel, (int, np.integer)):
+            indices.append(int(channel))
+        elif str(channel).upper() in names:
+            indices.append(names.index(str(channel).upper()))
+        else:
+            raise KeyError(f'Channel {channel} is not in {names}')
+    return indices
+
+
+def parse_channels(channels):
+    # Channel selection given as str from command line arguments
+    if not isinstance(channels, str):
+        return channels
+    if channels.isdigit():
+        return int(channels)
+    if channels in MONTAGES:
+        return channels
+    return channels.split(',')
+
+
+def sample_slice(n_samples, sample_range=None) -> slice:
+    # sample_range: (start, stop) in samples, stop=None means the end of the recording
+    if sample_range is None:
+        return slice(0, n_samples)
+    start, stop = sample_range
+    stop = n_samples if stop is None else min(stop, n_samples)
+    assert 0 <= start < stop, f'Invalid sample range {sample_range}'
+    return slice(int(start), int(stop))
 
 
 class EEG:
@@ -39,33 +94,54 @@ class EEG:
         # print('Data sequense: \t {}'.format(data['sequence'][0][0]))
 
     @classmethod
-    def load_pkl(cls, file_path):
+    def load_pkl(cls, file_path, channels=None, sample_range=None):
         with open(file_path, mode='rb') as f:
             eeg_ = pickle.load(f)
+        if not isinstance(eeg_, EEG):
+            # Compact window written by split_and_save(compact=True), metadata is in its recording's .meta.pkl
+            from eeglibrary.src.window import resolve_window
+            eeg_ = resolve_window(eeg_, file_path)
+        if channels is not None or sample_range is not None:
+            eeg_.select(channels, sample_range)
         return eeg_
 
     @classmethod
-    def from_edf(cls, edf):
-        n_channels = edf.signals_in_file
-        signals = np.zeros((n_channels, edf.getNSamples()[0]))
-
-        for i in tqdm(range(n_channels)):
+    def from_edf(cls, edf, channels=None, sample_range=None):
+        # Only selected channels and samples are read from the file
+        from tqdm import tqdm
+        all_channels = edf.getSignalLabels()
+        indices = select_channels(all_channels, channels)
+        samples = sample_slice(edf.getNSamples()[0], sample_range)
+        signals = np.zeros((len(indices), samples.stop - samples.start))
+
+        for row, i in enumerate(tqdm(indices)):
             try:
-                signals[i, :] = edf.readSignal(i)
+                signals[row, :] = edf.readSignal(i, start=samples.start, n=samples.stop - samples.start)
             except ValueError as e:
-                np.delete(signals, i, 0)
+                np.delete(signals, row, 0)
 
         assert not np.isnan(signals).any()
 
-        channel_list = edf.getSignalLabels()
-        len_sec = edf.getFileDuration()
+        channel_list = [all_channels[i] for i in indices]
         sr = edf.getSampleFrequencies()[0]
+        len_sec = edf.getFileDuration() if sample_range is None else signals.shape[1] / sr
 
         edf._close()
         del edf
 
         return EEG(signals, channel_list, len_sec, sr)
 
+    def select(self, channels=None, sample_range=None):
+        # Keeps only selected channels and samples. The copy lets the rest of the recording be freed
+        indices = select_channels(self.channel_list, channels)
+        samples = sample_slice(self.values.shape[1], sample_range)
+        if indices != list(range(len(self.channel_list))) or samples != slice(0, self.values.shape[1]):
+            self.values = self.values[indices, samples.start:samples.stop]
+            self.channel_list = [self.channel_list[i] for i in indices]
+        if sample_range is not None:
+            self.len_sec = self.values.shape[1] / self.sr
+        return self
+
     def __repr__(self):
         self.info()
         return ""
@@ -90,21 +166,29 @@ class EEG:
         return int(n_eeg), window_stride, padding
 
     def split_and_save(self, window_size=0.5, window_stride='same', padding='same', n_jobs=-1, save_dir='',
-                       suffix='') -> list:
+                       suffix='', compact=False) -> list:
+        """
+        compact: Save windows as EEGWindow, which holds only samples and offsets. Channels, sr and header are saved
+                 once in recording{suffix}.meta.pkl of save_dir. EEG.load_pkl reads both kinds of files.
+        """
         assert float(window_size) != 0.0, 'window_size must be over 0.'
 
         def split_(j):
             start_index = int(j * self.sr * window_stride)
-            eeg = EEG(None, self.channel_list, self.len_sec, self.sr, self.header)
-            eeg.values = self.values[:, start_index:start_index + duration]
-            assert eeg.values.shape[1] == duration
-            assert not np.isnan(np.sum(eeg.values))
-            eeg.len_sec = window_size
+            values = self.values[:, start_index:start_index + duration]
+            assert values.shape[1] == duration
+            if compact:
+                eeg = EEGWindow(values, meta_name(suffix), start_index, start_index + duration)
+            else:
+                eeg = EEG(values, self.channel_list, window_size, self.sr, self.header)
             filename = f'{start_index}_{start_index + duration}{suffix}.pkl'
             eeg.to_pkl(f'{save_dir}/{filename}')
             return f'{save_dir}/{filename}'
 
         n_eeg, window_stride, padding = self._validate_values(window_size, window_stride, padding)
+        if compact:
+            from eeglibrary.src.window import EEGWindow, RecordingMeta, meta_name, meta_path, save_recording_meta
+            save_recording_meta(RecordingMeta.from_eeg(self), meta_path(save_dir, suffix))
 
         # add padding
         n_channel = len(self.channel_list)
@@ -118,19 +202,27 @@ class EEG:
         if n_jobs == 1:
             path_list = [split_(i) for i in range(n_eeg)]
         else:
-            path_list = Parallel(n_jobs=n_jobs, verbose=0)([delayed(split_)(i) for i in range(n_eeg)])
+            from joblib import Parallel, delayed
+            from eeglibrary.src.resources import resolve_n_jobs
+            path_list = Parallel(n_jobs=resolve_n_jobs(n_jobs), verbose=0)([delayed(split_)(i) for i in range(n_eeg)])
 
         return path_list
 
-    def split(self, window_size=0.5, window_stride='same', padding='same', n_jobs=-1) -> list:
+    def split(self, window_size=0.5, window_stride='same', padding='same', n_jobs=-1, compact=False) -> list:
+        """
+        compact: Return a WindowTable instead of a list of EEG. It stores only offsets of windows and makes an EEG
+                 per access, so millions of windows fit in memory.
+        """
         assert float(window_size) != 0.0, 'window_size must be over 0.'
+        if compact:
+            from eeglibrary.src.window import WindowTable
+            return WindowTable.from_eeg(self, window_size, window_stride, padding)
 
         def split_(j):
             start_index = int(j * self.sr * window_stride)
             eeg = EEG(None, self.channel_list, self.len_sec, self.sr, self.header)
             eeg.values = self.values[:, start_index:start_index + duration]
             assert eeg.values.shape[1] == duration
-            assert not np.isnan(np.sum(eeg.values))
             eeg.len_sec = window_size
             return eeg
 
@@ -148,18 +240,22 @@ class EEG:
         if n_jobs == 1:
             splitted_eegs = [split_(i) for i in range(n_eeg)]
         else:
-            splitted_eegs = Parallel(n_jobs=n_jobs, verbose=1)([delayed(split_)(i) for i in range(n_eeg)])
+            from joblib import Parallel, delayed
+            from eeglibrary.src.resources import resolve_n_jobs
+            splitted_eegs = Parallel(n_jobs=resolve_n_jobs(n_jobs), verbose=1)(
+                [delayed(split_)(i) for i in range(n_eeg)])
 
         return splitted_eegs
 
+    def scan_quality(self, window_size=0.5, window_stride='same', padding='same'):
+        # Bad window flags in the same order as split() and split_and_save(). See quality.scan_windows
+        from eeglibrary.src.quality import scan_eeg
+        return scan_eeg(self, window_size, window_stride, padding)
+
     def resample(self, n_resample) -> np.array([]):
-        resampled = np.zeros((len(self.channel_list), int(n_resample * self.len_sec)))
-        for i in range(len(self.channel_list)):
-            try:
-                resampled[i, :] = scipy.signal.resample(self.values[i], int(n_resample * self.len_sec))
-            except ValueError as e:
-                exit(1)
-        return resampled
+        # Fourier resampling of all channels at once, same as scipy.signal.resample per channel
+        from eeglibrary.src.spectral import Spectrum
+        return Spectrum(self.values, self.sr).resample(int(n_resample * self.len_sec)).values
 
 
 if __name__ == '__main__':
@@ -1,4 +1,9 @@
 from ml.src.dataloader import WrapperDataLoader, make_weights_for_balanced_classes, WeightedRandomSampler
+from eeglibrary.src.collate import BufferedCollate
+from eeglibrary.src.profiling import ProfiledCollate
+from eeglibrary.src.resources import WorkerInit
+from eeglibrary.src.sampler import LocalityWeightedSampler, recording_blocks
+from eeglibrary.src.sequence import BucketBatchSampler, PackedCollate
 import torch
 
 
@@ -24,10 +29,22 @@ class EEGDataLoader(WrapperDataLoader):
 def set_dataloader(dataset, phase, cfg, shuffle=True):
     if isinstance(cfg['sample_balance'], str):
         cfg['sample_balance'] = [1.0] * len(cfg['class_names'])
+    if getattr(dataset, 'variable_length', False):
+        return set_sequence_dataloader(dataset, phase, cfg)
+    # Samples are written into one preallocated batch buffer. Without workers the buffer is already pinned
+    pin_in_collate = cfg['n_jobs'] == 0
+    collate_fn = BufferedCollate(dataset.processed_input_size if dataset.model_type != 'rnn' else None,
+                                 cfg['batch_size'], pin_memory=pin_in_collate)
+    pin_memory = not pin_in_collate
+    if getattr(dataset, 'profiler', None) and dataset.profiler.enabled:
+        collate_fn = ProfiledCollate(collate_fn, dataset.profiler)
+    # Each worker gets worker_threads BLAS/FFT/torch threads instead of all cores
+    worker_init_fn = WorkerInit(cfg.get('worker_threads', 1)) if cfg['n_jobs'] > 0 else None
     if phase in ['test', 'infer', 'retrain_test']:
         # TODO batch normalization をeval()してdrop_lastしなくてよいようにする。
         dataloader = EEGDataLoader(model_type=cfg['model_type'], dataset=dataset, batch_size=cfg['batch_size'],
-                                   num_workers=cfg['n_jobs'], pin_memory=True, sampler=None, shuffle=False)
+                                   num_workers=cfg['n_jobs'], pin_memory=pin_memory, sampler=None, shuffle=False,
+                                   collate_fn=collate_fn, worker_init_fn=worker_init_fn)
     else:
         if sum(cfg['sample_balance']) != 0.0:
             if cfg['task_type'] == 'classify' or cfg['regress_thresh'] != 0.0:
@@ -35,12 +52,36 @@ def set_dataloader(dataset, phase, cfg, shuffle=True):
             else:
                 weights = [torch.Tensor([1.0])] * len(dataset.get_labels())
             print(len(dataset))
-            sampler = WeightedRandomSampler(weights, int(len(dataset) * cfg['epoch_rate']))
+            if cfg.get('locality', 0.0) > 0.0:
+                # Reads stay inside a recording block for a while, so page cache and feature cache get hits
+                sampler = LocalityWeightedSampler(weights, int(len(dataset) * cfg['epoch_rate']),
+                                                  recording_blocks(dataset.path_list, cfg.get('block_size', 0)),
+                                                  cfg['locality'], seed=cfg.get('seed', 0))
+            else:
+                sampler = WeightedRandomSampler(weights, int(len(dataset) * cfg['epoch_rate']))
             shuffle = False
         else:
             sampler = None
         dataloader = EEGDataLoader(cfg['model_type'], dataset=dataset, batch_size=cfg['batch_size'],
-                                   num_workers=cfg['n_jobs'], pin_memory=True, sampler=sampler, drop_last=True,
-                                   shuffle=shuffle)
+                                   num_workers=cfg['n_jobs'], pin_memory=pin_memory, sampler=sampler, drop_last=True,
+                                   shuffle=shuffle, collate_fn=collate_fn, worker_init_fn=worker_init_fn)
 
     return dataloader
+
+
+def set_sequence_dataloader(dataset, phase, cfg):
+    # Variable-length items are bucketed by length and packed, so RNNs never run on padding
+    worker_init_fn = WorkerInit(cfg.get('worker_threads', 1)) if cfg['n_jobs'] > 0 else None
+    if phase in ['test', 'infer', 'retrain_test']:
+        return EEGDataLoader(cfg['model_type'], dataset=dataset, batch_size=cfg['batch_size'],
+                             num_workers=cfg['n_jobs'], pin_memory=True, shuffle=False, collate_fn=PackedCollate(),
+                             worker_init_fn=worker_init_fn)
+
+    weights = None
+    if sum(cfg['sample_balance']) != 0.0 and (cfg['task_type'] == 'classify' or cfg['regress_thresh'] != 0.0):
+        weights = make_weights_for_balanced_classes(dataset.get_labels(), cfg['sample_balance'])
+    batch_sampler = BucketBatchSampler(dataset.path_list.lengths(), cfg['batch_size'], weights,
+                                       int(len(dataset) * cfg['epoch_rate']), cfg.get('bucket_pool', 50),
+                                       seed=cfg.get('seed', 0))
+    return EEGDataLoader(cfg['model_type'], dataset=dataset, batch_sampler=batch_sampler, num_workers=cfg['n_jobs'],
+                         pin_memory=True, collate_fn=PackedCollate(), worker_init_fn=worker_init_fn)
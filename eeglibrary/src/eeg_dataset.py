@@ -1,8 +1,15 @@
+import hashlib
+import json
 import numpy as np
 from pathlib import Path
 from eeglibrary.src import EEG
+from eeglibrary.src.eeg import parse_channels
 from eeglibrary.src.eeg_parser import parse_eeg
+from eeglibrary.src.feature_cache import FeatureCache
+from eeglibrary.src.path_table import PathTable, load_manifest_bounds, manifest_bounds_path
 from eeglibrary.src.preprocessor import EEGPreprocessor
+from eeglibrary.src.profiling import MemoryProfiler
+from eeglibrary.src.quality import load_quality_mask, quality_mask_path, scan_manifest
 from ml.src.dataset import ManifestDataSet
 import torch
 
@@ -20,41 +27,117 @@ class EEGDataSet(ManifestDataSet):
         super(EEGDataSet, self).__init__(manifest_path, data_conf, load_func=load_func, label_func=label_func,
                                          phase=phase)
         self.preprocessor = EEGPreprocessor(data_conf, phase, data_conf['to_1d'], scaling_axis=None)
+        # Channels not used by the model are never loaded. chbmit-cnn and bonn-rnn use the first 22 channels
+        self.channels = parse_channels(data_conf.get('channels'))
+        if self.channels is None and data_conf.get('reproduce') in ['chbmit-cnn', 'bonn-rnn']:
+            self.channels = 22
         # self.suffix = self.path_list[0][-4:]
-        self.path_list = self.pack_paths(self.path_df, data_conf['duration'], data_conf['n_use_eeg'])
+        # Windows flagged by the quality scan are left out of training here, not discovered in __getitem__.
+        # Validation and test keep every window, so the scan never changes what a model is evaluated on
+        use_quality = phase == 'train' and data_conf.get('quality_filter', True) and isinstance(manifest_path, str)
+        # Variable-length items: runs of up to n_use_eeg consecutive windows, fed to RNNs as packed sequences
+        self.variable_length = data_conf.get('variable_length', False)
+        self.min_n_use_eeg = data_conf.get('min_n_use_eeg', 1)
+        # path_list is a PathTable of flat arrays, so forked workers do not copy it. The DataFrame is not needed anymore
+        table_dir = self._table_dir(manifest_path, data_conf, label_func, use_quality)
+        if table_dir and PathTable.exists(table_dir) and self._is_newer(table_dir, manifest_path):
+            self.path_list = PathTable.load(table_dir)
+        else:
+            quality_mask = load_quality_mask(manifest_path) if use_quality else None
+            if use_quality and quality_mask is None:
+                # Manifests of split_and_save, arrange_paths or concat_manifests may have no mask. Unscanned windows
+                # could be singular, so they are scanned once and the mask is saved next to the manifest
+                quality_mask = scan_manifest(manifest_path)
+            if quality_mask is not None:
+                print(f'{(~quality_mask).sum()} of {len(quality_mask)} windows of {manifest_path} excluded by the '
+                      f'quality scan')
+            bounds = load_manifest_bounds(manifest_path) if isinstance(manifest_path, str) else None
+            self.path_list = self.pack_paths(self.path_df, data_conf['duration'], data_conf['n_use_eeg'], quality_mask,
+                                             bounds)
+            if table_dir:
+                self.path_list.save(table_dir)
+                self.path_list = PathTable.load(table_dir)
+        self.path_df = None
         self.return_path = return_path
         self.model_type = data_conf['model_type']
         self.processed_input_size = self.get_processed_size()
         self.batch_size = data_conf['batch_size']
         self.cache = data_conf['cache']
         self.cached_idx = set()
+        # Shared on-disk cache keyed by preprocessing config, reused across processes and runs
+        self.feature_cache = FeatureCache(data_conf['cache_dir'], data_conf) if data_conf.get('cache_dir') else None
+        self.profiler = MemoryProfiler(data_conf.get('memory_profile_dir'), role='worker')
         self.get_processed_size(phase=phase, info=True)
 
-    def __getitem__(self, idx):
+    @staticmethod
+    def _table_dir(manifest_path, data_conf, label_func=None, use_quality=False):
+        """
+        Memory mapped path tables are kept under data_conf['path_table_dir'], one per manifest, packing, labels and
+        use of the quality mask.
+        Manifests are identified by their resolved path, since manifests of different patients or deltas share names.
+        """
+        if not data_conf.get('path_table_dir') or not isinstance(manifest_path, str):
+            return None
+        label_func_name = f"{getattr(label_func, '__module__', '')}.{getattr(label_func, '__qualname__', label_func)}"
+        setup = dict(manifest=str(Path(manifest_path).resolve()), duration=data_conf['duration'],
+                     n_use_eeg=data_conf['n_use_eeg'], labels=data_conf.get('labels'), label_func=label_func_name,
+                     quality=bool(use_quality))
+        if data_conf.get('variable_length'):
+            setup['min_n_use_eeg'] = data_conf.get('min_n_use_eeg', 1)
+        key = hashlib.md5(json.dumps(setup, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return Path(data_conf['path_table_dir']) / f'{Path(manifest_path).stem}_{key}'
+
+    @staticmethod
+    def _is_newer(table_dir, manifest_path):
+        sources = [Path(manifest_path), quality_mask_path(manifest_path), manifest_bounds_path(manifest_path)]
+        table_time = (Path(table_dir) / 'items.npy').stat().st_mtime
+        return all(table_time >= source.stat().st_mtime for source in sources if source.is_file())
+
+    def __len__(self):
+        return len(self.path_list)
+
+    def load_features(self, idx):
+        # Preprocessed features before normalization, from the cache if possible
         eeg_paths, label = self.path_list[idx]
+        if self.variable_length:
+            # sequence x window features. Windows are preprocessed and cached one by one
+            return torch.stack([self._features([path], label) for path in eeg_paths])
+        return self._features(eeg_paths, label, idx)
 
-        if self.cache and idx in self.cached_idx:
+    def _features(self, eeg_paths, label, idx=None):
+        x = None
+        if self.feature_cache:
+            x = self.feature_cache.load(list(eeg_paths))
+        elif self.cache and idx is not None and idx in self.cached_idx:
             try:
                 x = torch.from_numpy(np.load(eeg_paths[0].replace('pkl', 'npy')))
             except ValueError as e:
                 print(e)
 
-        if (not self.cache) or ('x' not in locals().keys()):
-            eeg_ = parse_eeg(eeg_paths)
+        if x is None:
+            with self.profiler.stage('parse_eeg'):
+                eeg_ = parse_eeg(list(eeg_paths), self.channels)
             # import numpy as np
             # eeg.values = np.nan_to_num(eeg.values)
-            try:
+            with self.profiler.stage('preprocess'):
                 x = self.preprocessor.preprocess(eeg_, label)
-            except np.linalg.LinAlgError as e:
-                print(e)
-                return self.__getitem__(idx + 1)
 
-            x = self._reshape_input(x)
-
-            if self.cache:
+            if self.feature_cache:
+                self.feature_cache.save(list(eeg_paths), x)
+            elif self.cache and idx is not None:
                 np.save(eeg_paths[0].replace('pkl', 'npy'), x.numpy())
                 self.cached_idx.add(idx)
 
+        return x
+
+    def __getitem__(self, idx):
+        eeg_paths, label = self.path_list[idx]
+        features = self.load_features(idx)
+        if self.variable_length:
+            x = torch.stack([self.preprocessor.normalize(window) for window in features]).reshape(len(features), -1)
+        else:
+            x = self._reshape_input(self.preprocessor.normalize(features))
+
         if self.labels:
             return x, label
         elif self.return_path:
@@ -67,38 +150,66 @@ class EEGDataSet(ManifestDataSet):
             x = x.reshape(self.processed_input_size[0], -1, self.processed_input_size[2])
         return x
 
-    def pack_paths(self, path_df, duration, n_use_eeg):
+    def pack_paths(self, path_df, duration, n_use_eeg, quality_mask=None, bounds=None):
+        # bounds: rows where the sources of a concatenated manifest start, see concat_manifests. Groups never cross
+        # them and start at every source, so they are the groups of the source manifests and share their features
         one_eeg = EEG.load_pkl(path_df.iloc[0, 0])
         len_sec = one_eeg.len_sec
         if not n_use_eeg:
             n_use_eeg = int(duration / len_sec)
             assert n_use_eeg == duration / len_sec, f'Duration must be common multiple of {len_sec}'
 
-        label_list = self.path_df.apply(self.label_func, axis=1)
-
-        if n_use_eeg == 1:
-            return [([p], label) for p, label in zip(path_df.values[:, 0], label_list)]
+        label_list = np.asarray(path_df.apply(self.label_func, axis=1).tolist())
+        if quality_mask is None:
+            quality_mask = np.ones(len(path_df), dtype=bool)
+        assert len(quality_mask) == len(path_df), 'Quality mask and manifest have different length'
+        if bounds is None:
+            bounds = np.array([0, len(path_df)])
+        assert bounds[-1] == len(path_df), 'Manifest bounds and manifest have different length'
+        paths = path_df.iloc[:, 0].tolist()
 
-        packed_path_label_list = []
-        for i in range(0, len(path_df), n_use_eeg):
-            if i + n_use_eeg >= len(path_df):
-                continue
-            paths, labels = path_df.iloc[i:i + n_use_eeg, 0], label_list[i:i + n_use_eeg]
-            assert len(paths) == n_use_eeg
+        if self.variable_length:
+            items = self._variable_items(paths, label_list, quality_mask, n_use_eeg, self.min_n_use_eeg, bounds)
+            return PathTable.from_paths(paths, label_list[[item[0] for item in items]], items)
 
+        if n_use_eeg == 1:
+            items = np.flatnonzero(quality_mask)[:, None]
+        else:
+            # Groups of n_use_eeg consecutive windows. Groups mixing labels or with a bad window are excluded
+            starts = [np.arange(begin, end - n_use_eeg + 1, n_use_eeg) for begin, end in zip(bounds[:-1], bounds[1:])]
+            items = np.concatenate(starts).astype(np.int64)[:, None] + np.arange(n_use_eeg)
+            same_label = (label_list[items] == label_list[items[:, :1]]).all(axis=1)
             # TODO ソフトラベルを作るのもあり。
-            if len(set(labels)) != 1:  # 結合したときにラベルが異なるものがある場合は、データから除外する
-                continue
+            items = items[same_label & quality_mask[items].all(axis=1)]
 
-            packed_path_label_list.append((paths, labels[0]))
+        return PathTable.from_paths(paths, label_list[items[:, 0]], items)
 
-        return packed_path_label_list
+    @staticmethod
+    def _variable_items(paths, label_list, quality_mask, max_len, min_len=1, bounds=None) -> list:
+        """
+        Runs of consecutive good windows of one recording and one label, cut into items of at most max_len windows.
+        Items shorter than min_len are dropped. Returns a list of window index arrays.
+        """
+        recordings = np.asarray([str(Path(path).parent) for path in paths])
+        breaks = np.ones(len(paths), dtype=bool)
+        breaks[1:] = (recordings[1:] != recordings[:-1]) | (label_list[1:] != label_list[:-1]) \
+            | (quality_mask[1:] != quality_mask[:-1])
+        if bounds is not None:
+            breaks[bounds[:-1][bounds[:-1] < len(paths)]] = True
+        run_ids = np.cumsum(breaks) - 1
+        positions = np.arange(len(paths)) - np.flatnonzero(breaks)[run_ids]
+        # Item boundaries: a new run, or every max_len windows inside a run
+        starts = np.flatnonzero(breaks | (positions % max_len == 0))
+        items = np.split(np.arange(len(paths)), starts[1:])
+        return [item for item in items if quality_mask[item[0]] and len(item) >= min_len]
 
     def get_labels(self):
-        return [label for paths, label in self.path_list]
+        return self.path_list.get_labels()
 
     def get_processed_size(self, phase='train', info=False):
-        eeg = parse_eeg(self.path_list[0][0])
+        # Variable-length items are sequences of single windows, so the size is the one of a window
+        paths = list(self.path_list[0][0])
+        eeg = parse_eeg(paths[:1] if self.variable_length else paths, self.channels)
         x = self.preprocessor.preprocess(eeg)
         if info:
             print(f'{phase} preprocessed feature info.')
@@ -108,6 +219,10 @@ class EEGDataSet(ManifestDataSet):
             print(f'std: {x.std()}')
         return x.size()
 
+    def get_window_feature_size(self):
+        # Features of one window flattened, the input size of sequence models
+        return int(np.prod(self.processed_input_size))
+
     def get_feature_size(self):
         if self.model_type == 'rnn':
             return self.get_processed_size()[0]
@@ -1,17 +1,123 @@
+from pathlib import Path
+
+import numpy as np
 from eeglibrary.src.eeg import EEG
-from scipy.io import loadmat
 
 
-def from_mat(file_path, mat_col) -> EEG:
-    data = {}
+def is_mat_v73(file_path) -> bool:
+    # MATLAB v7.3 files are HDF5 files with a 512 byte text header which starts with 'MATLAB 7.3'
+    with open(file_path, mode='rb') as f:
+        return f.read(128).startswith(b'MATLAB 7.3')
+
+
+class H5Values:
+    """
+    Lazy channel x time view of a numeric matrix in a MATLAB v7.3 file. MATLAB stores matrices column major,
+    so the HDF5 dataset is time x channel. Only the sliced part is read from disk.
+    """
+    def __init__(self, file_path, dataset_name):
+        self.file_path = str(file_path)
+        self.dataset_name = dataset_name
+        self._file = None
+        self._dataset = None
+
+    @property
+    def dataset(self):
+        if self._dataset is None:
+            import h5py
+            self._file = h5py.File(self.file_path, mode='r')
+            self._dataset = self._file[self.dataset_name]
+        return self._dataset
+
+    def close(self):
+        # The file is opened again on the next access
+        if self._file is not None:
+            self._file.close()
+        self._file, self._dataset = None, None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def shape(self):
+        return self.dataset.shape[::-1]
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+
+        if isinstance(rows, (list, np.ndarray)):
+            # h5py needs increasing indices for fancy indexing
+            rows = np.asarray(rows)
+            unique, inverse = np.unique(rows, return_inverse=True)
+            return self.dataset[cols, list(unique)].T[inverse]
+        return self.dataset[cols, rows].T
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.dataset[()].T
+        return values.astype(dtype) if dtype else values
+
+    def __getstate__(self):
+        # h5py objects are not picklable, so the file is opened again after unpickling
+        return {'file_path': self.file_path, 'dataset_name': self.dataset_name, '_file': None, '_dataset': None}
+
+
+def _h5_scalar(group, key):
+    return np.asarray(group[key]).ravel()[0]
+
+
+def _h5_channels(h5_file, group):
+    # Cell array of char arrays: each item is a reference to an uint16 array of characters
+    refs = np.asarray(group['channels']).ravel()
+    return [''.join(map(chr, np.asarray(h5_file[ref]).ravel())) for ref in refs]
+
+
+def from_mat_v73(file_path, mat_col='', channels=None, sample_range=None) -> EEG:
+    import h5py
+
+    with h5py.File(file_path, mode='r') as h5_file:
+        value_col = mat_col if mat_col in h5_file else detect_mat_value_col(h5_file)
+        group = h5_file[value_col]
+        channel_list = _h5_channels(h5_file, group)
+        len_sec = _h5_scalar(group, 'data_length_sec')
+        sr = _h5_scalar(group, 'sampling_frequency')
+
+    eeg = EEG(values=H5Values(file_path, f'{value_col}/data'),
+              channel_list=channel_list,
+              len_sec=len_sec,
+              sr=sr,
+              header='MATLAB 7.3')
+
+    if channels is not None or sample_range is not None:
+        eeg.select(channels, sample_range)
+    return eeg
+
+
+def from_mat(file_path, mat_col, channels=None, sample_range=None) -> EEG:
+    if is_mat_v73(file_path):
+        return from_mat_v73(file_path, mat_col, channels, sample_range)
+
+    from scipy.io import loadmat
     mat = loadmat(file_path)
     header = str(mat['__header__'])
 
     value_col = detect_mat_value_col(mat)
 
     try:
-        for i, key in enumerate(mat[value_col].dtype.names):
-            data[key] = mat[value_col][0][0][i]
+        struct = mat[value_col][0][0]
+        data = {key: struct[key] for key in mat[value_col].dtype.names}
     except KeyError as e:
         raise KeyError("eeg_file {} doesn't have info about 'interictal_segment_1', " +
                        "not implemented except this key.".format(value_col))
@@ -22,14 +128,49 @@ def from_mat(file_path, mat_col) -> EEG:
               sr=data['sampling_frequency'][0][0],
               header=header)
 
+    if channels is not None or sample_range is not None:
+        eeg.select(channels, sample_range)
     return eeg
 
 
 def detect_mat_value_col(mat):
     # TODO try exceptで必ず検出する
-    mat_col = [col for col in list(mat.keys()) if not col.startswith('_')][0]
+    mat_col = [col for col in list(mat.keys()) if not col.startswith('_') and not col.startswith('#')][0]
     return mat_col
 
 
+def _convert_mat(mat_path, out_path):
+    eeg = from_mat(str(mat_path), mat_col='')
+    eeg.values = np.asarray(eeg.values)
+    eeg.channel_list = [str(np.asarray(c).ravel()[0]) if isinstance(c, np.ndarray) else str(c)
+                        for c in eeg.channel_list]
+    out_path.parent.mkdir(exist_ok=True, parents=True)
+    eeg.to_pkl(str(out_path))
+    return str(out_path)
+
+
+def convert_mat_archive(mat_dir, out_dir, n_jobs=-1) -> list:
+    """
+    Converts every .mat file under mat_dir (v7.3 or older) to EEG pickles under out_dir, keeping the directory
+    layout. Pickles load without scipy's struct parsing and work with split_and_save and parse_eeg directly.
+    """
+    from joblib import Parallel, delayed
+
+    mat_paths = sorted(Path(mat_dir).glob('**/*.mat'))
+    out_paths = [Path(out_dir) / path.relative_to(mat_dir).with_suffix('.pkl') for path in mat_paths]
+    return Parallel(n_jobs=n_jobs, verbose=1)([delayed(_convert_mat)(mat_path, out_path)
+                                               for mat_path, out_path in zip(mat_paths, out_paths)])
+
+
 def from_eeg(file_path):
     raise NotImplementedError
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert .mat archive to EEG pickles')
+    parser.add_argument('--mat-dir', help='directory of .mat files', required=True)
+    parser.add_argument('--out-dir', help='directory to save converted files', required=True)
+    parser.add_argument('--n-jobs', default=-1, type=int, help='Number of processes')
+    args = parser.parse_args()
+    print(f'{len(convert_mat_archive(args.mat_dir, args.out_dir, args.n_jobs))} files converted.')
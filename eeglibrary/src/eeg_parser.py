@@ -3,26 +3,30 @@ import numpy as np
 from eeglibrary.src import eeg_loader
 
 
-def _load_eeg(eeg_path):
+def _load_eeg(eeg_path, channels=None, sample_range=None):
     if eeg_path[-4:] == '.pkl':
-        eeg_ = eeg.EEG.load_pkl(eeg_path)
+        eeg_ = eeg.EEG.load_pkl(eeg_path, channels, sample_range)
     else:
-        eeg_ = eeg_loader.from_mat(eeg_path, mat_col='')
+        eeg_ = eeg_loader.from_mat(eeg_path, mat_col='', channels=channels, sample_range=sample_range)
     return eeg_
 
 
-def _merge_eeg(paths):
-    eeg_ = _load_eeg(paths[0])
+def _merge_eeg(paths, channels=None):
+    eegs = [_load_eeg(path, channels) for path in paths]
+    eeg_ = eegs[0]
     if len(paths) != 1:
-        for path in paths[1:]:
-            eeg_.values = np.hstack((eeg_.values, _load_eeg(path).values))
+        eeg_.values = np.hstack([e.values for e in eegs])
 
     eeg_.len_sec = eeg_.len_sec * len(paths)
     return eeg_
 
 
-def parse_eeg(eeg_path) -> np.array:
+def parse_eeg(eeg_path, channels=None, sample_range=None) -> np.array:
+    """
+    channels: see eeg.select_channels. sample_range: (start, stop) samples of a single file
+    """
     if isinstance(eeg_path, list):
-        return _merge_eeg(eeg_path)
+        assert sample_range is None, 'sample_range is not supported for packed paths'
+        return _merge_eeg(eeg_path, channels)
     else:
-        return _load_eeg(eeg_path)
+        return _load_eeg(eeg_path, channels, sample_range)
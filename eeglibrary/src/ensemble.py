@@ -0,0 +1,113 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+VOTINGS = ['soft', 'hard']
+
+
+def parse_ensemble(ensemble) -> list:
+    # 'model_name:model_path,model_name:model_path' -> [(model_name, model_path), ...]
+    members = []
+    for member in ensemble.split(','):
+        model_name, model_path = member.split(':', 1)
+        members.append((model_name, model_path))
+    return members
+
+
+def load_model(args, class_names, eeg_conf, device):
+    # Model of args.model_name with weights of args.model_path. Returns (model, numpy)
+    from eeglibrary.src.quantize import is_quantized_path, load_quantized
+    from eeglibrary.utils import set_model
+
+    if is_quantized_path(args.model_path):
+        # int8 export of quantize.py, runs on CPU
+        return load_quantized(args.model_path), False
+    if args.model_name in ['kneighbor', 'knn']:
+        args.model_name = 'kneighbor'
+    numpy = 'nn' not in args.model_name
+    state = None if numpy else torch.load(args.model_path, map_location=device)
+    if args.model_name == 'window_rnn' and 'n_window_features' not in eeg_conf:
+        # The input size of a sequence model is stored in its first RNN layer
+        eeg_conf = dict(eeg_conf, n_window_features=state['rnn.weight_ih_l0'].size(1))
+    model = set_model(args, class_names, eeg_conf, device)
+    if numpy:
+        model.load_model_(args.model_path)
+    else:
+        model.load_state_dict(state)
+        model.eval()
+    return model, numpy
+
+
+class Ensemble:
+    """
+    Runs every member on the same preprocessed batch and combines their class probabilities.
+    Members are (model, numpy) pairs as returned by load_model, NN and sklearn-style models can be mixed.
+    voting: 'soft' averages probabilities, 'hard' counts the predicted classes of members.
+    With 2 classes, class 1 is predicted if its averaged probability (or vote share) is at least thresh.
+    Members run in parallel threads; torch and most sklearn/xgboost predictions release the GIL.
+    """
+    def __init__(self, members, n_classes, voting='soft', thresh=0.5, weights=None, n_threads=None):
+        assert voting in VOTINGS, f'voting must be one of {VOTINGS}'
+        self.members = members
+        self.n_classes = n_classes
+        self.voting = voting
+        self.thresh = thresh
+        weights = np.ones(len(members)) if weights is None else np.asarray(weights, dtype=float)
+        assert len(weights) == len(members), 'Number of weights must be same as number of members'
+        self.weights = weights / weights.sum()
+        self.executor = ThreadPoolExecutor(max_workers=n_threads or len(members)) if len(members) > 1 else None
+
+    @staticmethod
+    def _member_proba(model, numpy, inputs) -> np.ndarray:
+        if numpy:
+            inputs = inputs.cpu() if isinstance(inputs, torch.Tensor) else inputs
+            if hasattr(model, 'predict_proba'):
+                return np.asarray(model.predict_proba(inputs))
+            return np.asarray(model.predict(inputs))
+        # Grad mode is thread local, so it is disabled inside the member's thread
+        with torch.no_grad():
+            return torch.softmax(model(inputs), dim=1).cpu().numpy()
+
+    def member_probas(self, inputs) -> list:
+        if self.executor is None:
+            return [self._member_proba(model, numpy, inputs) for model, numpy in self.members]
+        futures = [self.executor.submit(self._member_proba, model, numpy, inputs) for model, numpy in self.members]
+        return [future.result() for future in futures]
+
+    def predict_proba(self, inputs) -> np.ndarray:
+        # batch x class
+        combined = np.zeros((len(inputs), self.n_classes))
+        for weight, proba in zip(self.weights, self.member_probas(inputs)):
+            if proba.ndim == 1:
+                # Members without predict_proba give labels
+                proba = np.eye(self.n_classes)[proba.astype(int)]
+            elif self.voting == 'hard':
+                proba = np.eye(self.n_classes)[proba.argmax(axis=1)]
+            combined += weight * proba
+        return combined
+
+    def predict(self, inputs) -> torch.Tensor:
+        proba = self.predict_proba(inputs)
+        if proba.shape[1] == 2:
+            preds = (proba[:, 1] >= self.thresh).astype(np.int64)
+        else:
+            preds = proba.argmax(axis=1)
+        device = inputs.device if isinstance(inputs, torch.Tensor) else 'cpu'
+        return torch.from_numpy(preds).to(device)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def set_ensemble(args, class_names, eeg_conf, device) -> Ensemble:
+    members = []
+    for model_name, model_path in parse_ensemble(args.ensemble):
+        member_args = copy.copy(args)
+        member_args.model_name, member_args.model_path = model_name, model_path
+        members.append(load_model(member_args, class_names, eeg_conf, device))
+
+    weights = list(map(float, args.ensemble_weights.split('-'))) if args.ensemble_weights else None
+    return Ensemble(members, len(class_names), args.voting, args.thresh, weights, args.ensemble_threads or None)
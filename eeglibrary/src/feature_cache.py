@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+
+
+# Keys of eeg_conf which change the output of EEGPreprocessor. Trials or folds sharing these values share features.
+PREPROCESS_KEYS = ['sample_rate', 'duration', 'n_use_eeg', 'n_features', 'to_1d', 'reproduce', 'window_size',
+                   'window_stride', 'window', 'model_type', 'channels', 'band_power', 'highpass', 'notch',
+                   'notch_width', 'filter_order', 'causal_filter']
+
+
+def preprocess_key(conf, keys=PREPROCESS_KEYS) -> str:
+    used = {key: conf[key] for key in keys if key in conf}
+    return hashlib.md5(json.dumps(used, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class FeatureCache:
+    """
+    Preprocessed features saved as .npy under cache_dir/<hash of preprocessing config>/.
+    Different processes (search trials, cross validation folds) can share the same directory, because
+    writes go to a temporary file and are moved into place with an atomic rename.
+    """
+    def __init__(self, cache_dir, conf):
+        self.cache_dir = Path(cache_dir) / preprocess_key(conf)
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+
+    def path(self, eeg_paths) -> Path:
+        if isinstance(eeg_paths, str):
+            eeg_paths = [eeg_paths]
+        name = hashlib.md5('|'.join(map(str, eeg_paths)).encode()).hexdigest()
+        return self.cache_dir / f'{name}.npy'
+
+    def __contains__(self, eeg_paths):
+        return self.path(eeg_paths).is_file()
+
+    def load(self, eeg_paths):
+        path = self.path(eeg_paths)
+        if not path.is_file():
+            return None
+        try:
+            return torch.from_numpy(np.load(path))
+        except ValueError as e:
+            print(e)
+            return None
+
+    def save(self, eeg_paths, x):
+        path = self.path(eeg_paths)
+        tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npy')
+        np.save(tmp_path, x.numpy() if isinstance(x, torch.Tensor) else x)
+        os.replace(tmp_path, path)
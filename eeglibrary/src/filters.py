@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+BTYPES = ['lowpass', 'highpass', 'bandpass', 'bandstop']
+
+
+@lru_cache(maxsize=256)
+def design_sos(btype, cutoff, fs, order=4) -> np.ndarray:
+    """
+    Butterworth filter as second-order sections, designed once per (btype, cutoff, fs, order).
+    cutoff: Hz, a float or a (low, high) tuple for bandpass and bandstop.
+    """
+    assert btype in BTYPES, f'btype must be one of {BTYPES}'
+    sos = signal.butter(order, cutoff, btype=btype, fs=fs, output='sos')
+    sos.setflags(write=False)
+    return sos
+
+
+class FilterBank:
+    """
+    Cascade of Butterworth filters applied to all channels (channel x time) in one call.
+    filters: list of (btype, cutoff, order). Designs are cached per sample rate, so one FilterBank serves any sr.
+    zero_phase: filter forward and backward (sosfiltfilt) for offline use, or causally (sosfilt).
+    """
+    def __init__(self, filters, zero_phase=True):
+        self.filters = [(btype, tuple(cutoff) if np.ndim(cutoff) else float(cutoff), order)
+                        for btype, cutoff, order in filters]
+        self.zero_phase = zero_phase
+
+    def __bool__(self):
+        return bool(self.filters)
+
+    def sos(self, fs) -> np.ndarray:
+        return np.vstack([design_sos(btype, cutoff, fs, order) for btype, cutoff, order in self.filters])
+
+    def apply(self, values, fs) -> np.ndarray:
+        if not self.filters:
+            return values
+        if self.zero_phase:
+            return signal.sosfiltfilt(self.sos(fs), values, axis=-1)
+        return signal.sosfilt(self.sos(fs), values, axis=-1)
+
+    def stream(self, fs):
+        return StreamingFilter(self.sos(fs))
+
+
+class StreamingFilter:
+    """
+    Causal filtering of a recording chunk by chunk. The filter state is carried from one chunk to the next, so the
+    concatenated output equals sosfilt over the whole recording. The state starts at the steady state of the first
+    sample of each channel, which avoids the step response at the start.
+    """
+    def __init__(self, sos):
+        self.sos = sos
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, chunk) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if self.zi is None:
+            # n_sections x channel x 2
+            self.zi = signal.sosfilt_zi(self.sos)[:, None, :] * chunk[:, :1][None, :, :]
+        out, self.zi = signal.sosfilt(self.sos, chunk, axis=-1, zi=self.zi)
+        return out
+
+
+def filter_bank_from_conf(eeg_conf) -> FilterBank:
+    # 'highpass' and 'notch' in Hz, 0 or None disables them. 'notch_width' is the whole stop band width in Hz
+    filters = []
+    order = eeg_conf.get('filter_order', 4)
+    if eeg_conf.get('highpass'):
+        filters.append(('highpass', eeg_conf['highpass'], order))
+    if eeg_conf.get('notch'):
+        half_width = eeg_conf.get('notch_width', 4.0) / 2
+        filters.append(('bandstop', (eeg_conf['notch'] - half_width, eeg_conf['notch'] + half_width), order))
+    return FilterBank(filters, zero_phase=not eeg_conf.get('causal_filter', False))
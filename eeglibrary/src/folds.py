@@ -0,0 +1,107 @@
+from pathlib import Path
+
+import pandas as pd
+from joblib import Parallel, delayed, parallel_backend
+
+from eeglibrary.src.ingest import PHASES
+from eeglibrary.src.resources import ResourcePlan, available_cores
+
+
+def patient_manifests(patient, splitted_dir='splitted') -> list:
+    # Same layout as arrange_paths(): splitted/{patient}/{phase}_manifest.csv
+    manifests = [Path(splitted_dir) / patient / f'{phase}_manifest.csv' for phase in PHASES]
+    return [str(manifest) for manifest in manifests if manifest.is_file()]
+
+
+def make_folds(patients, n_val_patients=1) -> list:
+    """
+    Leave-one-patient-out folds. Each patient is the test set once, the following n_val_patients patients
+    are used for validation and the rest for training.
+    """
+    assert len(patients) > n_val_patients + 1, 'Need more patients than validation patients + 1'
+    folds = []
+    for i, test_patient in enumerate(patients):
+        others = patients[i + 1:] + patients[:i]
+        folds.append(dict(name=test_patient, test=[test_patient], val=others[:n_val_patients],
+                          train=others[n_val_patients:]))
+    return folds
+
+
+def build_fold_manifests(fold, out_dir, splitted_dir='splitted') -> dict:
+    from eeglibrary.utils.utils import concat_manifests
+
+    manifests = {}
+    for phase in PHASES:
+        phase_manifests = [m for patient in fold[phase] for m in patient_manifests(patient, splitted_dir)]
+        assert phase_manifests, f"Fold {fold['name']}: no manifests of {fold[phase]} under {splitted_dir}"
+        manifests[phase] = str(concat_manifests(phase_manifests, f'{phase}_manifest.csv',
+                                                save_dir=Path(out_dir) / fold['name']))
+    return manifests
+
+
+def _prepare_patient(prepare_func, patient, manifests, n_threads):
+    # A plan of n_threads cores, so pools started inside (e.g. scan_manifest) stay within them too
+    with ResourcePlan(n_threads, n_workers=0).applied():
+        for manifest in manifests:
+            prepare_func(manifest)
+    return patient
+
+
+def _run_fold(fold_func, fold, n_threads):
+    with ResourcePlan(n_threads, n_workers=0).applied():
+        metrics = fold_func(fold)
+    return dict(fold=fold['name'], **metrics)
+
+
+class FoldOrchestrator:
+    """
+    Runs cross-patient folds concurrently.
+    prepare_func(manifest_path) fills the feature cache of one patient manifest, e.g. by iterating an EEGDataSet
+    with data_conf['cache_dir'] set. It runs once per patient, and every fold including that patient reads
+    the cached features afterwards. Fold manifests keep the bounds of the patient manifests (concat_manifests), so
+    groups of n_use_eeg windows are the same as in the patient manifests and never span two patients.
+    fold_func(fold) trains and evaluates one fold and returns a dict of metrics. fold has 'name', the patients of
+    each phase and '{phase}_manifest' paths.
+    """
+    def __init__(self, patients, fold_func, prepare_func=None, splitted_dir='splitted', out_dir='splitted/folds',
+                 n_val_patients=1, n_jobs=-1, n_threads=1):
+        self.patients = list(patients)
+        self.fold_func = fold_func
+        self.prepare_func = prepare_func
+        self.splitted_dir = splitted_dir
+        self.out_dir = out_dir
+        self.n_threads = n_threads
+        self.n_jobs = n_jobs if n_jobs > 0 else max(1, available_cores() // n_threads)
+        self.folds = make_folds(self.patients, n_val_patients)
+
+    def prepare(self):
+        if self.prepare_func is None:
+            return
+        with parallel_backend('loky', inner_max_num_threads=self.n_threads):
+            Parallel(n_jobs=self.n_jobs, verbose=0)(
+                [delayed(_prepare_patient)(self.prepare_func, patient, patient_manifests(patient, self.splitted_dir),
+                                           self.n_threads) for patient in self.patients])
+
+    def run(self, result_path=None) -> pd.DataFrame:
+        for fold in self.folds:
+            for phase, manifest in build_fold_manifests(fold, self.out_dir, self.splitted_dir).items():
+                fold[f'{phase}_manifest'] = manifest
+
+        self.prepare()
+
+        with parallel_backend('loky', inner_max_num_threads=self.n_threads):
+            results = Parallel(n_jobs=self.n_jobs, verbose=0)(
+                [delayed(_run_fold)(self.fold_func, fold, self.n_threads) for fold in self.folds])
+
+        result_df = aggregate_fold_metrics(results)
+        if result_path:
+            Path(result_path).parent.mkdir(exist_ok=True, parents=True)
+            result_df.to_csv(result_path)
+        return result_df
+
+
+def aggregate_fold_metrics(results) -> pd.DataFrame:
+    result_df = pd.DataFrame(results).set_index('fold')
+    numeric = result_df.select_dtypes('number')
+    summary = pd.DataFrame([numeric.mean(), numeric.std()], index=['mean', 'std'])
+    return pd.concat([result_df, summary], axis=0, sort=False)
@@ -0,0 +1,222 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from eeglibrary.src.feature_cache import preprocess_key
+from eeglibrary.src.ingest import PHASES, IngestPipeline, find_recordings, recording_name
+from eeglibrary.src.interval_index import WindowIndex
+from eeglibrary.src.quality import load_quality_mask, save_quality_mask
+from eeglibrary.src.stats import RunningStats
+
+JOURNAL_NAME = 'journal.jsonl'
+# Exists while append() changes the phase manifests, until the delta's journal line is written
+PENDING_NAME = 'append.pending'
+
+
+def _read_lines(path) -> list:
+    if not Path(path).is_file():
+        return []
+    with open(path) as f:
+        return [line for line in f if line.strip()]
+
+
+def _n_rows(manifest_path) -> int:
+    return len(_read_lines(manifest_path))
+
+
+def _quality_mask(manifest_path, n_rows) -> np.ndarray:
+    # Manifests without a mask have only good windows
+    mask = load_quality_mask(manifest_path)
+    return mask if mask is not None else np.ones(n_rows, dtype=bool)
+
+
+class ChangeJournal:
+    """
+    Append-only log of the deltas of an IncrementalStore, one JSON line per delta.
+    A delta exists only once its line is written, so a crash during ingestion leaves no half-visible delta.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def entries(self) -> list:
+        return [json.loads(line) for line in _read_lines(self.path)]
+
+    def append(self, entry):
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with open(self.path, mode='a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def recordings(self) -> set:
+        return {recording for entry in self.entries() for recording in entry['recordings']}
+
+    def rows(self, phase) -> int:
+        # Committed length of the phase manifest
+        entries = self.entries()
+        return entries[-1]['rows'].get(phase, 0) if entries else 0
+
+
+class IncrementalStore:
+    """
+    Output directory of IngestPipeline that grows by deltas instead of being rebuilt. Ingesting new recordings
+    - writes their windows under out_dir/<recording>/ as before
+    - writes the delta's own manifests and window index under out_dir/deltas/<delta>/
+    - appends the delta's rows to out_dir/{phase}_manifest.csv and extends the quality masks
+    - appends a journal line with the recordings and the committed manifest lengths
+    The phase manifests are changed only while a pending marker exists, so rows of a failed append are never taken
+    for a committed delta.
+    Windows, cached features (FeatureCache keys are window paths), index segments and stats partials of older deltas
+    are never rewritten. Datasets read the phase manifests, which always hold the union.
+    Recordings are identified by their path relative to data_dir without suffix (recording_name), which is also the
+    path of their window directory under out_dir.
+    """
+    def __init__(self, out_dir, window_size=0.5, window_stride='same', padding='same', channels=None, suffix='',
+                 label_func=None, n_jobs=-1, compact=False, ratios=(0.7, 0.15, 0.15), seed=0):
+        self.out_dir = Path(out_dir)
+        self.pipeline = IngestPipeline(out_dir, window_size, window_stride, padding, channels, suffix, label_func,
+                                       n_jobs, compact=compact)
+        self.ratios = ratios
+        self.seed = seed
+        self.journal = ChangeJournal(self.out_dir / JOURNAL_NAME)
+        self.pending_path = self.out_dir / PENDING_NAME
+        self.recover()
+
+    def manifest_path(self, phase, delta=None) -> Path:
+        return (self.delta_dir(delta) if delta else self.out_dir) / f'{phase}_manifest.csv'
+
+    def delta_dir(self, delta) -> Path:
+        return self.out_dir / 'deltas' / delta
+
+    def deltas(self) -> list:
+        return [entry['delta'] for entry in self.journal.entries()]
+
+    def recover(self):
+        """
+        Cuts the phase manifests back to their committed length, dropping rows of a delta that failed before its
+        journal line. Manifests made by IngestPipeline.run before the journal existed become the first delta, unless
+        a pending marker shows they hold rows of a failed first append.
+        """
+        if not self.journal.entries() and not self.pending_path.is_file():
+            if any(self.manifest_path(phase).is_file() for phase in PHASES):
+                self._adopt()
+            return
+
+        for phase in PHASES:
+            manifest_path = self.manifest_path(phase)
+            committed = self.journal.rows(phase)
+            lines = _read_lines(manifest_path)
+            if len(lines) > committed:
+                print(f'Rolling back {len(lines) - committed} uncommitted rows of {manifest_path}')
+                tmp_path = manifest_path.with_name(f'.{manifest_path.name}.tmp')
+                tmp_path.write_text(''.join(lines[:committed]))
+                os.replace(tmp_path, manifest_path)
+            mask = load_quality_mask(manifest_path)
+            if mask is not None and len(mask) > committed:
+                save_quality_mask(manifest_path, mask[:committed])
+        if self.pending_path.is_file():
+            self.pending_path.unlink()
+
+    def _adopt(self):
+        # The delta keeps a copy of the manifests as they are now, like deltas made by append()
+        delta = f'{0:05d}'
+        rows = {phase: _n_rows(self.manifest_path(phase)) for phase in PHASES}
+        self.delta_dir(delta).mkdir(exist_ok=True, parents=True)
+        for phase in PHASES:
+            if rows[phase]:
+                shutil.copyfile(self.manifest_path(phase), self.manifest_path(phase, delta))
+                save_quality_mask(self.manifest_path(phase, delta),
+                                  _quality_mask(self.manifest_path(phase), rows[phase]))
+        recordings = self._save_index(delta, [self.manifest_path(phase, delta) for phase in PHASES])
+        self.journal.append(dict(delta=delta, created=time.strftime('%Y-%m-%dT%H:%M:%S'), recordings=recordings,
+                                 rows=rows, n_windows=sum(rows.values())))
+
+    def _save_index(self, delta, manifest_paths) -> list:
+        # Window index of the delta's manifests. Returns the names of its recordings
+        manifest_paths = [path for path in manifest_paths if _n_rows(path)]
+        if not manifest_paths:
+            return []
+        indexes = [WindowIndex.from_manifest(path) for path in manifest_paths]
+        index = WindowIndex.concat(indexes) if len(indexes) > 1 else indexes[0]
+        index.save(self.delta_dir(delta) / 'index')
+        return sorted({Path(os.path.relpath(recording, self.out_dir)).as_posix() for recording in index.recordings})
+
+    def new_recordings(self, data_dir) -> list:
+        known = self.journal.recordings()
+        return [path for path in find_recordings(data_dir) if recording_name(path, data_dir) not in known]
+
+    def append(self, data_dir):
+        # Ingests recordings of data_dir that are not in the store yet. Returns the journal entry, None if no new ones
+        recording_paths = self.new_recordings(data_dir)
+        if not recording_paths:
+            print('No new recordings')
+            return None
+
+        delta = f'{len(self.journal.entries()):05d}'
+        delta_manifests = self.pipeline.run(data_dir, self.ratios, self.seed, recording_paths=recording_paths,
+                                            manifest_dir=self.delta_dir(delta))
+        self._save_index(delta, delta_manifests.values())
+
+        self.pending_path.write_text(delta)
+        rows = {}
+        for phase in PHASES:
+            manifest_path = self.manifest_path(phase)
+            delta_lines = _read_lines(delta_manifests[phase])
+            n_rows = self.journal.rows(phase)
+            with open(manifest_path, mode='a') as f:
+                f.write(''.join(delta_lines))
+            # The mask is one byte per window, so it is rewritten whole
+            save_quality_mask(manifest_path, np.hstack([_quality_mask(manifest_path, n_rows)[:n_rows],
+                                                        _quality_mask(delta_manifests[phase], len(delta_lines))]))
+            rows[phase] = n_rows + len(delta_lines)
+
+        entry = dict(delta=delta, created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     recordings=sorted(recording_name(path, data_dir) for path in recording_paths), rows=rows,
+                     n_windows=sum(rows[phase] - self.journal.rows(phase) for phase in PHASES))
+        self.journal.append(entry)
+        self.pending_path.unlink()
+        return entry
+
+    def window_index(self) -> WindowIndex:
+        # Union of the index segments of all deltas, nothing is re-parsed
+        indexes = [WindowIndex.load(self.delta_dir(delta) / 'index') for delta in self.deltas()
+                   if WindowIndex.exists(self.delta_dir(delta) / 'index')]
+        assert indexes, f'{self.out_dir} has no window index yet. Append recordings first'
+        return WindowIndex.concat(indexes) if len(indexes) > 1 else indexes[0]
+
+    def update_stats(self, data_conf, label_func, stats_path=None, n_jobs=-1, phase='train') -> RunningStats:
+        """
+        Normalization statistics of the union. Each delta's partial statistics for this preprocessing config are
+        computed once from the delta's own manifest and kept in its directory; the union merges them.
+        Features computed on the way go to data_conf['cache_dir'] if set, where training finds them.
+        """
+        from eeglibrary.src.eeg_dataset import EEGDataSet
+        from eeglibrary.src.stats import compute_stats
+
+        stats = RunningStats()
+        for delta in self.deltas():
+            manifest_path = self.manifest_path(phase, delta)
+            if not _n_rows(manifest_path):
+                continue
+            partial_path = self.delta_dir(delta) / f'stats_{preprocess_key(data_conf)}.npz'
+            if partial_path.is_file():
+                partial = RunningStats.load(partial_path)
+            else:
+                dataset = EEGDataSet(str(manifest_path), data_conf, None, label_func, phase)
+                partial = compute_stats(dataset, n_jobs)
+                partial.save(partial_path)
+            stats.merge(partial)
+
+        if stats_path:
+            stats.save(stats_path)
+        return stats
+
+
+if __name__ == '__main__':
+    from eeglibrary.utils.args import split_args
+    args = split_args().parse_args()
+    print(IncrementalStore(args.out_dir, window_size=args.duration).append(args.patients_dir))
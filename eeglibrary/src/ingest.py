@@ -0,0 +1,220 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.quality import save_quality_mask, scan_windows
+from eeglibrary.src.resources import limit_threads, resolve_n_jobs, worker_threads
+from eeglibrary.src.window import EEGWindow, RecordingMeta, meta_name, meta_path, save_recording_meta
+
+
+RECORDING_FORMAT = ['.edf', '.mat', '.pkl']
+PHASES = ['train', 'val', 'test']
+
+
+def find_recordings(data_dir, suffixes=RECORDING_FORMAT) -> list:
+    return sorted(str(p) for p in Path(data_dir).glob('**/*') if p.suffix in suffixes)
+
+
+def recording_name(recording_path, data_dir) -> str:
+    # Path of a recording relative to data_dir without suffix. Window directories and journals use it, so recordings
+    # with the same file name in different subdirectories stay apart
+    return Path(recording_path).relative_to(data_dir).with_suffix('').as_posix()
+
+
+def load_recording(path, channels=None) -> EEG:
+    if path.endswith('.edf'):
+        import pyedflib
+        return EEG.from_edf(pyedflib.EdfReader(path), channels)
+    elif path.endswith('.mat'):
+        from eeglibrary.src.eeg_loader import from_mat
+        return from_mat(path, mat_col='', channels=channels)
+    else:
+        return EEG.load_pkl(path, channels)
+
+
+def _attach(name):
+    # Attaching registers the block to this process's resource tracker, which would unlink it when the worker
+    # exits. The main process owns and unlinks every block.
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _load_to_shared_memory(path, channels, window_size, window_stride, padding):
+    eeg = load_recording(path, channels)
+    values = np.ascontiguousarray(eeg.values, dtype=np.float64)
+    n_eeg, window_stride, padding = eeg._validate_values(window_size, window_stride, padding)
+    starts = (np.arange(n_eeg) * eeg.sr * window_stride).astype(np.int64)
+    duration = int(window_size * eeg.sr)
+    quality = scan_windows(values, starts, duration)['ok'].values
+
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    shm.close()
+
+    return dict(path=path, shm_name=shm.name, shape=values.shape, dtype=values.dtype.str,
+                channel_list=list(eeg.channel_list), sr=eeg.sr, header=eeg.header, starts=starts, duration=duration,
+                quality=quality, n_bytes=os.path.getsize(path))
+
+
+def _write_windows(recording, starts, window_size, save_dir, suffix, compact=False):
+    shm = _attach(recording['shm_name'])
+    values = np.ndarray(recording['shape'], dtype=recording['dtype'], buffer=shm.buf)
+    duration = recording['duration']
+
+    paths = []
+    for start in starts:
+        if compact:
+            eeg = EEGWindow(values[:, start:start + duration], meta_name(suffix), start, start + duration)
+        else:
+            eeg = EEG(values[:, start:start + duration], recording['channel_list'], window_size, recording['sr'],
+                      recording['header'])
+        path = f'{save_dir}/{start}_{start + duration}{suffix}.pkl'
+        eeg.to_pkl(path)
+        paths.append(path)
+
+    del values, eeg
+    shm.close()
+    return paths
+
+
+def _unlink(recording):
+    try:
+        shm = shared_memory.SharedMemory(name=recording['shm_name'])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def split_recordings(recordings, ratios=(0.7, 0.15, 0.15), seed=0) -> dict:
+    # Split by recording, so windows of one recording never leak into another phase
+    order = np.random.RandomState(seed).permutation(len(recordings))
+    bounds = (np.cumsum(ratios) / np.sum(ratios) * len(recordings)).round().astype(int)
+    return {phase: [recordings[i] for i in np.split(order, bounds[:-1])[j]] for j, phase in enumerate(PHASES)}
+
+
+class IngestPipeline:
+    """
+    Turns a directory of recordings into window pickles and train/val/test manifests.
+    One process pool does both stages: a worker loads a recording into shared memory and scans window quality,
+    then window writing is spread over all workers in chunks, so cores stay busy across files.
+    label_func(recording_path, start, end) -> label adds a label column to the manifests.
+    compact: write EEGWindow pickles and one metadata file per recording, as EEG.split_and_save(compact=True).
+    """
+    def __init__(self, out_dir, window_size=0.5, window_stride='same', padding='same', channels=None, suffix='',
+                 label_func=None, n_jobs=-1, chunk_size=256, compact=False):
+        self.out_dir = Path(out_dir)
+        self.window_size = window_size
+        self.window_stride = window_stride
+        self.padding = padding
+        self.channels = channels
+        self.suffix = suffix
+        self.label_func = label_func
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.compact = compact
+
+    def _save_dir(self, recording_path, data_dir):
+        save_dir = self.out_dir / recording_name(recording_path, data_dir)
+        save_dir.mkdir(exist_ok=True, parents=True)
+        return str(save_dir)
+
+    def run(self, data_dir, ratios=(0.7, 0.15, 0.15), seed=0, recording_paths=None, manifest_dir=None) -> dict:
+        # recording_paths: ingest only these instead of every recording of data_dir. manifest_dir: default out_dir
+        recording_paths = find_recordings(data_dir) if recording_paths is None else recording_paths
+        windows = {}
+        n_bytes, start_time = 0, time.time()
+        to_load = list(recording_paths)
+        recordings, n_remaining, pending = {}, {}, {}
+        # Resolved per run, so a ResourcePlan applied after construction still sets the processes and their threads
+        n_jobs = resolve_n_jobs(self.n_jobs)
+        executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=limit_threads,
+                                       initargs=(worker_threads(n_jobs),))
+
+        try:
+            while to_load or pending:
+                # At most n_jobs recordings are loading or waiting in shared memory for their windows to be written,
+                # so /dev/shm holds a few recordings at a time, not the whole dataset
+                n_live = sum(stage == 'load' for stage, _ in pending.values()) + sum(map(bool, n_remaining.values()))
+                while to_load and n_live < n_jobs:
+                    path = to_load.pop(0)
+                    pending[executor.submit(_load_to_shared_memory, path, self.channels, self.window_size,
+                                            self.window_stride, self.padding)] = ('load', path)
+                    n_live += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, path = pending.pop(future)
+                    if stage == 'load':
+                        recording = future.result()
+                        recordings[path] = recording
+                        n_bytes += recording['n_bytes']
+                        chunks = [recording['starts'][i:i + self.chunk_size]
+                                  for i in range(0, len(recording['starts']), self.chunk_size)]
+                        windows[path] = [None] * len(chunks)
+                        n_remaining[path] = len(chunks)
+                        save_dir = self._save_dir(path, data_dir)
+                        if self.compact:
+                            meta = RecordingMeta(recording['channel_list'], recording['sr'], recording['header'])
+                            save_recording_meta(meta, meta_path(save_dir, self.suffix))
+                        for i, chunk in enumerate(chunks):
+                            pending[executor.submit(_write_windows, recording, chunk, self.window_size, save_dir,
+                                                    self.suffix, self.compact)] = (i, path)
+                        if not chunks:
+                            _unlink(recording)
+                    else:
+                        windows[path][stage] = future.result()
+                        n_remaining[path] -= 1
+                        if n_remaining[path] == 0:
+                            _unlink(recordings[path])
+        finally:
+            # Blocks are not tracked by the resource tracker, so after a failure every live block is unlinked here
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, (stage, path) in pending.items():
+                if stage == 'load' and future.done() and not future.cancelled() and future.exception() is None:
+                    recordings[path], n_remaining[path] = future.result(), 1
+            for path, recording in recordings.items():
+                if n_remaining.get(path):
+                    _unlink(recording)
+
+        elapsed = time.time() - start_time
+        n_windows = sum(len(r['starts']) for r in recordings.values())
+        print(f'{len(recordings)} files, {n_windows} windows in {elapsed:.1f} sec: '
+              f'{len(recordings) / elapsed:.2f} files/sec, {n_bytes / elapsed / 1e6:.2f} MB/sec')
+
+        manifests = {}
+        for phase, paths in split_recordings(recording_paths, ratios, seed).items():
+            manifests[phase] = self._save_manifest(phase, paths, recordings, windows, manifest_dir or self.out_dir)
+        return manifests
+
+    def _save_manifest(self, phase, recording_paths, recordings, windows, manifest_dir):
+        rows, masks = [], []
+        for path in recording_paths:
+            recording = recordings[path]
+            window_paths = [p for chunk in windows[path] for p in chunk]
+            if self.label_func:
+                rows.extend([(p, self.label_func(path, s, s + recording['duration']))
+                             for p, s in zip(window_paths, recording['starts'])])
+            else:
+                rows.extend([(p,) for p in window_paths])
+            masks.append(recording['quality'])
+
+        manifest_path = Path(manifest_dir) / f'{phase}_manifest.csv'
+        manifest_path.parent.mkdir(exist_ok=True, parents=True)
+        pd.DataFrame(rows).to_csv(manifest_path, index=False, header=None)
+        save_quality_mask(manifest_path, np.hstack(masks) if masks else np.zeros(0, dtype=bool))
+        return str(manifest_path)
+
+
+if __name__ == '__main__':
+    from eeglibrary.utils.args import split_args
+    args = split_args().parse_args()
+    print(IngestPipeline(args.out_dir, window_size=args.duration).run(args.patients_dir))
@@ -0,0 +1,254 @@
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from eeglibrary.src.path_table import PathTable
+from eeglibrary.src.quality import load_quality_mask, save_quality_mask
+
+INDEX_FILES = ['recordings', 'patients', 'recording_patients', 'bounds', 'starts', 'ends', 'max_ends', 'quality']
+EVENT_COLUMNS = ['recording', 'onset', 'offset', 'label']
+WINDOW_NAME = re.compile(r'^(\d+)_(\d+)')
+
+
+def parse_window_name(path) -> tuple:
+    # (start, end) sample of a window saved as {start}_{end}{suffix}.pkl by split_and_save or IngestPipeline
+    match = WINDOW_NAME.match(Path(path).name)
+    assert match, f'{path} is not a window file named {{start}}_{{end}}{{suffix}}.pkl'
+    return int(match.group(1)), int(match.group(2))
+
+
+def patient_of(recording) -> str:
+    # Recording directories are named {patient}_{number}, e.g. chb01_03
+    return Path(recording).name.split('_')[0]
+
+
+def _running_max(values, bounds) -> np.ndarray:
+    # Running max of values, restarted at every bound
+    out = np.empty_like(values)
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        np.maximum.accumulate(values[lo:hi], out=out[lo:hi])
+    return out
+
+
+class WindowIndex:
+    """
+    Interval index over the windows of many recordings, to select training subsets by patient, recording, time and
+    label without reading window files or manifests.
+    Windows are sorted by recording and start time, so the windows of recording r are bounds[r]:bounds[r + 1] and a
+    time range is two binary searches. max_ends, the running max of ends in a recording, keeps the search exact when
+    windows have different lengths. Times are seconds from the start of the recording.
+    paths: PathTable with one window per item and the label of the window.
+    events: annotated intervals (recording, onset, offset, label), e.g. seizures. recording is a recording index.
+    """
+    def __init__(self, paths, recordings, patients, recording_patients, bounds, starts, ends, max_ends, quality,
+                 events=None):
+        self.paths = paths
+        self.recordings = recordings
+        self.patients = patients
+        self.recording_patients = recording_patients
+        self.bounds = bounds
+        self.starts = starts
+        self.ends = ends
+        self.max_ends = max_ends
+        self.quality = quality
+        self.events = events if events is not None else pd.DataFrame(columns=EVENT_COLUMNS)
+
+    @classmethod
+    def from_paths(cls, paths, labels=None, quality=None, sr=None, patient_func=patient_of, background='bckg'):
+        """
+        paths: window files. The directory of a window is its recording.
+        sr: sample rate of every recording. If None, it is read from the first window of each recording.
+        """
+        paths = np.asarray([str(path) for path in paths])
+        labels = np.asarray(labels) if labels is not None else np.full(len(paths), background)
+        quality = np.asarray(quality, dtype=bool) if quality is not None else np.ones(len(paths), dtype=bool)
+        recordings, recording_codes = np.unique([str(Path(path).parent) for path in paths], return_inverse=True)
+        samples = np.array([parse_window_name(path) for path in paths], dtype=np.float64).reshape(-1, 2)
+
+        order = np.lexsort((samples[:, 0], recording_codes))
+        paths, labels, quality = paths[order], labels[order], quality[order]
+        recording_codes, samples = recording_codes[order], samples[order]
+        bounds = np.searchsorted(recording_codes, np.arange(len(recordings) + 1)).astype(np.int64)
+
+        if sr is None:
+            from eeglibrary.src.eeg import EEG
+            srs = np.array([EEG.load_pkl(paths[lo]).sr for lo in bounds[:-1]], dtype=np.float64)
+        else:
+            srs = np.full(len(recordings), float(sr))
+        seconds = samples / srs[recording_codes][:, None]
+        starts, ends = np.ascontiguousarray(seconds[:, 0]), np.ascontiguousarray(seconds[:, 1])
+
+        patients, recording_patients = np.unique([patient_func(recording) for recording in recordings],
+                                                 return_inverse=True)
+        table = PathTable.from_paths(paths, labels, np.arange(len(paths))[:, None])
+        return cls(table, recordings, patients, recording_patients.astype(np.int64), bounds, starts, ends,
+                   _running_max(ends, bounds), quality)
+
+    @classmethod
+    def from_manifest(cls, manifest_path, label_func=None, **kwargs):
+        # Labels come from label_func(row) like in EEGDataSet, or from the second column of the manifest
+        path_df = pd.read_csv(manifest_path, header=None)
+        if label_func is not None:
+            labels = path_df.apply(label_func, axis=1).tolist()
+        else:
+            labels = path_df.iloc[:, 1].tolist() if path_df.shape[1] > 1 else None
+        return cls.from_paths(path_df.iloc[:, 0].tolist(), labels, load_quality_mask(manifest_path), **kwargs)
+
+    @classmethod
+    def concat(cls, indexes):
+        """
+        One index over the windows of all indexes, e.g. segments built for separate batches of recordings.
+        Recordings are kept apart per index, so a recording should be in one index only.
+        """
+        patients = np.unique(np.concatenate([np.asarray(index.patients) for index in indexes]))
+        window_shifts = np.cumsum([0] + [len(index) for index in indexes])
+        recording_shifts = np.cumsum([0] + [len(index.recordings) for index in indexes])
+        events = [index.events.assign(recording=index.events['recording'].astype(np.int64) + shift)
+                  for index, shift in zip(indexes, recording_shifts)]
+        return cls(PathTable.concat([index.paths for index in indexes]),
+                   np.concatenate([index.recordings for index in indexes]),
+                   patients,
+                   np.concatenate([np.searchsorted(patients, np.asarray(index.patients))[index.recording_patients]
+                                   for index in indexes]).astype(np.int64),
+                   np.concatenate([[0]] + [index.bounds[1:] + shift for index, shift in zip(indexes, window_shifts)]
+                                  ).astype(np.int64),
+                   *[np.concatenate([getattr(index, name) for index in indexes])
+                     for name in ['starts', 'ends', 'max_ends', 'quality']],
+                   events=pd.concat(events, ignore_index=True) if any(len(e) for e in events) else None)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def recording_codes(self, recordings) -> np.ndarray:
+        # Recording indices of recording directories or directory names
+        lookup = {name: code for code, name in enumerate(self.recordings)}
+        lookup.update({Path(name).name: code for code, name in enumerate(self.recordings)})
+        return np.array([lookup[str(recording)] for recording in recordings], dtype=np.int64)
+
+    def labels(self, indices=None) -> np.ndarray:
+        codes = self.paths.label_codes if indices is None else self.paths.label_codes[indices]
+        return self.paths.label_values[codes]
+
+    def overlapping(self, recording, start, end, within=False) -> np.ndarray:
+        # Windows of recording (index) overlapping [start, end), or lying inside it if within
+        lo, hi = self.bounds[recording], self.bounds[recording + 1]
+        first = lo + np.searchsorted(self.max_ends[lo:hi], start, side='right')
+        last = lo + np.searchsorted(self.starts[lo:hi], end, side='left')
+        indices = np.arange(first, last)
+        if within:
+            return indices[(self.starts[indices] >= start) & (self.ends[indices] <= end)]
+        return indices[self.ends[indices] > start]
+
+    def annotate(self, events, min_overlap=0.0, background='bckg'):
+        """
+        Labels windows by events, a DataFrame with recording (directory or its name), onset, offset (sec) and label.
+        A window takes the label of an event covering more than min_overlap of it, others get background.
+        """
+        events = pd.DataFrame(events, columns=EVENT_COLUMNS).reset_index(drop=True)
+        events['recording'] = self.recording_codes(events['recording'])
+        labels = np.full(len(self), background, dtype=object)
+        for recording, onset, offset, label in events.itertuples(index=False):
+            indices = self.overlapping(recording, onset, offset)
+            overlap = np.minimum(self.ends[indices], offset) - np.maximum(self.starts[indices], onset)
+            labels[indices[overlap > min_overlap * (self.ends[indices] - self.starts[indices])]] = label
+
+        label_values, label_codes = np.unique(labels.astype(str), return_inverse=True)
+        self.paths = PathTable(self.paths.buffer, self.paths.offsets, self.paths.items, self.paths.item_offsets,
+                               label_codes.astype(np.int64), label_values)
+        self.events = events
+        return self
+
+    def _recordings_of(self, patients=None, recordings=None) -> np.ndarray:
+        codes = np.arange(len(self.recordings))
+        if patients is not None:
+            codes = codes[np.isin(self.patients[self.recording_patients[codes]], list(patients))]
+        if recordings is not None:
+            codes = np.intersect1d(codes, self.recording_codes(recordings))
+        return codes
+
+    def _filter(self, indices, labels=None, good_only=True) -> np.ndarray:
+        if labels is not None:
+            indices = indices[np.isin(self.labels(indices), list(labels))]
+        if good_only:
+            indices = indices[self.quality[indices]]
+        return indices
+
+    def select(self, patients=None, recordings=None, start=None, end=None, labels=None, within=False,
+               good_only=True) -> np.ndarray:
+        # Indices of windows in [start, end) sec of the given patients and recordings, with one of labels
+        selected = []
+        for recording in self._recordings_of(patients, recordings):
+            if start is None and end is None:
+                selected.append(np.arange(self.bounds[recording], self.bounds[recording + 1]))
+            else:
+                selected.append(self.overlapping(recording, -np.inf if start is None else start,
+                                                 np.inf if end is None else end, within))
+        indices = np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64)
+        return self._filter(indices, labels, good_only)
+
+    def around_events(self, before=0.0, after=0.0, anchor='onset', event_labels=None, patients=None, labels=None,
+                      within=True, good_only=True) -> np.ndarray:
+        """
+        Indices of windows in [event anchor - before, event anchor + after) of every event.
+        e.g. 30 min before seizure onset of chb01 and chb03, seizure windows excluded:
+            around_events(before=1800, event_labels=['seiz'], patients=['chb01', 'chb03'], labels=['bckg'])
+        """
+        events = self.events
+        if event_labels is not None:
+            events = events[events['label'].isin(list(event_labels))]
+        if patients is not None:
+            events = events[np.isin(events['recording'], self._recordings_of(patients))]
+
+        selected = [self.overlapping(recording, time - before, time + after, within)
+                    for recording, time in zip(events['recording'], events[anchor])]
+        indices = np.unique(np.concatenate(selected)) if selected else np.zeros(0, dtype=np.int64)
+        return self._filter(indices, labels, good_only)
+
+    def to_frame(self, indices=None) -> pd.DataFrame:
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        recordings = np.searchsorted(self.bounds, indices, side='right') - 1
+        return pd.DataFrame(dict(path=[self.paths.path(i) for i in self.paths.items[indices]],
+                                 patient=self.patients[self.recording_patients[recordings]],
+                                 recording=self.recordings[recordings], start=self.starts[indices],
+                                 end=self.ends[indices], label=self.labels(indices), quality=self.quality[indices]))
+
+    def to_path_table(self, indices) -> PathTable:
+        # Items of EEGDataSet.path_list (n_use_eeg=1). Shares the path buffer of the index, nothing is re-encoded
+        indices = np.asarray(indices, dtype=np.int64)
+        return PathTable(self.paths.buffer, self.paths.offsets, self.paths.items[indices],
+                         np.arange(len(indices) + 1, dtype=np.int64), self.paths.label_codes[indices],
+                         self.paths.label_values)
+
+    def to_manifest(self, indices, manifest_path) -> str:
+        # Manifest of (path, label) and its quality mask. Windows stay in recording and time order, so EEGDataSet
+        # can still group consecutive windows with n_use_eeg > 1
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        Path(manifest_path).parent.mkdir(exist_ok=True, parents=True)
+        self.to_frame(indices)[['path', 'label']].to_csv(manifest_path, index=False, header=None)
+        save_quality_mask(manifest_path, self.quality[indices])
+        return str(manifest_path)
+
+    def save(self, index_dir):
+        # Same layout as PathTable: one .npy per array, written atomically, memory mapped on load
+        index_dir = Path(index_dir)
+        self.paths.save(index_dir / 'paths')
+        for name in INDEX_FILES:
+            tmp_path = index_dir / f'.{name}.tmp.npy'
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, index_dir / f'{name}.npy')
+        self.events.to_csv(index_dir / 'events.csv', index=False)
+
+    @classmethod
+    def load(cls, index_dir, mmap_mode='r'):
+        index_dir = Path(index_dir)
+        arrays = [np.load(index_dir / f'{name}.npy', mmap_mode=mmap_mode) for name in INDEX_FILES]
+        events = pd.read_csv(index_dir / 'events.csv') if (index_dir / 'events.csv').is_file() else None
+        return cls(PathTable.load(index_dir / 'paths', mmap_mode), *arrays, events=events)
+
+    @staticmethod
+    def exists(index_dir):
+        return PathTable.exists(Path(index_dir) / 'paths') and \
+            all((Path(index_dir) / f'{name}.npy').is_file() for name in INDEX_FILES)
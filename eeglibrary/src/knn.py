@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TREES = ['kd_tree', 'ball_tree']
+
+
+def _build_tree(features, leaf_size, tree):
+    from sklearn.neighbors import BallTree, KDTree
+    return (KDTree if tree == 'kd_tree' else BallTree)(features, leaf_size=leaf_size)
+
+
+def _features_of(dataset, indices):
+    features = np.stack([np.asarray(dataset.load_features(idx), dtype=np.float64).ravel() for idx in indices])
+    labels = np.array([dataset.path_list[idx][1] for idx in indices])
+    return features, labels
+
+
+class IndexedKNN:
+    """
+    k-nearest neighbour classifier over a sharded KD or ball tree, same interface as the numpy models of set_model.
+    partial_fit() only buffers vectors. They are searched brute force until the buffer exceeds rebuild_ratio of the
+    indexed vectors, then all shards are rebuilt in parallel. Queries go to every shard in threads and the k nearest
+    of all shards win, so prediction cost grows with log of the archive size per shard.
+    save_model() persists the trees with joblib. load_model_() memory maps them, so workers share one copy.
+    """
+    def __init__(self, classes, n_neighbors=5, tree='kd_tree', n_shards=1, leaf_size=40, weights='uniform',
+                 rebuild_ratio=0.1, n_jobs=-1):
+        assert tree in TREES, f'tree must be one of {TREES}'
+        self.classes = np.asarray(classes)
+        self.n_neighbors = n_neighbors
+        self.tree = tree
+        self.n_shards = n_shards
+        self.leaf_size = leaf_size
+        self.weights = weights
+        self.rebuild_ratio = rebuild_ratio
+        self.n_jobs = n_jobs
+        self.shards = []
+        self.shard_labels = []
+        self._pending = []
+        self._pending_labels = []
+
+    @property
+    def n_indexed(self):
+        return sum(len(labels) for labels in self.shard_labels)
+
+    @property
+    def n_pending(self):
+        return sum(len(labels) for labels in self._pending_labels)
+
+    def _shard_data(self, shard):
+        return np.asarray(shard.data)
+
+    def build(self, features, labels):
+        # Replaces the index with features (n x n_features) and labels
+        from joblib import Parallel, delayed
+
+        features, labels = np.asarray(features, dtype=np.float64), np.asarray(labels)
+        n_shards = max(min(self.n_shards, len(features)), 1)
+        chunks = np.array_split(np.arange(len(features)), n_shards)
+        self.shards = Parallel(n_jobs=min(self.n_jobs, n_shards) if self.n_jobs > 0 else n_shards, verbose=0)(
+            [delayed(_build_tree)(features[chunk], self.leaf_size, self.tree) for chunk in chunks])
+        self.shard_labels = [labels[chunk] for chunk in chunks]
+        self._pending, self._pending_labels = [], []
+        return self
+
+    def rebuild(self):
+        features = [self._shard_data(shard) for shard in self.shards] + self._pending
+        labels = self.shard_labels + self._pending_labels
+        if features:
+            self.build(np.concatenate(features), np.concatenate(labels))
+
+    def fit(self, features, labels):
+        return self.build(np.reshape(features, (len(features), -1)), labels)
+
+    def partial_fit(self, features, labels):
+        self._pending.append(np.reshape(np.asarray(features, dtype=np.float64), (len(features), -1)))
+        self._pending_labels.append(np.asarray(labels))
+        if self.n_pending > self.rebuild_ratio * self.n_indexed:
+            self.rebuild()
+
+    def fit_dataset(self, dataset, n_jobs=-1):
+        # Builds the index from the feature store of an EEGDataSet. Features come from load_features (and its cache)
+        from joblib import Parallel, delayed, cpu_count
+
+        n_jobs = n_jobs if n_jobs > 0 else cpu_count()
+        chunks = np.array_split(np.arange(len(dataset.path_list)), n_jobs)
+        parts = Parallel(n_jobs=n_jobs, verbose=0)([delayed(_features_of)(dataset, chunk) for chunk in chunks
+                                                    if len(chunk)])
+        return self.build(np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]))
+
+    def _query_pending(self, features, k):
+        data, labels = np.concatenate(self._pending), np.concatenate(self._pending_labels)
+        # ||a||^2 - 2ab + ||b||^2 keeps memory at batch x pending instead of batch x pending x n_features
+        sq_dist = (features ** 2).sum(axis=1)[:, None] - 2 * features @ data.T + (data ** 2).sum(axis=1)[None, :]
+        dist = np.sqrt(np.maximum(sq_dist, 0))
+        k = min(k, len(data))
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(dist, nearest, axis=1), labels[nearest]
+
+    def kneighbors(self, features):
+        # (distances, labels) of the n_neighbors nearest vectors, batch x k
+        features = np.reshape(np.asarray(features, dtype=np.float64), (len(features), -1))
+
+        def query(shard_idx):
+            k = min(self.n_neighbors, len(self.shard_labels[shard_idx]))
+            dist, ind = self.shards[shard_idx].query(features, k=k)
+            return dist, self.shard_labels[shard_idx][ind]
+
+        if len(self.shards) > 1:
+            with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+                results = list(executor.map(query, range(len(self.shards))))
+        else:
+            results = [query(i) for i in range(len(self.shards))]
+        if self._pending:
+            results.append(self._query_pending(features, self.n_neighbors))
+        assert results, 'IndexedKNN has no data. Call fit or partial_fit first'
+
+        dist = np.concatenate([result[0] for result in results], axis=1)
+        labels = np.concatenate([result[1] for result in results], axis=1)
+        k = min(self.n_neighbors, dist.shape[1])
+        nearest = np.argsort(dist, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dist, nearest, axis=1), np.take_along_axis(labels, nearest, axis=1)
+
+    def predict_proba(self, features) -> np.ndarray:
+        if hasattr(features, 'cpu'):
+            features = features.cpu().numpy()
+        dist, labels = self.kneighbors(features)
+        weights = 1.0 / np.maximum(dist, 1e-12) if self.weights == 'distance' else np.ones_like(dist)
+        proba = np.stack([(weights * (labels == label)).sum(axis=1) for label in self.classes], axis=1)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, features) -> np.ndarray:
+        return self.classes[self.predict_proba(features).argmax(axis=1)]
+
+    def save_model(self, model_path):
+        import joblib
+        self.rebuild()
+        joblib.dump({'shards': self.shards, 'shard_labels': self.shard_labels, 'classes': self.classes,
+                     'n_neighbors': self.n_neighbors, 'tree': self.tree, 'weights': self.weights}, model_path)
+
+    def load_model_(self, model_path, mmap_mode='r'):
+        # Arrays inside the trees are memory mapped, not read into memory
+        import joblib
+        state = joblib.load(model_path, mmap_mode=mmap_mode)
+        self.shards, self.shard_labels = state['shards'], state['shard_labels']
+        self.classes, self.n_neighbors = state['classes'], state['n_neighbors']
+        self.tree, self.weights = state['tree'], state['weights']
+        self._pending, self._pending_labels = [], []
@@ -0,0 +1,121 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+TABLE_FILES = ['buffer', 'offsets', 'items', 'item_offsets', 'label_codes', 'label_values']
+
+
+def manifest_bounds_path(manifest_path) -> Path:
+    return Path(manifest_path).with_suffix('.bounds.npy')
+
+
+def save_manifest_bounds(manifest_path, bounds):
+    # Rows where each source of a concatenated manifest starts, and the number of rows at the end
+    np.save(manifest_bounds_path(manifest_path), np.asarray(bounds, dtype=np.int64))
+
+
+def load_manifest_bounds(manifest_path):
+    path = manifest_bounds_path(manifest_path)
+    if not path.is_file():
+        return None
+    return np.load(path)
+
+
+class PathTable:
+    """
+    Items of EEGDataSet (n_use_eeg paths and one label) in flat numpy arrays instead of Python objects.
+    Forked DataLoader workers touching a list of tuples update refcounts and copy every page of it; a few arrays
+    are never copied, and can also be memory mapped from disk.
+    buffer: concatenated UTF-8 paths, offsets: start of every path in buffer (n_paths + 1),
+    items: concatenated path indices of all items, item_offsets: start of every item in items (n_items + 1), so items
+    can have different numbers of windows, label_codes: index into label_values of every item.
+    Indexing gives (paths, label) like the former path_list.
+    """
+    def __init__(self, buffer, offsets, items, item_offsets, label_codes, label_values):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.items = items
+        self.item_offsets = item_offsets
+        self.label_codes = label_codes
+        self.label_values = label_values
+
+    @staticmethod
+    def _offsets(lengths):
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    @classmethod
+    def from_paths(cls, paths, labels, items):
+        """
+        paths: all paths, labels: label of every item
+        items: path indices of every item, n_items x n_use_eeg array or a list of index arrays of any length
+        """
+        encoded = [str(path).encode() for path in paths]
+        offsets = cls._offsets([len(path) for path in encoded])
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        label_values, label_codes = np.unique(np.asarray(labels), return_inverse=True)
+        item_offsets = cls._offsets([len(item) for item in items])
+        flat_items = np.concatenate([np.asarray(item, dtype=np.int64) for item in items]) if len(items) \
+            else np.zeros(0, dtype=np.int64)
+        return cls(buffer, offsets, flat_items, item_offsets, label_codes.astype(np.int64), label_values)
+
+    @classmethod
+    def concat(cls, tables):
+        # Items of all tables in order. Labels are merged into one sorted set of label values
+        label_values = np.unique(np.concatenate([np.asarray(table.label_values) for table in tables]))
+        path_shifts = np.cumsum([0] + [len(table.offsets) - 1 for table in tables])
+        buffer_shifts = np.cumsum([0] + [len(table.buffer) for table in tables])
+        item_shifts = np.cumsum([0] + [len(table.items) for table in tables])
+        return cls(np.concatenate([table.buffer for table in tables]),
+                   np.concatenate([[0]] + [table.offsets[1:] + shift for table, shift in zip(tables, buffer_shifts)]),
+                   np.concatenate([table.items + shift for table, shift in zip(tables, path_shifts)]),
+                   np.concatenate([[0]] + [table.item_offsets[1:] + shift
+                                           for table, shift in zip(tables, item_shifts)]),
+                   np.concatenate([np.searchsorted(label_values, np.asarray(table.label_values))[table.label_codes]
+                                   for table in tables]).astype(np.int64),
+                   label_values)
+
+    def path(self, path_idx) -> str:
+        return self.buffer[self.offsets[path_idx]:self.offsets[path_idx + 1]].tobytes().decode()
+
+    def paths(self, idx) -> list:
+        return [self.path(path_idx) for path_idx in self.items[self.item_offsets[idx]:self.item_offsets[idx + 1]]]
+
+    def lengths(self) -> np.ndarray:
+        # Number of windows of every item
+        return np.diff(self.item_offsets)
+
+    def label(self, idx):
+        return self.label_values[self.label_codes[idx]].item()
+
+    def get_labels(self) -> list:
+        return self.label_values[self.label_codes].tolist()
+
+    def __getitem__(self, idx):
+        return self.paths(idx), self.label(idx)
+
+    def __len__(self):
+        return len(self.label_codes)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def save(self, table_dir):
+        # One .npy per array so that every array can be memory mapped. Written atomically per file
+        table_dir = Path(table_dir)
+        table_dir.mkdir(exist_ok=True, parents=True)
+        for name in TABLE_FILES:
+            tmp_path = table_dir / f'.{name}.tmp.npy'
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, table_dir / f'{name}.npy')
+
+    @classmethod
+    def load(cls, table_dir, mmap_mode='r'):
+        return cls(*[np.load(Path(table_dir) / f'{name}.npy', mmap_mode=mmap_mode) for name in TABLE_FILES])
+
+    @staticmethod
+    def exists(table_dir):
+        return all((Path(table_dir) / f'{name}.npy').is_file() for name in TABLE_FILES)
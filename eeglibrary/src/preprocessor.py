@@ -1,9 +1,14 @@
+from pathlib import Path
+
 import numpy as np
 import torch
 from ml.src.signal_processor import *
 from ml.src.preprocessor import preprocess_args, Preprocessor
 from eeglibrary.src.chb_mit_cnn_spectrogram import createSpec
+from eeglibrary.src.filters import filter_bank_from_conf
 from eeglibrary.src.signal_processor import *
+from eeglibrary.src.spectral import Spectrum
+from eeglibrary.src.stats import RunningStats
 from sklearn import preprocessing
 
 
@@ -14,11 +19,29 @@ def eeg_preprocess_args(parser):
 
     eeg_prep_parser.add_argument('--duration', default=10.0, type=float, help='Duration of one EEG dataset')
     eeg_prep_parser.add_argument('--n-use-eeg', default=1, type=int, help='Number of eeg to use')
+    eeg_prep_parser.add_argument('--variable-length', action='store_true',
+                                 help='Items are runs of up to n-use-eeg windows, packed for RNNs')
+    eeg_prep_parser.add_argument('--min-n-use-eeg', default=1, type=int,
+                                 help='Shortest run of windows kept with --variable-length')
     eeg_prep_parser.add_argument('--n-features', type=int, help='Number of features to reshape from 1 channel feature')
     eeg_prep_parser.add_argument('--sample-rate', default='same', help='Sample rate')
     eeg_prep_parser.add_argument('--num-eigenvalue', default=0, type=int,
                                  help='Number of eigen values to use from spectrogram')
     eeg_prep_parser.add_argument('--to-1d', dest='to_1d', action='store_true', help='Preprocess inputs to 1 dimension')
+    eeg_prep_parser.add_argument('--band-power', dest='band_power', action='store_true',
+                                 help='Add log band powers (delta to gamma) to 1 dimension features')
+    eeg_prep_parser.add_argument('--highpass', default=0.0, type=float, help='Highpass cutoff in Hz. 0 is off')
+    eeg_prep_parser.add_argument('--notch', default=0.0, type=float, help='Notch (bandstop) center in Hz. 0 is off')
+    eeg_prep_parser.add_argument('--notch-width', default=4.0, type=float, help='Width of the notch stop band in Hz')
+    eeg_prep_parser.add_argument('--filter-order', default=4, type=int, help='Order of the Butterworth filters')
+    eeg_prep_parser.add_argument('--causal-filter', action='store_true',
+                                 help='Filter forward only instead of zero-phase forward-backward filtering')
+    eeg_prep_parser.add_argument('--channels', default=None,
+                                 help='Channels to load. Number of first channels, montage name or comma separated names')
+    eeg_prep_parser.add_argument('--stats-path', default=None, type=str,
+                                 help='Normalization statistics (.npz). Computed from training data if not exists')
+    eeg_prep_parser.add_argument('--stats-axis', default='channel', choices=['channel', 'feature'],
+                                 help='Normalize per channel or per feature')
 
     return parser
 
@@ -33,6 +56,28 @@ class EEGPreprocessor(Preprocessor):
         self.use_eig_values = True
         self.scaling_axis = scaling_axis
         self.reproduce = eeg_conf['reproduce']
+        self.band_power = eeg_conf.get('band_power', False)
+        self.filter_bank = filter_bank_from_conf(eeg_conf)
+        self.stats_axis = eeg_conf.get('stats_axis', 'channel')
+        self.scale, self.shift = None, None
+        if eeg_conf.get('stats_path') and Path(eeg_conf['stats_path']).is_file():
+            self.set_stats(RunningStats.load(eeg_conf['stats_path']))
+
+    def set_stats(self, stats):
+        if self.stats_axis == 'channel':
+            stats = stats.reduce(keep_axis=0)
+        std = np.maximum(stats.std, 1e-8)
+        self.scale = torch.from_numpy(1.0 / std)
+        self.shift = torch.from_numpy(-stats.mean / std)
+
+    def normalize(self, x):
+        # (x - mean) / std as one fused multiply-add
+        if self.scale is None:
+            return x
+        scale, shift = self.scale.to(x.dtype), self.shift.to(x.dtype)
+        if scale.dim() == 1 and x.dim() > 1:
+            scale, shift = scale.view(-1, *[1] * (x.dim() - 1)), shift.view(-1, *[1] * (x.dim() - 1))
+        return torch.addcmul(shift, x, scale)
 
     def _calc_correlation(self, matrix):
         if self.scaling_axis:
@@ -40,29 +85,37 @@ class EEGPreprocessor(Preprocessor):
 
         return to_correlation_matrix(matrix)
 
-    def calc_corr_frts(self, eeg, space='time'):
+    def calc_corr_frts(self, eeg, space='time', spectrum=None):
         if space == 'time':
             corr_matrix = self._calc_correlation(eeg.values)
             y = flatten_corr_upper_right(corr_matrix)
         if space == 'freq':
-            corr_matrix = self._calc_correlation(np.absolute(np.fft.rfft(eeg.values, axis=1)))
+            spectrum = spectrum or Spectrum(eeg.values, eeg.sr)
+            corr_matrix = self._calc_correlation(spectrum.amplitude)
             y = flatten_corr_upper_right(corr_matrix)
         if self.use_eig_values:
             y = np.hstack((y, calc_eigen_values_sorted(corr_matrix)))
         return y
 
     def preprocess(self, eeg, label=None):
+        # FFT of the window is computed at most once and shared by resampling and all spectral features
+        spectrum = Spectrum(eeg.values, eeg.sr)
 
         if self.sr == 'same':
             self.sr = eeg.sr
         elif int(self.sr) != eeg.sr:
-            eeg.values = eeg.resample(self.sr)
+            spectrum = spectrum.resample(int(int(self.sr) * eeg.len_sec))
+            eeg.values = spectrum.values
             eeg.sr = int(self.sr)
         else:
             self.sr = int(self.sr)
 
+        if self.filter_bank:
+            eeg.values = self.filter_bank.apply(eeg.values, eeg.sr)
+            spectrum = Spectrum(eeg.values, eeg.sr)
+
         if self.reproduce == 'chbmit-cnn':
-            return torch.from_numpy(createSpec(eeg.values, eeg.sr, len(eeg.channel_list)))
+            return torch.from_numpy(createSpec(eeg.values, eeg.sr, len(eeg.channel_list), spectrum))
 
         if self.reproduce == 'bonn-rnn':
             n_channel = min(len(eeg.channel_list), 22)
@@ -79,8 +132,10 @@ class EEGPreprocessor(Preprocessor):
             if self.time_corr:
                 y = np.hstack((y, self.calc_corr_frts(eeg, 'time')))
             if self.freq_corr:
-                y = np.hstack((y, self.calc_corr_frts(eeg, 'freq')))
-                y = torch.from_numpy(y)
+                y = np.hstack((y, self.calc_corr_frts(eeg, 'freq', spectrum)))
+            if self.band_power:
+                y = np.hstack((y, np.log(spectrum.band_powers() + 1e-12).ravel()))
+            y = torch.from_numpy(y)
 
         if self.n_features:
             y = y.reshape(self.n_features, -1)
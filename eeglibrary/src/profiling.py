@@ -0,0 +1,123 @@
+import json
+import os
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+
+def current_rss() -> int:
+    # Resident set size in bytes. /proc is read directly to keep the overhead per stage small
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryProfiler:
+    """
+    Opt-in RSS and tracemalloc peak recorder per stage (parse_eeg, preprocess, collate, ...).
+    Each process (main or DataLoader worker) writes its records to report_dir/epoch{epoch}_{role}_{pid}.json and
+    aggregate_memory_report() merges them. Set epoch before creating the DataLoader iterator, so forked workers
+    write to the epoch being run.
+    """
+    def __init__(self, report_dir=None, role='worker', trace=True, flush_sec=5.0):
+        self.enabled = bool(report_dir)
+        self.report_dir = Path(report_dir) if report_dir else None
+        self.role = role
+        self.trace = trace
+        self.flush_sec = flush_sec
+        self.epoch = 0
+        self.records = {}
+        self._pid = None
+        self._last_flush = 0.0
+
+    def _init_process(self):
+        # Called in every new process. Records copied from the parent by fork are dropped
+        from multiprocessing.util import Finalize
+        self._pid = os.getpid()
+        self.records = {}
+        self.report_dir.mkdir(exist_ok=True, parents=True)
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        Finalize(self, self.flush, exitpriority=10)
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self._pid != os.getpid():
+            self._init_process()
+
+        if self.trace:
+            tracemalloc.reset_peak()
+        start_rss, start_time = current_rss(), time.time()
+        yield
+        end_rss = current_rss()
+        peak = tracemalloc.get_traced_memory()[1] if self.trace else 0
+
+        record = self.records.setdefault(name, dict(count=0, time=0.0, rss_max=0, rss_delta_max=0, peak_max=0))
+        record['count'] += 1
+        record['time'] += time.time() - start_time
+        record['rss_max'] = max(record['rss_max'], end_rss)
+        record['rss_delta_max'] = max(record['rss_delta_max'], end_rss - start_rss)
+        record['peak_max'] = max(record['peak_max'], peak)
+
+        if time.time() - self._last_flush > self.flush_sec:
+            self.flush()
+
+    def set_epoch(self, epoch):
+        if self.enabled and self.records:
+            self.flush()
+        self.epoch = epoch
+        self.records = {}
+
+    def flush(self):
+        if not (self.enabled and self.records):
+            return
+        path = self.report_dir / f'epoch{self.epoch}_{self.role}_{os.getpid()}.json'
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.records, f)
+        os.replace(tmp_path, path)
+        self._last_flush = time.time()
+
+
+class ProfiledCollate:
+    # Wraps collate_fn to record the collate stage inside DataLoader workers
+    def __init__(self, collate_fn, profiler):
+        self.collate_fn = collate_fn
+        self.profiler = profiler
+
+    def __call__(self, batch):
+        with self.profiler.stage('collate'):
+            return self.collate_fn(batch)
+
+
+def aggregate_memory_report(report_dir, epoch, verbose=True) -> pd.DataFrame:
+    rows = []
+    for path in Path(report_dir).glob(f'epoch{epoch}_*.json'):
+        role = path.stem.split('_')[1]
+        with open(path) as f:
+            for stage, record in json.load(f).items():
+                rows.append(dict(role=role, stage=stage, **record))
+    if not rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(rows)
+    report = df.groupby(['role', 'stage']).agg(
+        n_processes=('count', 'size'), count=('count', 'sum'), time=('time', 'sum'), rss_max=('rss_max', 'max'),
+        rss_sum=('rss_max', 'sum'), rss_delta_max=('rss_delta_max', 'max'), peak_max=('peak_max', 'max'))
+    for col in ['rss_max', 'rss_sum', 'rss_delta_max', 'peak_max']:
+        report[col] = (report[col] / 2 ** 20).round(1)
+    report = report.rename(columns={col: f'{col}_mb' for col in ['rss_max', 'rss_sum', 'rss_delta_max', 'peak_max']})
+
+    if verbose:
+        print(f'Memory report of epoch {epoch}')
+        print(report.to_string())
+    return report
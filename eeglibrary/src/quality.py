@@ -0,0 +1,138 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+QUALITY_FLAGS = ['nan_inf', 'flat', 'clipping', 'amplitude', 'singular']
+# Flags that make a window bad by default. High amplitude is reported only: seizure discharges have it too
+OK_FLAGS = ['nan_inf', 'flat', 'clipping', 'singular']
+
+
+def _window_sums(x, starts, duration):
+    # Sum of x[:, s:s + duration] for every start s, computed from one cumulative sum over the recording
+    cumsum = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(x, axis=1, out=cumsum[:, 1:])
+    return cumsum[:, starts + duration] - cumsum[:, starts]  # channel x window
+
+
+def _singular_windows(values, starts, duration, eps, chunk_size=256):
+    singular = np.zeros(len(starts), dtype=bool)
+    offsets = np.arange(duration)
+    for i in range(0, len(starts), chunk_size):
+        chunk = starts[i:i + chunk_size]
+        windows = values[:, chunk[:, None] + offsets].transpose(1, 0, 2)  # window x channel x time
+        windows = windows - windows.mean(axis=2, keepdims=True)
+        cov = windows @ windows.transpose(0, 2, 1)
+        std = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / (std[:, :, None] * std[:, None, :])
+        finite = np.isfinite(corr).all(axis=(1, 2))
+        singular[i:i + chunk_size] = ~finite
+        if finite.any():
+            eig_values = np.linalg.eigvalsh(corr[finite])
+            singular[i:i + chunk_size][finite] = eig_values[:, 0] <= eps * corr.shape[1]
+    return singular
+
+
+def _run_ends(stuck, run) -> np.ndarray:
+    # True where the last run - 1 samples all repeat their predecessor, i.e. run samples of one value end there
+    cumsum = np.zeros((stuck.shape[0], stuck.shape[1] + 1))
+    np.cumsum(stuck, axis=1, out=cumsum[:, 1:])
+    ends = np.zeros(stuck.shape, dtype=bool)
+    ends[:, run - 2:] = cumsum[:, run - 1:] - cumsum[:, :stuck.shape[1] - run + 2] == run - 1
+    return ends
+
+
+def scan_windows(values, starts, duration, flat_thresh=1e-12, clip_tol=1e-3, clip_run=25, n_mad=20.0, amp_ratio=0.1,
+                 corr_eps=1e-10, ok_flags=OK_FLAGS) -> pd.DataFrame:
+    """
+    Flags every window of one recording in a single pass over values (channel x time).
+    - nan_inf: any NaN or Inf
+    - flat: a channel with (almost) zero variance in the window
+    - clipping: a channel is stuck at one value for clip_run samples at its rail (max absolute value). A clean wave
+      only touches its peak, an amplifier at its limit holds it
+    - amplitude: over amp_ratio of a channel's samples are further than n_mad median absolute deviations from the
+      channel median
+    - singular: the channel correlation matrix is singular, which makes np.linalg.eig fail in preprocess
+    ok: none of ok_flags is set
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    assert starts.size == 0 or starts.max() + duration <= values.shape[1]
+
+    finite = np.isfinite(values)
+    clean = np.where(finite, values, 0.0).astype(np.float64)
+    n_nonfinite = _window_sums((~finite).astype(np.float64), starts, duration)
+
+    median = np.median(clean, axis=1, keepdims=True)
+    clean -= median
+    s1 = _window_sums(clean, starts, duration)
+    s2 = _window_sums(clean ** 2, starts, duration)
+    var = np.maximum(s2 / duration - (s1 / duration) ** 2, 0.0)
+
+    abs_values = np.abs(clean)
+    rail = abs_values.max(axis=1, keepdims=True)
+    at_rail = (abs_values >= rail * (1 - clip_tol)) & (rail > 0)
+    stuck = np.zeros(clean.shape, dtype=bool)
+    stuck[:, 1:] = at_rail[:, 1:] & at_rail[:, :-1] & (clean[:, 1:] == clean[:, :-1])
+    n_clipped = _window_sums(_run_ends(stuck, clip_run), starts, duration)
+
+    mad = np.median(abs_values, axis=1, keepdims=True)
+    n_outlier = _window_sums((abs_values > n_mad * mad) & (mad > 0), starts, duration)
+
+    flags = pd.DataFrame({
+        'start': starts,
+        'nan_inf': (n_nonfinite > 0).any(axis=0),
+        'flat': (var <= flat_thresh).any(axis=0),
+        'clipping': (n_clipped > 0).any(axis=0),
+        'amplitude': (n_outlier > amp_ratio * duration).any(axis=0),
+    })
+
+    flags['singular'] = False
+    candidates = ~(flags['nan_inf'] | flags['flat']).values
+    if candidates.any():
+        flags.loc[candidates, 'singular'] = _singular_windows(clean, starts[candidates], duration, corr_eps)
+
+    flags['ok'] = ~flags[list(ok_flags)].any(axis=1)
+    return flags
+
+
+def scan_eeg(eeg, window_size=0.5, window_stride='same', padding='same') -> pd.DataFrame:
+    # Windows in the same order as EEG.split() and EEG.split_and_save()
+    n_eeg, window_stride, padding = eeg._validate_values(window_size, window_stride, padding)
+    starts = (np.arange(n_eeg) * eeg.sr * window_stride).astype(np.int64)
+    return scan_windows(eeg.values, starts, int(window_size * eeg.sr))
+
+
+def quality_mask_path(manifest_path) -> Path:
+    return Path(manifest_path).with_suffix('.quality.npy')
+
+
+def save_quality_mask(manifest_path, mask):
+    np.save(quality_mask_path(manifest_path), np.asarray(mask, dtype=bool))
+
+
+def load_quality_mask(manifest_path):
+    path = quality_mask_path(manifest_path)
+    if not path.is_file():
+        return None
+    return np.load(path)
+
+
+def scan_manifest(manifest_path, n_jobs=-1, **scan_kwargs):
+    # For manifests made before the scan existed: every window is scanned on its own and the mask is saved
+    from joblib import Parallel, delayed
+    from eeglibrary.src.eeg_parser import parse_eeg
+    from eeglibrary.src.resources import joblib_context, resolve_n_jobs
+
+    def scan_(path):
+        eeg = parse_eeg(path)
+        return scan_windows(eeg.values, [0], eeg.values.shape[1], **scan_kwargs)['ok'].iloc[0]
+
+    paths = pd.read_csv(manifest_path, header=None).values[:, 0]
+    # Under a ResourcePlan (or in a fold or search worker) the pool uses the plan's jobs and threads, not every core
+    n_jobs = resolve_n_jobs(n_jobs)
+    with joblib_context(n_jobs):
+        mask = Parallel(n_jobs=n_jobs, verbose=0)([delayed(scan_)(path) for path in paths])
+    save_quality_mask(manifest_path, mask)
+    return np.array(mask, dtype=bool)
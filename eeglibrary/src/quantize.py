@@ -0,0 +1,164 @@
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+
+QUANTIZED_SUFFIX = '_int8.pt'
+MODES = ['auto', 'dynamic', 'static']
+DYNAMIC_LAYERS = {nn.Linear, nn.LSTM, nn.GRU, nn.RNN}
+
+
+def quantized_path(model_path) -> str:
+    model_path = Path(model_path)
+    return str(model_path.with_name(f'{model_path.stem}{QUANTIZED_SUFFIX}'))
+
+
+def is_quantized_path(model_path) -> bool:
+    return str(model_path).endswith(QUANTIZED_SUFFIX)
+
+
+def _has_conv(model):
+    return any(isinstance(module, (nn.Conv1d, nn.Conv2d, nn.Conv3d)) for module in model.modules())
+
+
+def _inputs_of(batch):
+    # Inputs of a (inputs, labels) batch or an EEGBatch
+    return batch if isinstance(batch, torch.Tensor) else next(iter(batch))
+
+
+def quantize_dynamic(model):
+    # int8 weights of Linear and RNN layers, activations quantized on the fly
+    return torch.ao.quantization.quantize_dynamic(model, DYNAMIC_LAYERS, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_loader, n_batches=10, backend='x86'):
+    """
+    int8 weights and activations of conv and linear layers (FX graph mode). Activation ranges are calibrated on
+    n_batches of calibration_loader. Layers FX leaves in float (e.g. RNN) are quantized dynamically afterwards.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    example = _inputs_of(next(iter(calibration_loader))).float()
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), (example,))
+    with torch.no_grad():
+        for i, batch in enumerate(calibration_loader):
+            if i >= n_batches:
+                break
+            prepared(_inputs_of(batch).float())
+    return quantize_dynamic(convert_fx(prepared))
+
+
+def quantize_model(model, mode='auto', calibration_loader=None, n_batches=10):
+    """
+    CPU int8 copy of a float model in eval mode.
+    mode: 'dynamic', 'static' (needs calibration_loader), or 'auto', which is static for models with conv layers and
+    falls back to dynamic if the model cannot be traced.
+    """
+    assert mode in MODES, f'mode must be one of {MODES}'
+    model = model.cpu().float().eval()
+    if mode == 'dynamic' or (mode == 'auto' and (calibration_loader is None or not _has_conv(model))):
+        return quantize_dynamic(model)
+    try:
+        return quantize_static(model, calibration_loader, n_batches)
+    except Exception as e:
+        if mode == 'static':
+            raise
+        print(f'Static quantization failed ({type(e).__name__}: {e}), use dynamic quantization')
+        return quantize_dynamic(model)
+
+
+def save_quantized(model, path, example):
+    # TorchScript, so the file loads without the model class. Falls back to pickling the whole module
+    try:
+        with torch.no_grad():
+            torch.jit.save(torch.jit.trace(model, example.float()), path)
+    except Exception as e:
+        print(f'TorchScript export failed ({type(e).__name__}), save the module with torch.save')
+        torch.save(model, path)
+
+
+def load_quantized(path):
+    try:
+        model = torch.jit.load(path, map_location='cpu')
+    except RuntimeError:
+        model = torch.load(path, map_location='cpu', weights_only=False)
+    return model.eval()
+
+
+def model_size_mb(model) -> float:
+    buffer = io.BytesIO()
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, buffer)
+    else:
+        torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1e6
+
+
+def evaluate(model, dataloader, n_batches=None, n_threads=None) -> dict:
+    # Accuracy, latency per batch and windows/sec on CPU
+    if n_threads:
+        torch.set_num_threads(n_threads)
+    n_correct, n_windows, elapsed, n_done = 0, 0, 0.0, 0
+    with torch.no_grad():
+        for i, (inputs, labels) in enumerate(dataloader):
+            if n_batches is not None and i >= n_batches:
+                break
+            inputs = inputs.float().cpu()
+            start = time.perf_counter()
+            outputs = model(inputs)
+            elapsed += time.perf_counter() - start
+            n_correct += (outputs.argmax(dim=1) == torch.as_tensor(labels)).sum().item()
+            n_windows += inputs.size(0)
+            n_done += 1
+    return dict(accuracy=n_correct / max(n_windows, 1), latency_ms=elapsed / max(n_done, 1) * 1000,
+                windows_per_sec=n_windows / elapsed if elapsed else np.nan)
+
+
+def compare_models(models, dataloader, n_batches=None) -> pd.DataFrame:
+    # models: {name: model}. One row per model with accuracy, latency, throughput and serialized size
+    rows = []
+    for name, model in models.items():
+        rows.append(dict(model=name, **evaluate(model, dataloader, n_batches), size_mb=model_size_mb(model)))
+    report = pd.DataFrame(rows)
+    base = report.iloc[0]
+    report['speedup'] = report['windows_per_sec'] / base['windows_per_sec']
+    report['accuracy_diff'] = report['accuracy'] - base['accuracy']
+    return report
+
+
+def main(args, class_names):
+    # Exports args.model_path as int8 next to it and writes a float vs int8 report (.csv) on the test manifest
+    from eeglibrary.src.ensemble import load_model
+    from eeglibrary.utils import init_seed, set_dataloader, set_eeg_conf
+
+    init_seed(args)
+    eeg_conf = set_eeg_conf(args)
+    model, numpy = load_model(args, class_names, eeg_conf, 'cpu')
+    assert not numpy, 'Only NN models can be quantized'
+
+    def label_func(path):
+        return path[-8:-4]
+
+    calibration_loader = set_dataloader(args, eeg_conf, class_names, 'train', label_func, device='cpu')
+    test_loader = set_dataloader(args, eeg_conf, class_names, 'test', label_func, device='cpu')
+    quantized = quantize_model(model, args.quantize_mode, calibration_loader, args.calibration_batches)
+
+    path = quantized_path(args.model_path)
+    save_quantized(quantized, path, _inputs_of(next(iter(test_loader))))
+    report = compare_models({'float32': model, 'int8': load_quantized(path)}, test_loader, args.report_batches)
+    print(report)
+    report.to_csv(Path(path).with_suffix('.csv'), index=False)
+    return path, report
+
+
+if __name__ == '__main__':
+    from eeglibrary.utils import quantize_args
+    args = quantize_args().parse_args()
+    class_names = ['null', 'bckg', 'seiz']
+    main(args, class_names)
@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+THREAD_ENVS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+               'VECLIB_MAXIMUM_THREADS']
+
+
+def available_cores() -> int:
+    # Cores this process may run on, which is less than cpu_count() under taskset or a container cpuset
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def limit_threads(n_threads):
+    """
+    Limits BLAS/OpenMP and torch intra-op threads of this process. The environment variables reach processes started
+    later. Pools of libraries already loaded (e.g. in a forked DataLoader worker) are limited through threadpoolctl.
+    torch is limited only if it is loaded, so numpy-only workers do not pay for importing it.
+    """
+    for env in THREAD_ENVS:
+        os.environ[env] = str(n_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(n_threads)
+    except ImportError:
+        pass
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(n_threads)
+
+
+class WorkerInit:
+    # worker_init_fn of DataLoader. Limits the threads of every worker, then calls the original worker_init_fn
+    def __init__(self, n_threads=1, worker_init_fn=None):
+        self.n_threads = n_threads
+        self.worker_init_fn = worker_init_fn
+
+    def __call__(self, worker_id):
+        limit_threads(self.n_threads)
+        if self.worker_init_fn is not None:
+            self.worker_init_fn(worker_id)
+
+
+class ResourcePlan:
+    """
+    Splits the cores between DataLoader workers and the main process, so that the layers together use each core once.
+    n_workers: DataLoader workers, each limited to worker_threads BLAS/FFT/torch threads. None gives half the cores.
+    main_threads: torch intra-op and BLAS threads of the training process, the cores left by the workers.
+    joblib_jobs: processes of pools outside of training (EEG.split, IngestPipeline, compute_stats), each with
+    worker_threads threads.
+    """
+    def __init__(self, n_cores=None, n_workers=None, worker_threads=1):
+        self.n_cores = n_cores or available_cores()
+        self.worker_threads = max(1, worker_threads)
+        if n_workers is None:
+            n_workers = self.n_cores // (2 * self.worker_threads)
+        self.n_workers = max(0, n_workers)
+        self.main_threads = max(1, self.n_cores - self.n_workers * self.worker_threads)
+        self.joblib_jobs = max(1, self.n_cores // self.worker_threads)
+
+    def apply(self):
+        # Makes this plan the current one and limits the threads of this process
+        global _PLAN
+        _PLAN = self
+        limit_threads(self.main_threads)
+        return self
+
+    @contextmanager
+    def applied(self):
+        # Current plan inside the context only, so work run in the calling process leaves its plan as it was
+        global _PLAN
+        previous = _PLAN
+        self.apply()
+        try:
+            yield self
+        finally:
+            _PLAN = previous
+
+    def worker_init_fn(self, worker_init_fn=None):
+        return WorkerInit(self.worker_threads, worker_init_fn)
+
+    def to_dict(self):
+        return dict(n_cores=self.n_cores, n_workers=self.n_workers, worker_threads=self.worker_threads,
+                    main_threads=self.main_threads, joblib_jobs=self.joblib_jobs)
+
+    def __repr__(self):
+        return f'ResourcePlan({self.to_dict()})'
+
+
+_PLAN = None
+
+
+def current_plan():
+    # The applied ResourcePlan, or None if no plan was applied
+    return _PLAN
+
+
+def resolve_n_jobs(n_jobs=-1) -> int:
+    # n_jobs=-1 means all available cores. Under an applied plan it means the plan's joblib_jobs
+    if n_jobs > 0:
+        return n_jobs
+    return _PLAN.joblib_jobs if _PLAN is not None else available_cores()
+
+
+def worker_threads(n_jobs) -> int:
+    # Threads of each of n_jobs worker processes: worker_threads of the applied plan, or an equal share of the cores
+    if _PLAN is not None:
+        return _PLAN.worker_threads
+    return max(1, available_cores() // n_jobs)
+
+
+@contextmanager
+def joblib_context(n_jobs):
+    # joblib pools inside this context limit each of their n_jobs processes to worker_threads(n_jobs) threads
+    from joblib import parallel_backend
+    with parallel_backend('loky', inner_max_num_threads=worker_threads(n_jobs)):
+        yield
+
+
+def candidate_plans(n_cores=None, max_worker_threads=2) -> list:
+    # Worker counts from 0 to the number of cores in powers of 2, with 1 to max_worker_threads threads each
+    n_cores = n_cores or available_cores()
+    plans = []
+    for worker_threads in range(1, max_worker_threads + 1):
+        n_workers = 0
+        while n_workers * worker_threads < n_cores:
+            plans.append(ResourcePlan(n_cores, n_workers, worker_threads))
+            n_workers = 1 if n_workers == 0 else n_workers * 2
+    return plans
+
+
+def benchmark_plans(dataset, model=None, batch_size=32, n_batches=20, plans=None, device='cpu'):
+    """
+    Measures samples/sec of loading batches from dataset (and a forward pass of model, if given) for every plan.
+    Returns a DataFrame sorted from the fastest plan. The thread limits of this process are restored afterwards.
+    """
+    import pandas as pd
+    import torch
+    from torch.utils.data import DataLoader
+
+    plans = plans or candidate_plans()
+    previous, main_threads = _PLAN, torch.get_num_threads()
+    # Forward passes run in eval mode, so dropout and batch norm statistics of the model are left untouched
+    training = model.training if model is not None else False
+    if model is not None:
+        model.eval()
+    results = []
+    try:
+        for plan in plans:
+            plan.apply()
+            dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=plan.n_workers,
+                                    worker_init_fn=plan.worker_init_fn(), drop_last=True)
+            n_samples, start = 0, None
+            # The first batch pays for starting workers, so timing starts after it
+            for i, batch in enumerate(dataloader):
+                if i == 0:
+                    start = time.time()
+                    continue
+                inputs = batch[0] if isinstance(batch, (list, tuple)) else batch
+                if model is not None:
+                    with torch.no_grad():
+                        model(inputs.to(device))
+                n_samples += len(inputs)
+                if i >= n_batches:
+                    break
+            elapsed = time.time() - start if start else float('nan')
+            results.append(dict(**plan.to_dict(), samples_per_sec=n_samples / elapsed if elapsed else 0.0))
+            print(results[-1])
+    finally:
+        limit_threads(main_threads)
+        globals()['_PLAN'] = previous
+        if model is not None:
+            model.train(training)
+    return pd.DataFrame(results).sort_values('samples_per_sec', ascending=False).reset_index(drop=True)
+
+
+def best_plan(results) -> ResourcePlan:
+    # Fastest plan of benchmark_plans()
+    best = results.iloc[0]
+    return ResourcePlan(int(best['n_cores']), int(best['n_workers']), int(best['worker_threads']))
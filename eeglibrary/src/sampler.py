@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data.sampler import Sampler
+
+
+def recording_blocks(path_list, block_size=0) -> np.ndarray:
+    """
+    Block id of every item of EEGDataSet.path_list. Items of one recording (same directory) form a block,
+    cut into blocks of block_size consecutive items if block_size > 0.
+    """
+    recordings = [str(Path(list(paths)[0]).parent) for paths, label in path_list]
+    _, recording_ids = np.unique(recordings, return_inverse=True)
+    if not block_size:
+        return recording_ids
+
+    positions = np.zeros(len(recording_ids), dtype=np.int64)
+    counts = {}
+    for i, recording_id in enumerate(recording_ids):
+        positions[i] = counts.get(recording_id, 0)
+        counts[recording_id] = positions[i] + 1
+    _, block_ids = np.unique(np.stack([recording_ids, positions // block_size]), axis=1, return_inverse=True)
+    return block_ids.ravel()
+
+
+class LocalityWeightedSampler(Sampler):
+    """
+    Draws num_samples items with the same class weights as WeightedRandomSampler, then orders them so that items of
+    one block are read together. Blocks come in random order.
+    locality: 1.0 reads blocks one by one, 0.0 is the fully random order of WeightedRandomSampler.
+    shuffle_within: shuffle items inside a block, or read them in manifest (file) order.
+    """
+    def __init__(self, weights, num_samples, block_ids, locality=1.0, shuffle_within=True, replacement=True,
+                 seed=0):
+        assert 0.0 <= locality <= 1.0, 'locality must be in [0, 1]'
+        self.weights = torch.as_tensor(weights, dtype=torch.double).view(-1)
+        self.num_samples = num_samples
+        self.block_ids = np.asarray(block_ids)
+        self.locality = locality
+        self.shuffle_within = shuffle_within
+        self.replacement = replacement
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+        self._current = (0, 0)
+
+    def set_epoch(self, epoch):
+        # Same epoch gives the same order, so an interrupted epoch can be resumed. __iter__ advances the epoch
+        self.epoch = epoch
+
+    def order(self) -> np.ndarray:
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        indices = torch.multinomial(self.weights, self.num_samples, self.replacement, generator=generator).numpy()
+        rng = np.random.RandomState((self.seed + self.epoch) % 2 ** 32)
+
+        _, blocks = np.unique(self.block_ids[indices], return_inverse=True)
+        block_rank = rng.permutation(blocks.max() + 1)[blocks] if len(blocks) else blocks
+        if self.shuffle_within:
+            within = rng.uniform(size=len(indices))
+        else:
+            within = np.argsort(np.argsort(indices, kind='stable'), kind='stable') / max(len(indices), 1)
+        noise = rng.uniform(size=len(indices)) * (blocks.max() + 1 if len(blocks) else 1)
+
+        key = self.locality * (block_rank + within) + (1 - self.locality) * noise
+        return indices[np.argsort(key, kind='stable')]
+
+    def state_dict(self, n_consumed=None):
+        # Position after n_consumed items of the running epoch. None means the start of the next epoch
+        if n_consumed is None:
+            return {'epoch': self.epoch, 'start': self.start, 'seed': self.seed}
+        epoch, start = self._current
+        return {'epoch': epoch, 'start': start + n_consumed, 'seed': self.seed}
+
+    def load_state_dict(self, state):
+        # The next iteration replays the saved epoch from the saved position
+        self.epoch, self.start, self.seed = state['epoch'], state['start'], state['seed']
+
+    def __iter__(self):
+        order = self.order()[self.start:]
+        self._current = (self.epoch, self.start)
+        self.epoch += 1
+        self.start = 0
+        return iter(order.tolist())
+
+    def __len__(self):
+        return self.num_samples - self.start
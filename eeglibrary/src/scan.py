@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.ensemble import Ensemble
+
+
+def window_starts(n_samples, window, stride) -> np.ndarray:
+    # Start samples of every full window
+    if n_samples < window:
+        return np.zeros(0, dtype=np.int64)
+    return np.arange(0, n_samples - window + 1, stride, dtype=np.int64)
+
+
+def iter_window_batches(values, window, stride, batch_size):
+    """
+    Yields (starts, batch x channel x window) of strided windows. values is channel x time, a numpy array or a lazy
+    recording (e.g. H5Values); only the samples covered by one batch are read at a time.
+    """
+    starts = window_starts(values.shape[1], window, stride)
+    for i in range(0, len(starts), batch_size):
+        batch_starts = starts[i:i + batch_size]
+        chunk = np.asarray(values[:, batch_starts[0]:batch_starts[-1] + window])
+        windows = sliding_window_view(chunk, window, axis=1)[:, ::stride]
+        yield batch_starts, np.ascontiguousarray(windows.transpose(1, 0, 2))
+
+
+class FilteredValues:
+    """
+    Causally filtered view of a recording (channel x time) for iter_window_batches. Slices must move forward in
+    time. Every sample is filtered once by a StreamingFilter, and only samples a later slice can still read are kept.
+    """
+    def __init__(self, values, stream):
+        self.values = values
+        self.stream = stream
+        self.shape = values.shape
+        self.start = 0
+        self.buffer = np.zeros((values.shape[0], 0))
+
+    def __getitem__(self, index):
+        _, time_slice = index
+        assert time_slice.start >= self.start, 'FilteredValues must be read forward in time'
+        end = self.start + self.buffer.shape[1]
+        if time_slice.stop > end:
+            chunk = self.stream.process(np.asarray(self.values[:, end:time_slice.stop]))
+            self.buffer = np.concatenate([self.buffer, chunk], axis=1)
+        self.buffer = self.buffer[:, time_slice.start - self.start:]
+        self.start = time_slice.start
+        return self.buffer[:, :time_slice.stop - time_slice.start]
+
+
+def overlap_add(starts, probs, window, n_samples, sr, resolution_sec=1.0) -> np.ndarray:
+    """
+    Average probability of every resolution_sec bin of the recording. Each window adds its probability to the samples
+    it covers, and every sample is divided by the number of windows covering it. Bins no window covers are NaN.
+    """
+    total = np.zeros(n_samples + 1)
+    counts = np.zeros(n_samples + 1)
+    np.add.at(total, starts, probs)
+    np.add.at(total, starts + window, -probs)
+    np.add.at(counts, starts, 1)
+    np.add.at(counts, starts + window, -1)
+    total, counts = np.cumsum(total)[:-1], np.cumsum(counts)[:-1]
+
+    bin_size = max(int(round(resolution_sec * sr)), 1)
+    n_bins = int(np.ceil(n_samples / bin_size))
+    edges = np.arange(0, n_bins * bin_size, bin_size)
+    bin_total, bin_counts = np.add.reduceat(total, edges), np.add.reduceat(counts, edges)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(bin_counts > 0, bin_total / bin_counts, np.nan)
+
+
+def merge_events(timeline, resolution_sec=1.0, thresh=0.5, min_duration=0.0, min_gap=0.0) -> pd.DataFrame:
+    """
+    Events where the timeline is at least thresh. Events closer than min_gap seconds are merged, then events shorter
+    than min_duration seconds are dropped. Returns onset, offset and duration in seconds with max and mean probability.
+    """
+    columns = ['onset', 'offset', 'duration', 'max_prob', 'mean_prob']
+    active = np.nan_to_num(timeline, nan=0.0) >= thresh
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    onsets, offsets = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(onsets):
+        return pd.DataFrame(columns=columns)
+
+    # Merge runs separated by gaps shorter than min_gap
+    keep = np.concatenate([[True], (onsets[1:] - offsets[:-1]) * resolution_sec >= min_gap])
+    onsets, offsets = onsets[keep], offsets[np.concatenate([keep[1:], [True]])]
+
+    events = []
+    for onset, offset in zip(onsets, offsets):
+        if (offset - onset) * resolution_sec < min_duration:
+            continue
+        probs = timeline[onset:offset]
+        events.append([onset * resolution_sec, offset * resolution_sec, (offset - onset) * resolution_sec,
+                       np.nanmax(probs), np.nanmean(probs)])
+    return pd.DataFrame(events, columns=columns)
+
+
+class RecordingScanner:
+    """
+    Scores a whole recording without splitting it into files. Strided windows are batched from memory, fed to the
+    model and the positive class probability is overlap-added into a timeline of resolution_sec bins.
+    predictor: anything with predict_proba(inputs) -> batch x class, e.g. Ensemble. Use from_model for one model.
+    transform: optional function from a window EEG to the model input, e.g. preprocessing. Without it, raw
+    windows (channel x time) are fed as they are.
+    filter_bank: optional FilterBank run causally over the whole recording in chunks before windowing, so filters
+    have no edge effects at window borders and each sample is filtered once. Matches training with causal_filter.
+    """
+    def __init__(self, predictor, window_sec=1.0, stride_sec=0.5, batch_size=32, transform=None, device='cpu',
+                 positive_class=1, resolution_sec=1.0, filter_bank=None):
+        assert 0 < stride_sec, 'stride_sec must be over 0'
+        self.predictor = predictor
+        self.window_sec = window_sec
+        self.stride_sec = stride_sec
+        self.batch_size = batch_size
+        self.transform = transform
+        self.device = device
+        self.positive_class = positive_class
+        self.resolution_sec = resolution_sec
+        self.filter_bank = filter_bank
+
+    @classmethod
+    def from_model(cls, model, numpy, n_classes, **kwargs):
+        return cls(Ensemble([(model, numpy)], n_classes), **kwargs)
+
+    @classmethod
+    def from_preprocessor(cls, predictor, preprocessor, **kwargs):
+        # Same features and normalization as EEGDataSet
+        def transform(eeg):
+            return preprocessor.normalize(preprocessor.preprocess(eeg))
+        return cls(predictor, transform=transform, **kwargs)
+
+    @staticmethod
+    def _n_samples(sec, sr) -> int:
+        # At least one sample, so a stride shorter than a sample still advances
+        return max(1, int(round(sec * sr)))
+
+    def _inputs(self, eeg, windows):
+        if self.transform is None:
+            return torch.from_numpy(windows).to(self.device)
+        xs = [self.transform(EEG(window, eeg.channel_list, self.window_sec, eeg.sr, eeg.header)) for window in windows]
+        return torch.stack([torch.as_tensor(x) for x in xs]).to(self.device)
+
+    def window_probs(self, eeg):
+        # (start samples, positive class probability) of every window
+        window, stride = self._n_samples(self.window_sec, eeg.sr), self._n_samples(self.stride_sec, eeg.sr)
+        values = FilteredValues(eeg.values, self.filter_bank.stream(eeg.sr)) if self.filter_bank else eeg.values
+        starts, probs = [], []
+        for batch_starts, windows in iter_window_batches(values, window, stride, self.batch_size):
+            proba = self.predictor.predict_proba(self._inputs(eeg, windows))
+            starts.append(batch_starts)
+            probs.append(np.asarray(proba)[:, self.positive_class])
+        if not starts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(starts), np.concatenate(probs)
+
+    def scan(self, eeg) -> np.ndarray:
+        # Probability timeline of eeg, one value per resolution_sec
+        starts, probs = self.window_probs(eeg)
+        return overlap_add(starts, probs, self._n_samples(self.window_sec, eeg.sr), eeg.values.shape[1], eeg.sr,
+                           self.resolution_sec)
+
+    def detect(self, eeg, thresh=0.5, min_duration=0.0, min_gap=0.0):
+        # (timeline, events) of eeg. See merge_events
+        timeline = self.scan(eeg)
+        return timeline, merge_events(timeline, self.resolution_sec, thresh, min_duration, min_gap)
@@ -0,0 +1,143 @@
+import itertools
+import math
+import time
+from pathlib import Path
+
+import pandas as pd
+from joblib import Parallel, delayed, parallel_backend
+
+from eeglibrary.src.feature_cache import preprocess_key
+from eeglibrary.src.resources import ResourcePlan, available_cores
+
+
+# search_args() options which are fixed for every trial, not searched
+NOT_SEARCHED = ['sub_path', 'model_path', 'train_manifest', 'val_manifest', 'test_manifest', 'log_dir', 'epochs',
+                'gpu_id']
+
+
+def _cast(value):
+    for type_ in (int, float):
+        try:
+            return type_(value)
+        except ValueError:
+            continue
+    return value
+
+
+def parse_search_space(args, sep=',') -> dict:
+    # search_args() keeps every option as str. Comma separated values are the candidates to search
+    space = {}
+    for key, value in vars(args).items():
+        if key in NOT_SEARCHED or value is None:
+            continue
+        space[key] = [_cast(v) for v in str(value).split(sep)]
+    return space
+
+
+def expand_grid(space) -> list:
+    keys = list(space.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[key] for key in keys])]
+
+
+def _run_trial(trial_func, trial_id, params, budget, n_threads):
+    start = time.time()
+    try:
+        # Joblib pools of the trial resolve n_jobs=-1 to its n_threads cores
+        with ResourcePlan(n_threads, n_workers=0).applied():
+            score = trial_func(params, budget)
+        status = 'done'
+    except Exception as e:
+        print(f'trial {trial_id} failed: {e}')
+        score, status = math.nan, 'failed'
+    return dict(trial_id=trial_id, budget=budget, score=score, status=status, time=time.time() - start, **params)
+
+
+class SuccessiveHalvingSearch:
+    """
+    Runs trials in a process pool and stops unpromising ones early.
+    trial_func(params, budget) trains with params for budget epochs and returns the validation score.
+    params has 'cache_dir' and 'model_path' set per trial, so trials sharing a preprocessing config share features
+    and a trial promoted to the next rung can resume from its own model file.
+    """
+    def __init__(self, trial_func, space, min_epochs=2, max_epochs=30, eta=3, n_jobs=-1, n_threads=1,
+                 cache_root='cache/features', model_dir='model/search', result_path='output/search.csv',
+                 mode='min'):
+        assert mode in ['min', 'max']
+        self.trial_func = trial_func
+        self.trials = expand_grid(space)
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.eta = eta
+        self.n_threads = n_threads
+        self.n_jobs = n_jobs if n_jobs > 0 else max(1, available_cores() // n_threads)
+        self.cache_root = cache_root
+        self.model_dir = model_dir
+        self.result_path = result_path
+        self.mode = mode
+
+        for i, params in enumerate(self.trials):
+            params['cache_dir'] = str(Path(cache_root))
+            params['model_path'] = str(Path(model_dir) / f'trial_{i}.pth')
+
+    def budgets(self) -> list:
+        budgets = []
+        budget = self.min_epochs
+        while budget < self.max_epochs:
+            budgets.append(budget)
+            budget *= self.eta
+        budgets.append(self.max_epochs)
+        return budgets
+
+    def _waves(self, trial_ids, rung) -> list:
+        """
+        Groups of trials run one after the other. Trials of a wave run concurrently, so in the first rung one trial
+        per preprocessing config runs first and fills the feature cache, and the trials sharing its features follow.
+        Later rungs find every feature cached and run in one wave.
+        """
+        trial_ids = sorted(trial_ids, key=lambda i: preprocess_key(self.trials[i]))
+        if rung > 0:
+            return [trial_ids]
+        leaders = {}
+        for i in trial_ids:
+            leaders.setdefault(preprocess_key(self.trials[i]), i)
+        followers = [i for i in trial_ids if i not in leaders.values()]
+        return [wave for wave in [list(leaders.values()), followers] if wave]
+
+    def run(self) -> pd.DataFrame:
+        Path(self.model_dir).mkdir(exist_ok=True, parents=True)
+        Path(self.result_path).parent.mkdir(exist_ok=True, parents=True)
+        alive = list(range(len(self.trials)))
+        results = []
+
+        for rung, budget in enumerate(self.budgets()):
+            print(f'rung {rung}: {len(alive)} trials with {budget} epochs')
+            rung_results = []
+            with parallel_backend('loky', inner_max_num_threads=self.n_threads):
+                for wave in self._waves(alive, rung):
+                    rung_results.extend(Parallel(n_jobs=self.n_jobs, verbose=0)(
+                        [delayed(_run_trial)(self.trial_func, i, self.trials[i], budget, self.n_threads)
+                         for i in wave]))
+
+            rung_df = pd.DataFrame(rung_results)
+            rung_df['rung'] = rung
+            rung_df = rung_df.sort_values('score', ascending=(self.mode == 'min'), na_position='last')
+            n_keep = max(1, len(alive) // self.eta)
+            rung_df['promoted'] = False
+            rung_df.iloc[:n_keep, rung_df.columns.get_loc('promoted')] = (rung_df['status'].iloc[:n_keep] == 'done').values
+            alive = rung_df[rung_df['promoted']]['trial_id'].tolist()
+
+            results.append(rung_df)
+            pd.concat(results, sort=False).to_csv(self.result_path, index=False)
+            if not alive:
+                break
+
+        return pd.concat(results, sort=False)
+
+
+def run_search(args, trial_func, min_epochs=2, eta=3, n_jobs=-1, n_threads=1, cache_root='cache/features'):
+    # args: search_args()
+    space = parse_search_space(args)
+    search = SuccessiveHalvingSearch(trial_func, space, min_epochs=min_epochs, max_epochs=args.epochs, eta=eta,
+                                     n_jobs=n_jobs, n_threads=n_threads, cache_root=cache_root,
+                                     model_dir=str(Path(args.model_path).parent), result_path=args.sub_path)
+    return search.run()
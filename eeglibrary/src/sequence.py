@@ -0,0 +1,127 @@
+import numbers
+
+import numpy as np
+import torch
+from torch import nn
+from torch.nn.utils.rnn import pack_padded_sequence, pad_sequence
+from torch.utils.data.sampler import Sampler
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batches of items with similar lengths, so padding and packing waste little compute.
+    Items are drawn with weights (like WeightedRandomSampler) or as a permutation, split into pools of
+    pool_batches batches, sorted by length inside a pool and cut into batches. Batch order is shuffled.
+    """
+    def __init__(self, lengths, batch_size, weights=None, num_samples=None, pool_batches=50, drop_last=True,
+                 seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.weights = None if weights is None else torch.as_tensor(weights, dtype=torch.double).view(-1)
+        self.num_samples = num_samples or len(self.lengths)
+        self.pool_batches = pool_batches
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batches(self) -> list:
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        if self.weights is not None:
+            indices = torch.multinomial(self.weights, self.num_samples, True, generator=generator).numpy()
+        else:
+            indices = torch.randperm(len(self.lengths), generator=generator).numpy()[:self.num_samples]
+
+        pool_size = self.batch_size * self.pool_batches
+        batches = []
+        for start in range(0, len(indices), pool_size):
+            pool = indices[start:start + pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='stable')]
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+        if self.drop_last:
+            batches = [batch for batch in batches if len(batch) == self.batch_size]
+        order = torch.randperm(len(batches), generator=generator).numpy()
+        return [batches[i].tolist() for i in order]
+
+    def __iter__(self):
+        batches = self.batches()
+        self.epoch += 1
+        return iter(batches)
+
+    def __len__(self):
+        if self.drop_last:
+            n_pools, rest = divmod(self.num_samples, self.batch_size * self.pool_batches)
+            return n_pools * self.pool_batches + rest // self.batch_size
+        return int(np.ceil(self.num_samples / self.batch_size))
+
+
+class SequenceBatch:
+    """
+    Batch of variable-length sequences as a PackedSequence, with labels or paths like EEGBatch.
+    Sequences keep the order of the batch; RNNs return hidden states in that order too.
+    """
+    __slots__ = ['inputs', 'labels', 'paths']
+
+    def __init__(self, inputs, labels=None, paths=None):
+        self.inputs = inputs
+        self.labels = labels
+        self.paths = paths
+
+    def __iter__(self):
+        yield self.inputs
+        yield self.labels if self.labels is not None else self.paths
+
+    def __len__(self):
+        return len(self.labels) if self.labels is not None else len(self.paths)
+
+    def pin_memory(self):
+        labels = self.labels.pin_memory() if isinstance(self.labels, torch.Tensor) else self.labels
+        return SequenceBatch(self.inputs.pin_memory(), labels, self.paths)
+
+
+class PackedCollate:
+    # Items (sequence x features, meta) are packed without sorting the batch, padding is never computed
+    def __call__(self, batch):
+        with_meta = isinstance(batch[0], tuple)
+        xs = [torch.as_tensor(item[0] if with_meta else item) for item in batch]
+        lengths = torch.tensor([len(x) for x in xs])
+        inputs = pack_padded_sequence(pad_sequence(xs, batch_first=True), lengths, batch_first=True,
+                                      enforce_sorted=False)
+        if not with_meta:
+            return inputs
+
+        meta = [item[1] for item in batch]
+        if isinstance(meta[0], numbers.Integral):
+            return SequenceBatch(inputs, labels=torch.from_numpy(np.asarray(meta, dtype=np.int64)))
+        if isinstance(meta[0], numbers.Number):
+            return SequenceBatch(inputs, labels=torch.from_numpy(np.asarray(meta)))
+        if isinstance(meta[0], str):
+            return SequenceBatch(inputs, labels=np.array(meta))
+        # Items have different numbers of paths, so paths is an object array of lists
+        paths = np.empty(len(meta), dtype=object)
+        paths[:] = [list(item_paths) for item_paths in meta]
+        return SequenceBatch(inputs, paths=paths)
+
+
+class WindowSequenceRNN(nn.Module):
+    """
+    Classifies a sequence of window features (PackedSequence of sequence x n_features) by the last hidden state.
+    Only real windows are computed, never padding.
+    """
+    def __init__(self, n_features, n_classes, rnn_type='gru', hidden_size=400, n_layers=3, bidirectional=True):
+        super().__init__()
+        rnn = {'rnn': nn.RNN, 'gru': nn.GRU, 'lstm': nn.LSTM}[rnn_type]
+        self.rnn = rnn(n_features, hidden_size, n_layers, batch_first=True, bidirectional=bidirectional)
+        self.fc = nn.Linear(hidden_size * (2 if bidirectional else 1), n_classes)
+
+    def forward(self, x):
+        if isinstance(x, torch.Tensor):
+            # Batch of equal-length sequences (batch x sequence x n_features)
+            x = pack_padded_sequence(x, torch.full((x.size(0),), x.size(1)), batch_first=True)
+        _, hidden = self.rnn(x.float())
+        hidden = hidden[0] if isinstance(hidden, tuple) else hidden
+        n_directions = 2 if self.rnn.bidirectional else 1
+        last = hidden.view(self.rnn.num_layers, n_directions, hidden.size(1), -1)[-1]
+        return self.fc(last.transpose(0, 1).reshape(hidden.size(1), -1))
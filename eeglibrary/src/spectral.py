@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy import signal
+
+
+BANDS = OrderedDict(delta=(0.5, 4.0), theta=(4.0, 8.0), alpha=(8.0, 13.0), beta=(13.0, 30.0), gamma=(30.0, None))
+
+
+class Spectrum:
+    """
+    Spectra of one window (channel x time), computed once and shared by every feature extractor.
+    The rFFT is computed on first use, and spectrograms are memoized by their parameters.
+    """
+    def __init__(self, values, sr, rfft=None):
+        self.values = np.asarray(values)
+        self.sr = sr
+        self._rfft = rfft
+        self._amplitude = None
+        self._spectrograms = {}
+
+    @property
+    def n_samples(self):
+        return self.values.shape[-1]
+
+    @property
+    def rfft(self):
+        if self._rfft is None:
+            self._rfft = np.fft.rfft(self.values, axis=-1)
+        return self._rfft
+
+    @property
+    def freqs(self):
+        return np.fft.rfftfreq(self.n_samples, d=1.0 / self.sr)
+
+    @property
+    def amplitude(self):
+        if self._amplitude is None:
+            self._amplitude = np.absolute(self.rfft)
+        return self._amplitude
+
+    @property
+    def power(self):
+        return self.amplitude ** 2
+
+    def spectrogram(self, **kwargs):
+        # Same arguments as scipy.signal.spectrogram except fs. Returns (freqs, times, channel x freq x time)
+        key = tuple(sorted(kwargs.items()))
+        if key not in self._spectrograms:
+            self._spectrograms[key] = signal.spectrogram(self.values, fs=self.sr, axis=-1, **kwargs)
+        return self._spectrograms[key]
+
+    def band_powers(self, bands=BANDS, relative=False):
+        # Mean power per band: channel x band
+        freqs, power = self.freqs, self.power
+        powers = []
+        for low, high in bands.values():
+            in_band = (freqs >= low) & (freqs < (high if high is not None else np.inf))
+            powers.append(power[..., in_band].mean(axis=-1) if in_band.any() else np.zeros(power.shape[:-1]))
+        powers = np.stack(powers, axis=-1)
+        if relative:
+            powers = powers / (powers.sum(axis=-1, keepdims=True) + 1e-12)
+        return powers
+
+    def resample(self, num):
+        """
+        Fourier resampling to num samples, same result as scipy.signal.resample. The returned Spectrum already has
+        its rFFT, so features of the resampled window need no further FFT.
+        """
+        n = self.n_samples
+        X = self.rfft
+        Y = np.zeros((*X.shape[:-1], num // 2 + 1), dtype=X.dtype)
+        m = min(num, n)
+        nyq = m // 2 + 1
+        Y[..., :nyq] = X[..., :nyq]
+        if m % 2 == 0:
+            if num < n:
+                Y[..., m // 2] *= 2.0
+            elif n < num:
+                Y[..., m // 2] *= 0.5
+        Y *= float(num) / float(n)
+
+        # irfft ignores the imaginary part of DC and Nyquist, so the spectrum of the result drops them too
+        Y[..., 0] = Y[..., 0].real
+        if num % 2 == 0:
+            Y[..., -1] = Y[..., -1].real
+        return Spectrum(np.fft.irfft(Y, num, axis=-1), self.sr * num / n, rfft=Y)
@@ -0,0 +1,111 @@
+from pathlib import Path
+
+import numpy as np
+import torch
+
+
+class RunningStats:
+    """
+    Streaming per-feature count/mean/variance/min/max. Accumulators from different workers are merged with
+    Chan's parallel algorithm, so the result equals one pass over all samples.
+    """
+    def __init__(self, count=0, mean=None, m2=None, min=None, max=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def update(self, x):
+        # x: one sample, all values are features
+        if isinstance(x, torch.Tensor):
+            x = x.numpy()
+        x = x.astype(np.float64)
+        self.merge(RunningStats(1, x, np.zeros_like(x), x, x))
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = \
+                other.count, other.mean.copy(), other.m2.copy(), other.min.copy(), other.max.copy()
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.count = count
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / max(self.count, 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def reduce(self, keep_axis=0):
+        # Merges features into one value per keep_axis, e.g. per channel of channel x freq x time features
+        axes = tuple(i for i in range(self.mean.ndim) if i != keep_axis)
+        n_per = int(np.prod([self.mean.shape[i] for i in axes]))
+        mean = self.mean.mean(axis=axes)
+        expanded = np.expand_dims(mean, axis=axes)
+        m2 = self.m2.sum(axis=axes) + self.count * ((self.mean - expanded) ** 2).sum(axis=axes)
+        return RunningStats(self.count * n_per, mean, m2, self.min.min(axis=axes), self.max.max(axis=axes))
+
+    def save(self, path):
+        Path(path).parent.mkdir(exist_ok=True, parents=True)
+        np.savez(path, count=self.count, mean=self.mean, m2=self.m2, min=self.min, max=self.max)
+
+    @classmethod
+    def load(cls, path):
+        stats = np.load(path)
+        return cls(int(stats['count']), stats['mean'], stats['m2'], stats['min'], stats['max'])
+
+    def info(self):
+        print(f'count: {self.count}')
+        print(f'max: {self.max.max()}')
+        print(f'min: {self.min.min()}')
+        print(f'mean: {self.mean.mean()}')
+        print(f'std: {self.std.mean()}')
+
+
+def _stats_of(dataset, indices):
+    stats = RunningStats()
+    for idx in indices:
+        features = dataset.load_features(idx)
+        # Variable-length items are stacks of windows, and normalization is per window
+        for x in (features if getattr(dataset, 'variable_length', False) else [features]):
+            stats.update(x)
+    return stats
+
+
+def compute_stats(dataset, n_jobs=-1) -> RunningStats:
+    # Features are computed by load_features(), so this pass also fills the dataset's feature cache
+    from joblib import Parallel, delayed
+    from eeglibrary.src.resources import joblib_context, resolve_n_jobs
+
+    n_jobs = resolve_n_jobs(n_jobs)
+    chunks = np.array_split(np.arange(len(dataset.path_list)), n_jobs)
+    with joblib_context(n_jobs):
+        partials = Parallel(n_jobs=n_jobs, verbose=0)([delayed(_stats_of)(dataset, chunk) for chunk in chunks])
+
+    stats = RunningStats()
+    for partial in partials:
+        stats.merge(partial)
+    return stats
+
+
+def fit_normalization(dataset, stats_path, n_jobs=-1) -> RunningStats:
+    # Loads stats if stats_path exists, otherwise computes them from dataset and saves them
+    if Path(stats_path).is_file():
+        stats = RunningStats.load(stats_path)
+    else:
+        stats = compute_stats(dataset, n_jobs)
+        stats.save(stats_path)
+    dataset.preprocessor.set_stats(stats)
+    return stats
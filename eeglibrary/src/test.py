@@ -1,8 +1,10 @@
 from __future__ import print_function, division
 
+import numpy as np
 import pandas as pd
 import torch
-from eeglibrary.utils import test_args
+from eeglibrary.src.ensemble import load_model, set_ensemble
+from eeglibrary.utils import init_device, init_seed, set_dataloader, set_eeg_conf, test_args
 from sklearn.metrics import accuracy_score
 from sklearn.metrics import confusion_matrix
 from tqdm import tqdm
@@ -27,8 +29,12 @@ def inference(args, model, eeg_conf, numpy, device):
             outputs = model(inputs)
             _, preds = torch.max(outputs, 1)
         pred_list.extend(preds)
-        # Transpose paths, but I don't know why dataloader outputs aukward
-        path_list.extend([list(pd.DataFrame(paths).iloc[:, i].values) for i in range(len(paths[0]))])
+        if isinstance(paths, np.ndarray):
+            # batch x n_use_eeg array from BufferedCollate
+            path_list.extend(paths.tolist())
+        else:
+            # Transpose paths, but I don't know why dataloader outputs aukward
+            path_list.extend([list(pd.DataFrame(paths).iloc[:, i].values) for i in range(len(paths[0]))])
 
     return pred_list, path_list
 
@@ -60,27 +66,29 @@ def test(args, model, eeg_conf, label_func, class_names, numpy, device):
 def main(args, class_names):
     init_seed(args)
     device = init_device(args)
-    if args.model_name in ['kneighbor', 'knn']:
-        args.model_name = 'kneighbor'
-    numpy = 'nn' not in args.model_name
 
     eeg_conf = set_eeg_conf(args)
+    # Normalized like in training. The preprocessor loads the stats saved by train.py
+    eeg_conf['stats_path'] = getattr(args, 'stats_path', None)
 
-    model = set_model(args, class_names, eeg_conf, device)
-    if numpy:
-        model.load_model_(args.model_path)
+    if args.ensemble:
+        # One data pass, every batch is fed to all members. Ensemble predicts like a numpy model
+        model, numpy = set_ensemble(args, class_names, eeg_conf, device), True
     else:
-        model.load_state_dict(torch.load(args.model_path))
-        model.eval()
+        model, numpy = load_model(args, class_names, eeg_conf, device)
     args.weight = list(map(float, args.loss_weight.split('-')))
 
     def label_func(path):
         return path[-8:-4]
 
-    if args.test:
-        test(args, model, eeg_conf, label_func, class_names, numpy, device)
-    if args.inference:
-        return inference(args, model, eeg_conf, numpy, device)
+    try:
+        if args.test:
+            test(args, model, eeg_conf, label_func, class_names, numpy, device)
+        if args.inference:
+            return inference(args, model, eeg_conf, numpy, device)
+    finally:
+        if args.ensemble:
+            model.close()
 
 
 if __name__ == '__main__':
@@ -6,17 +6,22 @@ from pathlib import Path
 import numpy as np
 import torch
 # from wrapper.models import adda
-from eeglibrary.src import test
+from eeglibrary.src.test import test
+from eeglibrary.src.augmentation import mixup_loss, set_augmentor
+from eeglibrary.src.checkpoint import CheckpointWriter, checkpoint_path, load_checkpoint
+from eeglibrary.src.profiling import MemoryProfiler, aggregate_memory_report
+from eeglibrary.src.resources import ResourcePlan, benchmark_plans, best_plan
+from eeglibrary.src.stats import fit_normalization
 from sklearn.metrics import log_loss
 from sklearn.preprocessing import OneHotEncoder
 
 
-def train_model(model, inputs, labels, phase, optimizer, criterion, type='nn', classes=None):
+def train_model(model, inputs, labels, phase, optimizer, criterion, type='nn', classes=None, mix=None):
     if 'nn' in type:
         optimizer.zero_grad()
         with torch.set_grad_enabled(phase == 'train'):
             outputs = model(inputs)
-            loss = criterion(outputs, labels)
+            loss = mixup_loss(criterion, outputs, labels, mix)
 
             if phase == 'train':
                 loss.backward()
@@ -35,21 +40,23 @@ def train_model(model, inputs, labels, phase, optimizer, criterion, type='nn', c
     return preds, loss
 
 
-def save_model(model, model_path, numpy):
+def save_model(model, model_path, numpy, writer=None):
     if numpy:
         model.save_model(model_path)
+    elif writer:
+        writer.save_state(model.state_dict(), model_path)
     else:
         torch.save(model.state_dict(), model_path)
 
 
-def update_by_epoch(args, metrics, phase, model, numpy, optimizer):
+def update_by_epoch(args, metrics, phase, model, numpy, optimizer, writer=None):
     for metric in metrics:
         best_flag = metric.average_meter[phase].update_best()
         # save model
 
         if metric.save_model and best_flag and phase == 'val':
             print("Found better validated model, saving to %s" % args.model_path)
-            save_model(model, args.model_path, numpy)
+            save_model(model, args.model_path, numpy, writer)
 
         # reset epoch average meter
         metric.average_meter[phase].reset()
@@ -86,9 +93,34 @@ def train(args, class_names, label_func, metrics):
     classes = [i for i in range(len(class_names))]
     device = init_device(args)
     eeg_conf = set_eeg_conf(args)
-    model = set_model(args, classes, eeg_conf, device)
+    memory_profile_dir = getattr(args, 'memory_profile_dir', None)
+    eeg_conf['memory_profile_dir'] = memory_profile_dir
+    eeg_conf['path_table_dir'] = getattr(args, 'path_table_dir', None)
+    profiler = MemoryProfiler(memory_profile_dir, role='main')
+    # Workers and training threads share the cores instead of each taking all of them
+    plan = ResourcePlan(getattr(args, 'n_cores', 0) or None, args.num_workers, getattr(args, 'worker_threads', 1))
+    plan.apply()
     dataloaders = {phase: set_dataloader(args, eeg_conf, class_names, phase, label_func, device='cpu')
                    for phase in ['train', 'val']}
+    if getattr(args, 'variable_length', False):
+        # Sequence models take one window's features per step
+        eeg_conf['n_window_features'] = dataloaders['train'].dataset.get_window_feature_size()
+    model = set_model(args, classes, eeg_conf, device)
+    if getattr(args, 'resource_benchmark', False):
+        results = benchmark_plans(dataloaders['train'].dataset, model if 'nn' in args.model_name else None,
+                                  args.batch_size, device=device)
+        print(results)
+        plan = best_plan(results).apply()
+        print(f'Use {plan}')
+        args.num_workers, args.worker_threads = plan.n_workers, plan.worker_threads
+        dataloaders = {phase: set_dataloader(args, eeg_conf, class_names, phase, label_func, device='cpu')
+                       for phase in ['train', 'val']}
+
+    if getattr(args, 'stats_path', None):
+        stats = fit_normalization(dataloaders['train'].dataset, args.stats_path, args.num_workers)
+        dataloaders['val'].dataset.preprocessor.set_stats(stats)
+        # Datasets made later by test() and inference() load the same stats
+        eeg_conf['stats_path'] = args.stats_path
 
     if 'nn' in args.model_name:
         parameters = model.parameters()
@@ -101,41 +133,64 @@ def train(args, class_names, label_func, metrics):
         criterion = log_loss
         numpy = True
 
+    augmentor = set_augmentor(args) if hasattr(args, 'mixup_alpha') else None
+
+    # Models and checkpoints are serialized on a background thread
+    writer = None if numpy else CheckpointWriter()
+    train_sampler = dataloaders['train'].sampler
+    resumable = hasattr(train_sampler, 'state_dict')
+    if getattr(args, 'continue_from', '') and not numpy:
+        start_epoch, start_iter = load_checkpoint(args.continue_from, model, optimizer, train_sampler, device)
+        if not resumable:
+            print('Sampler position is not saved, so the epoch restarts from the first batch')
+            start_iter = 0
+
     batch_time = AverageMeter()
     execute_time = time.time()
 
     for epoch in range(start_epoch, args.epochs):
         start_epoch_time = time.time()
+        profiler.set_epoch(epoch)
+        for phase in ['train', 'val']:
+            dataloaders[phase].dataset.profiler.set_epoch(epoch)
 
         for phase in ['train', 'val']:
             print('\n{} phase started.'.format(phase))
 
-            epoch_preds = torch.empty((len(dataloaders[phase])*args.batch_size, 1), dtype=torch.int64, device=device)
-            epoch_labels = torch.empty((len(dataloaders[phase])*args.batch_size, 1), dtype=torch.int64, device=device)
+            first_iter = start_iter if (phase == 'train' and epoch == start_epoch) else 0
+            n_iter = first_iter + len(dataloaders[phase])
+            epoch_preds = torch.empty((n_iter * args.batch_size, 1), dtype=torch.int64, device=device)
+            epoch_labels = torch.empty((n_iter * args.batch_size, 1), dtype=torch.int64, device=device)
 
             if numpy:
                 epoch_preds, epoch_labels = epoch_preds.data.numpy(), epoch_labels.data.numpy()
 
             start_time = time.time()
-            for i, (inputs, labels) in enumerate(dataloaders[phase]):
+            for i, (inputs, labels) in enumerate(dataloaders[phase], start=first_iter):
                 inputs, labels = inputs.to(device), labels.to(device)
                 # break
                 data_load_time = time.time() - start_time
                 # print('data loading time', data_load_time)
 
-                # feature scaling
-                if args.scaling:
+                # feature scaling. Packed sequences are normalized by the dataset only
+                packed = not isinstance(inputs, torch.Tensor)
+                if args.scaling and not getattr(args, 'stats_path', None) and not packed:
                     inputs = (inputs - 100).div(600)
 
-                preds, loss_value = train_model(model, inputs, labels, phase, optimizer, criterion, args.model_name,
-                                                classes)
+                mix = None
+                if augmentor and phase == 'train' and not packed:
+                    inputs, mix = augmentor(inputs, labels if not numpy else None)
+
+                with profiler.stage(f'{phase}_step'):
+                    preds, loss_value = train_model(model, inputs, labels, phase, optimizer, criterion,
+                                                    args.model_name, classes, mix)
 
                 epoch_preds[i * args.batch_size:(i + 1) * args.batch_size, 0] = preds
                 epoch_labels[i * args.batch_size:(i + 1) * args.batch_size, 0] = labels
 
                 # save loss and recall in one batch
                 for metric in metrics:
-                    metric.update(phase, loss_value, inputs.size(0), preds, labels, classes, numpy)
+                    metric.update(phase, loss_value, labels.size(0), preds, labels, classes, numpy)
 
                 if not args.silent:
                     print('Epoch: [{0}][{1}/{2}]'.format(epoch, i+1, len(dataloaders[phase])), end='\t')
@@ -144,13 +199,30 @@ def train(args, class_names, label_func, metrics):
                         print('{} {:.3f}'.format(metric.name, metric.average_meter[phase].value), end='\t')
                     print('')
 
+                if phase == 'train' and writer and args.checkpoint_per_batch and \
+                        (i + 1) % args.checkpoint_per_batch == 0:
+                    sampler_state = train_sampler.state_dict((i + 1 - first_iter) * args.batch_size) \
+                        if resumable else None
+                    writer.save(checkpoint_path(args.model_path), model, optimizer, epoch, i + 1, sampler_state)
+
                 # measure elapsed time
                 batch_time.update(time.time() - start_time)
                 start_time = time.time()
 
             if args.tensorboard:
                 record_log(tensorboard_logger, phase, metrics, epoch)
-            update_by_epoch(args, metrics, phase, model, numpy, optimizer)
+            update_by_epoch(args, metrics, phase, model, numpy, optimizer, writer)
+
+        if args.checkpoint and writer:
+            writer.save(checkpoint_path(args.model_path), model, optimizer, epoch + 1, 0,
+                        train_sampler.state_dict() if resumable else None)
+
+        if profiler.enabled:
+            profiler.flush()
+            aggregate_memory_report(memory_profile_dir, epoch)
+
+    if writer:
+        writer.close()
 
     if args.adda:
         adda(args, model, eeg_conf, label_func, class_names, criterion, device,
@@ -0,0 +1,117 @@
+import os
+import pickle
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from eeglibrary.src.eeg import EEG
+
+
+class RecordingMeta:
+    # What all windows of one recording share. Stored once per recording, not once per window
+    __slots__ = ['channel_list', 'sr', 'header']
+
+    def __init__(self, channel_list, sr, header=None):
+        self.channel_list = list(channel_list)
+        self.sr = int(sr)
+        self.header = header
+
+    @classmethod
+    def from_eeg(cls, eeg):
+        return cls(eeg.channel_list, eeg.sr, eeg.header)
+
+
+def meta_name(suffix='') -> str:
+    return f'recording{suffix}.meta.pkl'
+
+
+def meta_path(save_dir, suffix='') -> str:
+    return f'{save_dir}/{meta_name(suffix)}'
+
+
+def save_recording_meta(meta, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, mode='wb') as f:
+        pickle.dump(meta, f)
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=1024)
+def load_recording_meta(path) -> RecordingMeta:
+    # Cached per process, so loading many windows of a recording reads its metadata once
+    with open(path, mode='rb') as f:
+        return pickle.load(f)
+
+
+class EEGWindow:
+    """
+    One window of a recording: its samples and where it comes from. recording is an index into a RecordingMeta list
+    or, for pickled windows, the file name of the recording's .meta.pkl next to the window file.
+    """
+    __slots__ = ['values', 'recording', 'start', 'stop']
+
+    def __init__(self, values, recording, start, stop):
+        self.values = values
+        self.recording = recording
+        self.start = int(start)
+        self.stop = int(stop)
+
+    def to_eeg(self, meta) -> EEG:
+        return EEG(self.values, meta.channel_list, (self.stop - self.start) / meta.sr, meta.sr, meta.header)
+
+    def to_pkl(self, file_path):
+        with open(file_path, mode='wb') as f:
+            pickle.dump(self, f)
+
+
+def resolve_window(window, file_path) -> EEG:
+    return window.to_eeg(load_recording_meta(str(Path(file_path).parent / window.recording)))
+
+
+class WindowTable:
+    """
+    Windows of recordings as arrays (struct of arrays): recording id, start and stop sample of every window.
+    Samples stay in the recordings' arrays and metadata in one RecordingMeta per recording, so a window costs 24 bytes.
+    Indexing gives an EEG like the list returned by EEG.split, with values as a view.
+    """
+    def __init__(self):
+        self.recordings = []
+        self.sources = []
+        self.recording_ids = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.stops = np.zeros(0, dtype=np.int64)
+
+    def add(self, eeg, starts, duration) -> int:
+        # Adds windows [start, start + duration) of eeg and returns the recording id
+        recording_id = len(self.recordings)
+        starts = np.asarray(starts, dtype=np.int64)
+        self.recordings.append(RecordingMeta.from_eeg(eeg))
+        self.sources.append(eeg.values)
+        self.recording_ids = np.concatenate([self.recording_ids, np.full(len(starts), recording_id)])
+        self.starts = np.concatenate([self.starts, starts])
+        self.stops = np.concatenate([self.stops, starts + duration])
+        return recording_id
+
+    @classmethod
+    def from_eeg(cls, eeg, window_size=0.5, window_stride='same', padding='same'):
+        # Same windows as EEG.split
+        n_eeg, window_stride, padding = eeg._validate_values(window_size, window_stride, padding)
+        table = cls()
+        table.add(eeg, (np.arange(n_eeg) * eeg.sr * window_stride).astype(np.int64), int(window_size * eeg.sr))
+        return table
+
+    def window(self, idx) -> EEGWindow:
+        recording_id, start, stop = int(self.recording_ids[idx]), self.starts[idx], self.stops[idx]
+        return EEGWindow(self.sources[recording_id][:, start:stop], recording_id, start, stop)
+
+    def __getitem__(self, idx) -> EEG:
+        window = self.window(idx)
+        return window.to_eeg(self.recordings[window.recording])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
@@ -1,3 +1,12 @@
-from eeglibrary.utils.args import *
-from eeglibrary.utils.logger import *
-from eeglibrary.utils.utils import *
+from eeglibrary._lazy import attach
+
+_EXPORTS = {
+    'args': ['split_args', 'add_nn_model_args', 'add_hyper_param_args', 'add_general_args', 'train_args',
+             'add_augment_args', 'baseline_args', 'add_test_args', 'test_args', 'add_quantize_args', 'quantize_args',
+             'add_adda_args', 'search_args'],
+    'logger': ['to_np', 'TensorBoardLogger'],
+    'utils': ['common_eeg_setup', 'EEG_CONF_DEFAULTS', 'init_seed', 'init_device', 'set_eeg_conf', 'set_dataloader',
+              'set_model', 'arrange_paths', 'concat_manifests'],
+}
+
+__getattr__, __dir__, __all__ = attach(__name__, _EXPORTS)
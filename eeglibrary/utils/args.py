@@ -20,6 +20,13 @@ def add_nn_model_args(parser):
     nn_parser.add_argument('--model-name', default='cnn_16_751_751', type=str, help='network model name')
     nn_parser.add_argument('--gpu-id', default=0, type=int, help='ID of GPU to use')
 
+    # kneighbor_index params
+    nn_parser.add_argument('--n-neighbors', default=5, type=int, help='Number of neighbors of kneighbor_index')
+    nn_parser.add_argument('--knn-tree', default='kd_tree', choices=['kd_tree', 'ball_tree'],
+                           help='Spatial index of kneighbor_index')
+    nn_parser.add_argument('--knn-shards', default=1, type=int,
+                           help='Number of index shards, built and queried in parallel')
+
     # RNN params
     nn_parser.add_argument('--rnn-type', default='gru', help='Type of the RNN. rnn|gru|lstm are supported')
     nn_parser.add_argument('--rnn-hidden-size', default=400, type=int, help='Hidden size of RNNs')
@@ -46,6 +53,17 @@ def add_hyper_param_args(parser):
     nn_parser.add_argument('--batch-size', default=32, type=int, help='Batch size for training')
     nn_parser.add_argument('--epoch-rate', default=1.0, type=float, help='Data rate to to use in one epoch')
     nn_parser.add_argument('--num-workers', default=4, type=int, help='Number of workers used in data-loading')
+    nn_parser.add_argument('--n-cores', default=0, type=int, help='Cores to split among workers and training, 0 is all')
+    nn_parser.add_argument('--worker-threads', default=1, type=int,
+                           help='BLAS/FFT/torch threads of each data-loading worker')
+    nn_parser.add_argument('--resource-benchmark', action='store_true',
+                           help='Measure throughput of worker/thread splits before training and use the fastest')
+    nn_parser.add_argument('--locality', default=0.0, type=float,
+                           help='0.0 samples randomly, 1.0 reads recording blocks one by one')
+    nn_parser.add_argument('--block-size', default=0, type=int,
+                           help='Number of consecutive windows in one sampling block. 0 means whole recording')
+    nn_parser.add_argument('--bucket-pool', default=50, type=int,
+                           help='Batches per pool sorted by length, for variable-length sequences')
     nn_parser.add_argument('--loss-weight', default='1.0-1.0', type=str, help='The weights of all class about loss')
     nn_parser.add_argument('--epochs', default=20, type=int, help='Number of training epochs')
     return parser
@@ -80,27 +98,47 @@ def train_args():
     parser.add_argument('--log-dir', default='visualize/', help='Location of tensorboard log')
     parser.add_argument('--log-params', dest='log_params', action='store_true',
                         help='Log parameter values and gradients')
+    parser.add_argument('--memory-profile-dir', default=None,
+                        help='Record memory usage per stage and worker into this directory. Off if not given')
+    parser.add_argument('--path-table-dir', default=None,
+                        help='Save dataset path tables here and memory map them. Rebuilt when the manifest changes')
+    parser.add_argument('--no-quality-filter', dest='quality_filter', action='store_false',
+                        help='Keep training windows flagged by the quality scan. Val and test never drop windows')
     parser.add_argument('--adda', dest='adda', action='store_true', help='train with adda or not')
     parser.add_argument('--test', dest='test', action='store_true', help='Test phase after training or not')
     parser.add_argument('--inference', action='store_true', help='Inference phase after training or not')
     parser = add_test_args(parser)
+    parser = add_augment_args(parser)
 
-    # parser.add_argument('--continue-from', default='', help='Continue from checkpoint model')
+    parser.add_argument('--continue-from', default='', help='Continue from checkpoint model')
     # parser.add_argument('--finetune', dest='finetune', action='store_true',
     #                     help='Finetune the model from checkpoint "continue_from"')
-    # parser.add_argument('--noise-dir', default=None,
-    #                     help='Directory to inject noise into audio. If default, noise Inject not added')
-    # parser.add_argument('--noise-prob', default=0.4, help='Probability of noise being added per sample')
-    # parser.add_argument('--noise-min', default=0.0,
-    #                     help='Minimum noise level to sample from. (1.0 means all noise, not original signal)',
-    #                     type=float)
-    # parser.add_argument('--noise-max', default=0.5,
-    #                     help='Maximum noise levels to sample from. Maximum 1.0', type=float)
     # parser.add_argument('--no-shuffle', dest='no_shuffle', action='store_true',
     #                     help='Turn off shuffling and sample from dataset based on sequence length (smallest to largest)')
     return parser
 
 
+def add_augment_args(parser):
+    augment_parser = parser.add_argument_group("Batch augmentation options")
+
+    augment_parser.add_argument('--noise-dir', default=None,
+                                help='Directory of noise EEG to inject. If default, noise Inject not added')
+    augment_parser.add_argument('--noise-prob', default=0.4, type=float,
+                                help='Probability of noise being added per sample')
+    augment_parser.add_argument('--noise-min', default=0.0, type=float,
+                                help='Minimum noise level to sample from, relative to the signal std')
+    augment_parser.add_argument('--noise-max', default=0.5, type=float, help='Maximum noise levels to sample from')
+    augment_parser.add_argument('--time-shift', default=0.0, type=float,
+                                help='Maximum random time shift as a ratio of the input length')
+    augment_parser.add_argument('--crop', default=0.0, type=float,
+                                help='Ratio of the input length zeroed outside a random crop. 0 means no crop')
+    augment_parser.add_argument('--channel-dropout', default=0.0, type=float, help='Probability to drop each channel')
+    augment_parser.add_argument('--amp-scale', default='1.0-1.0', type=str,
+                                help='Range of random amplitude scaling, min-max')
+    augment_parser.add_argument('--mixup-alpha', default=0.0, type=float, help='Alpha of mixup. 0 means no mixup')
+    return parser
+
+
 def baseline_args():
     parser = argparse.ArgumentParser(description='Baseline model arguments')
     parser = add_general_args(parser)
@@ -115,6 +153,14 @@ def add_test_args(parser):
 
     test_parser.add_argument('--test-manifest', type=str, help='manifest file for test', default='input/test_manifest.csv')
     test_parser.add_argument('--thresh', default=0.5, type=float, help='Threshold in ensemble')
+    test_parser.add_argument('--ensemble', type=str, default='',
+                             help='Ensemble members as model_name:model_path, separated by comma')
+    test_parser.add_argument('--voting', default='soft', choices=['soft', 'hard'],
+                             help='Average probabilities (soft) or count predicted classes (hard) of members')
+    test_parser.add_argument('--ensemble-weights', type=str, default='',
+                             help='Weights of members separated by -, equal weights if empty')
+    test_parser.add_argument('--ensemble-threads', type=int, default=0,
+                             help='Threads to run members, 0 means one per member')
     test_parser.add_argument('--only-results', action='store_true', help='Show only prediction in the output csv')
 
     return parser
@@ -130,6 +176,26 @@ def test_args():
     return parser
 
 
+def add_quantize_args(parser):
+    quantize_parser = parser.add_argument_group("Quantization options")
+
+    quantize_parser.add_argument('--quantize-mode', default='auto', choices=['auto', 'dynamic', 'static'],
+                                 help='dynamic: Linear/RNN layers, static: also conv layers calibrated on train data')
+    quantize_parser.add_argument('--calibration-batches', default=10, type=int,
+                                 help='Batches of the train manifest to calibrate static quantization')
+    quantize_parser.add_argument('--report-batches', default=None, type=int,
+                                 help='Batches of the test manifest in the float vs int8 report. All if not given')
+
+    return parser
+
+
+def quantize_args():
+    parser = test_args()
+    parser.description = 'Export an int8 model for CPU inference'
+    parser = add_quantize_args(parser)
+    return parser
+
+
 def add_adda_args(parser):
     adda_parser = parser.add_argument_group("ADDA options")
 
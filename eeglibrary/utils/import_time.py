@@ -0,0 +1,50 @@
+import argparse
+import json
+import subprocess
+import sys
+
+CORE_MODULES = ['eeglibrary.src.eeg', 'eeglibrary.src.eeg_loader', 'eeglibrary.src.eeg_parser']
+HEAVY_MODULES = ['torch', 'sklearn', 'pandas', 'scipy', 'ml', 'tqdm', 'joblib', 'h5py', 'tensorboardX']
+
+_MEASURE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps(dict(seconds=elapsed, heavy=heavy, max_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)))
+"""
+
+
+def measure_import(module, heavy_modules=HEAVY_MODULES) -> dict:
+    """
+    Imports module in a fresh interpreter, like a new script or a spawned DataLoader worker.
+    Returns seconds of the import, heavy modules it loaded and peak RSS of the interpreter in MB.
+    """
+    code = _MEASURE.format(module=module, heavy=list(heavy_modules))
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if out.returncode:
+        raise ImportError(f'Importing {module} failed:\n{out.stderr}')
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def benchmark(modules=CORE_MODULES, repeat=3) -> list:
+    # Best of repeat runs per module, so the file system cache of the first run does not count
+    results = []
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run['seconds'])
+        results.append(dict(module=module, **best))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time of eeglibrary modules in fresh interpreters')
+    parser.add_argument('modules', nargs='*', default=CORE_MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'module':40} {'ms':>8} {'rss MB':>8}  heavy")
+    for result in benchmark(args.modules, args.repeat):
+        print(f"{result['module']:40} {result['seconds'] * 1000:8.1f} {result['max_rss_mb']:8.1f}  "
+              f"{', '.join(result['heavy']) or '-'}")
@@ -2,9 +2,13 @@ from __future__ import print_function, division
 
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from eeglibrary.src import EEGDataSet, EEGDataLoader
 from eeglibrary.src.eeg_loader import from_mat
+from eeglibrary.src.path_table import load_manifest_bounds, save_manifest_bounds
+from eeglibrary.src.quality import load_quality_mask, save_quality_mask
+from eeglibrary.src.resources import WorkerInit
 from ml.models.toolbox import *
 from ml.src.dataloader import make_weights_for_balanced_classes
 from torch.utils.data.sampler import WeightedRandomSampler
@@ -24,20 +28,57 @@ def common_eeg_setup(eeg_path='', mat_col=''):
     return from_mat(eeg_path, mat_col), eeg_conf
 
 
+# Keys of eeg_conf read by EEGDataSet and EEGPreprocessor, with their value when args has no such option
+EEG_CONF_DEFAULTS = dict(sample_rate='same', window_size=None, window_stride=None, window='hamming', n_features=None,
+                         spect=False, to_1d=False, reproduce=None, duration=10.0, n_use_eeg=None, batch_size=32,
+                         cache=False, cache_dir=None, labels=None, channels=None, highpass=None, notch=None,
+                         notch_width=4.0, filter_order=4, causal_filter=False, band_power=False, stats_axis='channel',
+                         variable_length=False, min_n_use_eeg=1, quality_filter=True)
+
+
+def init_seed(args):
+    # Seeds python, numpy and torch generators with args.seed
+    import random
+    import torch
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.cuda.manual_seed_all(args.seed)
+
+
+def init_device(args):
+    import torch
+
+    if getattr(args, 'cuda', False) and torch.cuda.is_available():
+        return torch.device(f'cuda:{getattr(args, "gpu_id", 0)}')
+    return torch.device('cpu')
+
+
+def set_eeg_conf(args) -> dict:
+    # eeg_conf of EEGDataSet from parsed arguments. model_type is the model name, e.g. 'rnn'
+    eeg_conf = {key: getattr(args, key, default) for key, default in EEG_CONF_DEFAULTS.items()}
+    eeg_conf['duration'] = float(eeg_conf['duration'])
+    eeg_conf['model_type'] = getattr(args, 'model_type', None) or args.model_name
+    return eeg_conf
+
+
 def set_dataloader(args, eeg_conf, class_names, phase, label_func, device='cpu'):
+    worker_init_fn = WorkerInit(getattr(args, 'worker_threads', 1))
     if phase in ['test', 'inference']:
         return_path = True if phase == 'inference' else False
         dataset = EEGDataSet(args.test_manifest, eeg_conf, label_func, classes=class_names, to_1d=args.to_1d,
                              return_path=return_path)
         dataloader = EEGDataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers,
-                                          pin_memory=True, shuffle=False)
+                                          pin_memory=True, shuffle=False, worker_init_fn=worker_init_fn)
     else:
         manifest_path = [value for key, value in vars(args).items() if phase in key][0]
         dataset = EEGDataSet(manifest_path, eeg_conf, label_func, classes=class_names, to_1d=args.to_1d, device=device)
         weights = make_weights_for_balanced_classes(dataset.labels_index(), len(class_names))
         sampler = WeightedRandomSampler(weights, int(len(dataset) * args.epoch_rate))
         dataloader = EEGDataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers,
-                                          pin_memory=True, sampler=sampler, drop_last=True)
+                                          pin_memory=True, sampler=sampler, drop_last=True,
+                                          worker_init_fn=worker_init_fn)
     return dataloader
 
 
@@ -59,6 +100,13 @@ def set_model(args, class_names, eeg_conf, device):
     elif args.model_name in ['kneighbor', 'knn']:
         args.model_name = 'kneighbor'
         model = KNN(list(range(len(class_names))))
+    elif args.model_name == 'window_rnn':
+        from eeglibrary.src.sequence import WindowSequenceRNN
+        model = WindowSequenceRNN(eeg_conf['n_window_features'], len(class_names), args.rnn_type,
+                                  args.rnn_hidden_size, args.rnn_n_layers, args.bidirectional)
+    elif args.model_name == 'kneighbor_index':
+        from eeglibrary.src.knn import IndexedKNN
+        model = IndexedKNN(list(range(len(class_names))), args.n_neighbors, args.knn_tree, args.knn_shards)
     else:
         raise NotImplementedError
 
@@ -80,13 +128,27 @@ def arrange_paths(args, sub_name):
     return args
 
 
-def concat_manifests(manifests, save_name):
+def concat_manifests(manifests, save_name, save_dir=None):
     # manifestファイルのpathが入ったリストを受け取って、dfを読み込んで結合して返す
     assert isinstance(manifests, list)
-
-    master_df = pd.DataFrame()
-    for manifest in manifests:
-        master_df = pd.concat([master_df, pd.read_csv(manifest, header=None)], axis=0, sort=False)
-
-    master_df.to_csv(Path(manifests[0]).parent / save_name, index=False, header=None)
-    return Path(manifests[0]).parent / save_name
\ No newline at end of file
+    assert manifests, f'No manifests to concatenate into {save_name}'
+
+    dfs = [pd.read_csv(manifest, header=None) for manifest in manifests]
+    master_df = pd.concat(dfs, axis=0, sort=False)
+
+    save_path = Path(save_dir or Path(manifests[0]).parent) / save_name
+    save_path.parent.mkdir(exist_ok=True, parents=True)
+    master_df.to_csv(save_path, index=False, header=None)
+
+    masks = [load_quality_mask(manifest) for manifest in manifests]
+    if all(mask is not None for mask in masks):
+        save_quality_mask(save_path, np.hstack(masks))
+
+    # EEGDataSet packs window groups per source, so they match the groups (and cached features) of each source
+    bounds, start = [], 0
+    for manifest, df in zip(manifests, dfs):
+        source_bounds = load_manifest_bounds(manifest)
+        bounds.extend(start + (source_bounds[:-1] if source_bounds is not None else np.zeros(1, dtype=np.int64)))
+        start += len(df)
+    save_manifest_bounds(save_path, bounds + [start])
+    return save_path
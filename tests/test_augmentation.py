@@ -0,0 +1,96 @@
+import argparse
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import torch
+from eeglibrary.src.augmentation import BatchAugmentor, load_noise_bank, mixup_loss, set_augmentor
+from eeglibrary.utils.args import add_augment_args
+
+
+class TestBatchAugmentor(TestCase):
+
+    def setUp(self):
+        self.inputs = torch.randn(8, 4, 256)
+
+    def test_noise_bank(self):
+        with tempfile.TemporaryDirectory() as noise_dir:
+            np.save(Path(noise_dir) / 'a.npy', np.random.randn(2, 300))
+            np.save(Path(noise_dir) / 'b.npy', np.random.randn(200))
+            bank = load_noise_bank(noise_dir)
+            with self.assertRaises(AssertionError):
+                load_noise_bank(noise_dir, min_len=256)
+        self.assertEqual(tuple(bank.shape), (3, 200))
+        self.assertTrue(torch.allclose(bank.std(dim=1), torch.ones(3), atol=1e-2))
+
+    def test_noise(self):
+        bank = torch.randn(5, 1000)
+        x, mix = BatchAugmentor(bank, noise_prob=1.0, noise_levels=(0.5, 0.5), seed=0)(self.inputs)
+        self.assertIsNone(mix)
+        self.assertEqual(x.shape, self.inputs.shape)
+        self.assertFalse(torch.equal(x, self.inputs))
+
+    def test_short_noise_bank(self):
+        # Bank signals shorter than the inputs are tiled
+        bank = torch.randn(3, 100)
+        x, _ = BatchAugmentor(bank, noise_prob=1.0, noise_levels=(0.5, 0.5), seed=0)(self.inputs)
+        self.assertEqual(x.shape, self.inputs.shape)
+        self.assertTrue(torch.isfinite(x).all())
+
+    def test_time_shift(self):
+        x, _ = BatchAugmentor(time_shift=0.25, seed=0)(self.inputs)
+        # A circular shift keeps every value of the sample
+        self.assertTrue(torch.allclose(x.sort(dim=-1).values, self.inputs.sort(dim=-1).values))
+
+    def test_crop(self):
+        x, _ = BatchAugmentor(crop=0.25, seed=0)(self.inputs)
+        self.assertEqual(x.shape, self.inputs.shape)
+        kept = (x != 0).all(dim=1)
+        self.assertTrue((kept.sum(dim=-1) == 192).all())
+        # The kept part is one contiguous window at its original position
+        for sample, keep in enumerate(kept):
+            index = keep.nonzero().flatten()
+            self.assertEqual(int(index[-1] - index[0]) + 1, 192)
+            self.assertTrue(torch.equal(x[sample, :, index], self.inputs[sample, :, index]))
+
+    def test_spectrogram(self):
+        inputs = torch.randn(4, 2, 16, 32)
+        x, _ = BatchAugmentor(torch.randn(2, 64), noise_prob=1.0, time_shift=0.1, crop=0.1, channel_dropout=0.5,
+                              amp_scale=(0.5, 1.5), seed=0)(inputs)
+        self.assertEqual(x.shape, inputs.shape)
+
+    def test_channel_dropout(self):
+        x, _ = BatchAugmentor(channel_dropout=0.5, seed=0)(self.inputs)
+        dropped = (x == 0).all(dim=-1)
+        self.assertTrue(dropped.any() and not dropped.all())
+        self.assertTrue(torch.equal(x[~dropped], self.inputs[~dropped]))
+
+    def test_amp_scale(self):
+        x, _ = BatchAugmentor(amp_scale=(0.5, 2.0), seed=0)(self.inputs)
+        scales = x[:, 0, 0] / self.inputs[:, 0, 0]
+        self.assertTrue(((scales >= 0.5) & (scales <= 2.0)).all())
+        self.assertTrue(torch.allclose(x, self.inputs * scales.view(-1, 1, 1)))
+
+    def test_mixup(self):
+        labels = torch.arange(8)
+        results = [BatchAugmentor(mixup_alpha=0.4, seed=1)(self.inputs, labels) for _ in range(2)]
+        (x, (mixed_labels, lam)), (x_again, (_, lam_again)) = results
+        # Reproducible with the seed
+        self.assertEqual(lam, lam_again)
+        self.assertTrue(torch.equal(x, x_again))
+        self.assertTrue(0 <= lam <= 1)
+        self.assertEqual(sorted(mixed_labels.tolist()), labels.tolist())
+
+        criterion = torch.nn.CrossEntropyLoss()
+        outputs = torch.randn(8, 8)
+        expected = lam * criterion(outputs, labels) + (1 - lam) * criterion(outputs, mixed_labels)
+        self.assertTrue(torch.allclose(mixup_loss(criterion, outputs, labels, (mixed_labels, lam)), expected))
+        self.assertTrue(torch.equal(mixup_loss(criterion, outputs, labels, None), criterion(outputs, labels)))
+
+    def test_set_augmentor(self):
+        parser = add_augment_args(argparse.ArgumentParser())
+        parser.add_argument('--seed', default=0, type=int)
+        self.assertIsNone(set_augmentor(parser.parse_args([])))
+        augmentor = set_augmentor(parser.parse_args(['--crop', '0.2']))
+        self.assertEqual(augmentor.crop, 0.2)
@@ -0,0 +1,50 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+import torch
+from eeglibrary.src.checkpoint import CheckpointWriter, load_checkpoint
+from eeglibrary.src.sampler import LocalityWeightedSampler
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.model = torch.nn.Linear(4, 2)
+        self.optimizer = torch.optim.SGD(self.model.parameters(), lr=0.1, momentum=0.9)
+        self.sampler = LocalityWeightedSampler(np.ones(40), 40, np.arange(40) // 10)
+
+    def test_resume_mid_epoch(self):
+        list(self.sampler)
+        order = list(self.sampler)
+
+        with TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'checkpoint.pth'
+            writer = CheckpointWriter()
+            writer.save(path, self.model, self.optimizer, epoch=1, iteration=3,
+                        sampler_state=self.sampler.state_dict(n_consumed=12))
+            weight = self.model.weight.detach().clone()
+            with torch.no_grad():
+                self.model.weight.add_(1.0)
+            writer.close()
+
+            sampler = LocalityWeightedSampler(np.ones(40), 40, np.arange(40) // 10)
+            epoch, iteration = load_checkpoint(path, self.model, self.optimizer, sampler)
+
+        self.assertEqual((epoch, iteration), (1, 3))
+        self.assertTrue(torch.equal(self.model.weight, weight))
+        self.assertEqual(len(sampler), 28)
+        self.assertEqual(list(sampler), order[12:])
+        self.assertEqual(len(sampler), 40)
+
+    def test_close_raises_error(self):
+        with TemporaryDirectory() as tmp_dir:
+            # A directory is in the way of the checkpoint, so the background write fails
+            path = Path(tmp_dir) / 'checkpoint.pth'
+            path.mkdir()
+            (path / 'file').touch()
+            writer = CheckpointWriter()
+            writer.save(path, self.model)
+            with self.assertRaises(OSError):
+                writer.close()
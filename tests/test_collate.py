@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+import numpy as np
+import torch
+from eeglibrary.src.collate import BatchBufferPool, BufferedCollate, EEGBatch
+
+
+class TestBatchBufferPool(TestCase):
+
+    def test_reuse(self):
+        pool = BatchBufferPool((2, 8), batch_size=4)
+        batch = pool.get()
+        data_ptr = batch.data_ptr()
+        # A buffer held by the training loop is not handed out again
+        other = pool.get()
+        self.assertNotEqual(other.data_ptr(), data_ptr)
+        del batch, other
+        self.assertEqual(pool.get().data_ptr(), data_ptr)
+        self.assertEqual(len(pool.buffers), 2)
+
+    def test_partial(self):
+        pool = BatchBufferPool((8,), batch_size=4)
+        last = pool.get(3)
+        self.assertEqual(tuple(last.shape), (3, 8))
+        # The slice keeps its buffer in use
+        self.assertNotEqual(pool.get().data_ptr(), last.data_ptr())
+        del last
+        self.assertEqual(len(pool.buffers), 2)
+        self.assertEqual(pool.get(1).data_ptr(), pool.buffers[0].data_ptr())
+
+    def test_pool_size(self):
+        pool = BatchBufferPool((8,), batch_size=2, pool_size=2)
+        batches = [pool.get() for _ in range(3)]
+        self.assertEqual(len(pool.buffers), 2)
+        self.assertEqual(len({batch.data_ptr() for batch in batches}), 3)
+
+
+class TestBufferedCollate(TestCase):
+
+    def test_labels(self):
+        collate = BufferedCollate(batch_size=4)
+        xs = [np.full((2, 8), i, dtype=np.float64) for i in range(4)]
+        batch = collate([(x, i % 2) for i, x in enumerate(xs)])
+        self.assertIsInstance(batch, EEGBatch)
+        inputs, labels = batch
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(labels.dtype, torch.int64)
+        self.assertTrue(torch.equal(inputs, torch.from_numpy(np.stack(xs))))
+
+    def test_partial_last_batch(self):
+        collate = BufferedCollate(batch_size=4)
+        first = collate([torch.ones(8) for _ in range(4)])
+        data_ptr = first.data_ptr()
+        del first
+        last = collate([torch.full((8,), 2.) for _ in range(3)])
+        self.assertEqual(tuple(last.shape), (3, 8))
+        self.assertEqual(last.data_ptr(), data_ptr)
+        self.assertTrue(torch.equal(last, torch.full((3, 8), 2., dtype=torch.float32)))
+
+    def test_paths(self):
+        collate = BufferedCollate(batch_size=2)
+        batch = collate([(torch.zeros(4), ('a.pkl', 'b.pkl')), (torch.zeros(4), ('c.pkl', 'd.pkl'))])
+        inputs, paths = batch
+        self.assertIsNone(batch.labels)
+        self.assertEqual(paths.shape, (2, 2))
+        self.assertEqual(paths[1, 0], 'c.pkl')
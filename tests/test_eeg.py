@@ -1,4 +1,6 @@
 from unittest import TestCase
+
+import numpy as np
 from eeglibrary.src.eeg import EEG
 from pathlib import Path
 from eeglibrary.src.eeg_loader import from_mat
@@ -57,3 +59,44 @@ class TestEEG(TestCase):
         donwsampled = self.eeg.resample(int(self.eeg.sr) // 2)
         self.assertEqual(donwsampled.shape[1] // self.eeg.len_sec, int(self.eeg.sr) // 2)
 
+
+
+class TestEEGSelect(TestCase):
+
+    def setUp(self):
+        self.eeg = EEG(np.arange(40 * 100, dtype=float).reshape(40, 100), [f'ch{i}' for i in range(40)], 1.0, 100)
+
+    def test_select_first_channels(self):
+        self.eeg.select(22)
+        self.assertEqual(self.eeg.values.shape, (22, 100))
+        self.assertEqual(len(self.eeg.channel_list), 22)
+
+    def test_select_names_and_range(self):
+        self.eeg.select(['ch3', 'CH1'], sample_range=(10, 60))
+        self.assertEqual(self.eeg.channel_list, ['ch3', 'ch1'])
+        self.assertEqual(self.eeg.values[0, 0], 3 * 100 + 10)
+        self.assertEqual(self.eeg.len_sec, 0.5)
+        self.assertTrue(self.eeg.values.flags['OWNDATA'])
+
+
+class TestEEGWindow(TestCase):
+
+    def setUp(self):
+        self.eeg = EEG(np.random.randn(3, 1000), ['a', 'b', 'c'], 10, 100, header='header')
+
+    def test_compact_split(self):
+        windows = self.eeg.split(window_size=1.0, padding=0, n_jobs=1)
+        table = self.eeg.split(window_size=1.0, padding=0, compact=True)
+        self.assertEqual(len(table), len(windows))
+        for window, compact in zip(windows, table):
+            np.testing.assert_array_equal(window.values, compact.values)
+            self.assertEqual((window.len_sec, window.sr, window.channel_list),
+                             (compact.len_sec, compact.sr, compact.channel_list))
+
+    def test_compact_split_and_save(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as save_dir:
+            paths = self.eeg.split_and_save(window_size=1.0, padding=0, n_jobs=1, save_dir=save_dir, compact=True)
+            loaded = EEG.load_pkl(paths[3], channels=['b'])
+            np.testing.assert_array_equal(loaded.values, self.eeg.values[1:2, 300:400])
+            self.assertEqual((loaded.channel_list, loaded.sr, loaded.header), (['b'], 100, 'header'))
@@ -0,0 +1,69 @@
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import h5py
+import numpy as np
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.eeg_loader import H5Values, convert_mat_archive, from_mat, is_mat_v73
+
+
+def write_mat_v73(path, values, channels, sr, name='interictal_segment_1'):
+    # Layout MATLAB writes with -v7.3: HDF5 behind a 512 byte header, matrices transposed, strings as references
+    with h5py.File(path, mode='w', userblock_size=512) as f:
+        group = f.create_group(name)
+        group['data'] = values.T
+        group['data_length_sec'] = np.array([[values.shape[1] / sr]])
+        group['sampling_frequency'] = np.array([[float(sr)]])
+        refs = f.create_group('#refs#')
+        channel_refs = []
+        for i, channel in enumerate(channels):
+            refs[str(i)] = np.array([[ord(c)] for c in channel], dtype=np.uint16)
+            channel_refs.append(refs[str(i)].ref)
+        group.create_dataset('channels', data=np.array([channel_refs], dtype=h5py.ref_dtype))
+    with open(path, mode='r+b') as f:
+        f.write(b'MATLAB 7.3 MAT-file'.ljust(128))
+
+
+class TestMatV73(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.values = np.random.RandomState(0).randn(3, 400)
+        self.channels = ['Fp1', 'Fp2', 'Cz']
+        self.mat_path = Path(self.tmp_dir.name) / 'mat' / 'dog' / 'Dog_1_interictal_segment_0001.mat'
+        self.mat_path.parent.mkdir(parents=True)
+        write_mat_v73(self.mat_path, self.values, self.channels, sr=100)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read(self):
+        self.assertTrue(is_mat_v73(self.mat_path))
+        eeg = from_mat(str(self.mat_path), mat_col='')
+        self.assertIsInstance(eeg.values, H5Values)
+        self.assertEqual((list(eeg.channel_list), eeg.sr, eeg.len_sec), (self.channels, 100, 4.0))
+        self.assertEqual(eeg.values.shape, (3, 400))
+        np.testing.assert_array_equal(eeg.values[1, 10:20], self.values[1, 10:20])
+        np.testing.assert_array_equal(eeg.values[[2, 0], 5:7], self.values[[2, 0], 5:7])
+        np.testing.assert_array_equal(np.asarray(eeg.values), self.values)
+
+    def test_lazy_values(self):
+        values = H5Values(self.mat_path, 'interictal_segment_1/data')
+        np.testing.assert_array_equal(values[0], self.values[0])
+        file = values._file
+        self.assertTrue(file.id.valid)
+        values.close()
+        self.assertFalse(file.id.valid)
+        # Reopened on access, and after unpickling
+        np.testing.assert_array_equal(pickle.loads(pickle.dumps(values))[2, :3], self.values[2, :3])
+        values.close()
+
+    def test_convert_archive(self):
+        out_dir = Path(self.tmp_dir.name) / 'pkl'
+        out_paths = convert_mat_archive(Path(self.tmp_dir.name) / 'mat', out_dir, n_jobs=1)
+        self.assertEqual(out_paths, [str(out_dir / 'dog' / 'Dog_1_interictal_segment_0001.pkl')])
+        eeg = EEG.load_pkl(out_paths[0])
+        np.testing.assert_array_equal(eeg.values, self.values)
+        self.assertEqual(list(eeg.channel_list), self.channels)
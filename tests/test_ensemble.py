@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+import numpy as np
+import torch
+from eeglibrary.src.ensemble import Ensemble, parse_ensemble
+
+
+class FixedModel(torch.nn.Module):
+    def __init__(self, logits):
+        super().__init__()
+        self.logits = torch.tensor(logits, dtype=torch.float)
+
+    def forward(self, x):
+        return self.logits.expand(x.size(0), -1)
+
+
+class LabelModel:
+    # sklearn-style member without predict_proba
+    def __init__(self, label):
+        self.label = label
+
+    def predict(self, x):
+        return np.full(len(x), self.label)
+
+
+class TestEnsemble(TestCase):
+
+    def setUp(self):
+        self.inputs = torch.zeros(4, 2, 10)
+
+    def test_soft_voting(self):
+        members = [(FixedModel([0.0, 0.0]), False), (LabelModel(1), True)]
+        ensemble = Ensemble(members, n_classes=2, voting='soft', thresh=0.7)
+        np.testing.assert_allclose(ensemble.predict_proba(self.inputs), [[0.25, 0.75]] * 4)
+        self.assertEqual(ensemble.predict(self.inputs).tolist(), [1] * 4)
+        ensemble.thresh = 0.8
+        self.assertEqual(ensemble.predict(self.inputs).tolist(), [0] * 4)
+        ensemble.close()
+
+    def test_hard_voting(self):
+        members = [(FixedModel([0.0, 1.0, 0.0]), False), (FixedModel([0.0, 0.0, 1.0]), False), (LabelModel(2), True)]
+        ensemble = Ensemble(members, n_classes=3, voting='hard', weights=[3, 1, 1])
+        self.assertEqual(ensemble.predict(self.inputs).tolist(), [1] * 4)
+        ensemble.close()
+
+    def test_parse_ensemble(self):
+        self.assertEqual(parse_ensemble('rnn:model/a.pth,xgboost:model/b.pkl'),
+                         [('rnn', 'model/a.pth'), ('xgboost', 'model/b.pkl')])
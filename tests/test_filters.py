@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+import numpy as np
+from scipy import signal
+from eeglibrary.src.filters import FilterBank, design_sos, filter_bank_from_conf
+
+
+class TestFilterBank(TestCase):
+
+    def setUp(self):
+        t = np.arange(2560) / 256
+        self.values = np.stack([np.sin(2 * np.pi * 10 * t) + np.sin(2 * np.pi * 60 * t) + 3.0] * 3)
+
+    def test_notch_and_highpass(self):
+        bank = filter_bank_from_conf(dict(highpass=1.0, notch=60.0))
+        filtered = bank.apply(self.values, 256)
+        amplitude = np.abs(np.fft.rfft(filtered[:, 256:-256], axis=1)) / (len(self.values[0]) - 512) * 2
+        freqs = np.fft.rfftfreq(len(self.values[0]) - 512, 1 / 256)
+        self.assertLess(amplitude[0, freqs == 60], 0.05)
+        self.assertGreater(amplitude[0, freqs == 10], 0.9)
+        self.assertLess(abs(filtered[:, 256:-256].mean()), 0.05)
+
+    def test_streaming_equals_whole(self):
+        bank = FilterBank([('highpass', 1.0, 4), ('bandstop', (58, 62), 4)], zero_phase=False)
+        stream = bank.stream(256)
+        chunks = [stream.process(chunk) for chunk in np.array_split(self.values, 7, axis=1)]
+        zi = signal.sosfilt_zi(bank.sos(256))[:, None, :] * self.values[:, :1][None]
+        expected = signal.sosfilt(bank.sos(256), self.values, axis=-1, zi=zi)[0]
+        np.testing.assert_allclose(np.hstack(chunks), expected)
+
+    def test_design_cached(self):
+        self.assertIs(design_sos('highpass', 1.0, 256, 4), design_sos('highpass', 1.0, 256, 4))
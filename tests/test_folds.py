@@ -0,0 +1,118 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.feature_cache import FeatureCache
+from eeglibrary.src.folds import FoldOrchestrator, aggregate_fold_metrics, build_fold_manifests, make_folds
+
+PREPARED = []
+CACHE_DIRS = []
+
+
+def prepare_func(manifest_path):
+    PREPARED.append(manifest_path)
+
+
+def fold_func(fold):
+    n_train = len(pd.read_csv(fold['train_manifest'], header=None))
+    return dict(n_train=n_train, score=len(fold['name']) / 10)
+
+
+def dataset_conf(cache_dir):
+    return dict(to_1d=True, sample_rate='same', n_features=None, duration=2.0, n_use_eeg=2, model_type='rnn',
+                batch_size=2, cache=False, labels=None, scaling_axis=None, window_size=None, reproduce=None,
+                spect=False, cache_dir=cache_dir)
+
+
+def window_dataset(manifest_path):
+    from eeglibrary.src.eeg_dataset import EEGDataSet
+    return EEGDataSet(manifest_path, dataset_conf(CACHE_DIRS[-1]), None, lambda row: 0, 'val')
+
+
+def cache_features(manifest_path):
+    dataset = window_dataset(manifest_path)
+    for idx in range(len(dataset)):
+        dataset.load_features(idx)
+
+
+def cache_hits(fold):
+    dataset = window_dataset(fold['train_manifest'])
+    items = [list(paths) for paths, label in dataset.path_list]
+    return dict(n_items=len(items), n_hits=sum(items_ in dataset.feature_cache for items_ in items),
+                n_mixed=sum(len({Path(path).parent.name for path in paths}) > 1 for paths in items))
+
+
+class TestFolds(TestCase):
+
+    def setUp(self):
+        PREPARED.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.splitted_dir = Path(self.tmp_dir.name) / 'splitted'
+        self.patients = ['chb01', 'chb02', 'chb03', 'chb004']
+        for i, patient in enumerate(self.patients):
+            (self.splitted_dir / patient).mkdir(parents=True)
+            # i + 1 windows in each phase manifest of the patient
+            for phase in ['train', 'val', 'test']:
+                pd.DataFrame([f'{patient}/{phase}_{j}.pkl' for j in range(i + 1)]).to_csv(
+                    self.splitted_dir / patient / f'{phase}_manifest.csv', index=False, header=None)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_make_folds(self):
+        folds = make_folds(self.patients, n_val_patients=1)
+        self.assertEqual([fold['test'] for fold in folds], [[patient] for patient in self.patients])
+        self.assertEqual(folds[3], dict(name='chb004', test=['chb004'], val=['chb01'], train=['chb02', 'chb03']))
+        with self.assertRaises(AssertionError):
+            make_folds(self.patients[:2], n_val_patients=1)
+
+    def test_missing_manifests(self):
+        fold = make_folds(self.patients)[0]
+        with self.assertRaisesRegex(AssertionError, 'no manifests'):
+            build_fold_manifests(fold, Path(self.tmp_dir.name) / 'empty', Path(self.tmp_dir.name) / 'empty')
+
+    def test_aggregate(self):
+        result = aggregate_fold_metrics([dict(fold='a', score=0.5), dict(fold='b', score=0.7)])
+        self.assertEqual(result.index.tolist(), ['a', 'b', 'mean', 'std'])
+        self.assertAlmostEqual(result.loc['mean', 'score'], 0.6)
+
+    def test_run(self):
+        result_path = Path(self.tmp_dir.name) / 'result.csv'
+        orchestrator = FoldOrchestrator(self.patients, fold_func, prepare_func, str(self.splitted_dir),
+                                        str(Path(self.tmp_dir.name) / 'folds'), n_jobs=1)
+        result = orchestrator.run(result_path)
+        # chb01 is the test patient of the first fold, chb02 validates and all manifests of chb03 + chb004 train
+        self.assertEqual(result.loc['chb01', 'n_train'], (3 + 4) * 3)
+        self.assertEqual(len(PREPARED), 12)
+        self.assertTrue(result_path.is_file())
+        self.assertEqual(result.index.tolist()[-2:], ['mean', 'std'])
+
+
+class TestFoldFeatureCache(TestCase):
+
+    def test_groups_match_patient_manifests(self):
+        # n_use_eeg=2 and patients with an odd number of windows
+        rng = np.random.RandomState(0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            splitted_dir = Path(tmp_dir) / 'splitted'
+            CACHE_DIRS.append(str(Path(tmp_dir) / 'cache'))
+            patients = {'chb01': 5, 'chb02': 4, 'chb03': 3, 'chb04': 5}
+            for patient, n_windows in patients.items():
+                (splitted_dir / patient).mkdir(parents=True)
+                paths = [str(splitted_dir / patient / f'{i * 256}_{(i + 1) * 256}.pkl') for i in range(n_windows)]
+                for path in paths:
+                    EEG(rng.randn(3, 256), ['ch1', 'ch2', 'ch3'], 1, 256).to_pkl(path)
+                pd.DataFrame(paths).to_csv(splitted_dir / patient / 'train_manifest.csv', index=False, header=None)
+
+            orchestrator = FoldOrchestrator(list(patients), cache_hits, cache_features, str(splitted_dir),
+                                            str(splitted_dir / 'folds'), n_jobs=1)
+            result = orchestrator.run()
+
+        # Each patient packs floor(n / 2) groups, e.g. chb03 + chb04 train the first fold with 1 + 2 groups
+        folds = list(patients)
+        self.assertEqual(result.loc[folds, 'n_items'].tolist(), [3, 4, 4, 3])
+        self.assertEqual(result.loc[folds, 'n_hits'].tolist(), [3, 4, 4, 3])
+        self.assertEqual(result.loc[folds, 'n_mixed'].tolist(), [0, 0, 0, 0])
@@ -0,0 +1,19 @@
+from unittest import TestCase
+
+from eeglibrary.utils.import_time import CORE_MODULES, measure_import
+
+
+class TestImports(TestCase):
+
+    def test_core_modules_are_light(self):
+        for module in CORE_MODULES:
+            result = measure_import(module)
+            self.assertEqual(result['heavy'], [], f'{module} imports {result["heavy"]}')
+
+    def test_lazy_names(self):
+        import eeglibrary.src
+        from eeglibrary.src.eeg import EEG
+        self.assertIs(eeglibrary.src.EEG, EEG)
+        self.assertIn('Spectrum', dir(eeglibrary.src))
+        with self.assertRaises(AttributeError):
+            eeglibrary.src.no_such_name
@@ -0,0 +1,101 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.incremental import ChangeJournal, IncrementalStore
+from eeglibrary.src.quality import load_quality_mask
+
+
+def write_recordings(data_dir, names, len_sec=8, sr=64):
+    rng = np.random.RandomState(0)
+    for name in names:
+        EEG(rng.randn(2, len_sec * sr), ['Fp1', 'Fp2'], len_sec, sr).to_pkl(f'{data_dir}/{name}.pkl')
+
+
+class TestIncrementalStore(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir, self.out_dir = Path(self.tmp_dir.name) / 'data', Path(self.tmp_dir.name) / 'out'
+        self.data_dir.mkdir()
+        write_recordings(self.data_dir, ['chb01_01', 'chb01_02', 'chb02_01'])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def store(self):
+        return IncrementalStore(self.out_dir, window_size=2.0, n_jobs=1, ratios=(1, 0, 0))
+
+    def manifest(self):
+        return pd.read_csv(self.out_dir / 'train_manifest.csv', header=None).iloc[:, 0].tolist()
+
+    def test_append(self):
+        first = self.store().append(self.data_dir)
+        self.assertEqual(first['n_windows'], 12)
+        old_paths = self.manifest()
+        mtimes = {path: Path(path).stat().st_mtime_ns for path in old_paths}
+
+        write_recordings(self.data_dir, ['chb03_01'])
+        store = self.store()
+        second = store.append(self.data_dir)
+        self.assertEqual((second['recordings'], second['n_windows']), (['chb03_01'], 4))
+        self.assertIsNone(store.append(self.data_dir))
+
+        paths = self.manifest()
+        self.assertEqual(paths[:12], old_paths)
+        self.assertEqual(len(load_quality_mask(self.out_dir / 'train_manifest.csv')), 16)
+        self.assertEqual({path: Path(path).stat().st_mtime_ns for path in old_paths}, mtimes)
+
+        index = store.window_index()
+        self.assertEqual(len(index), 16)
+        self.assertEqual(sorted(index.patients), ['chb01', 'chb02', 'chb03'])
+        self.assertEqual(len(index.select(patients=['chb03'], start=2.0, end=6.0)), 2)
+
+    def test_uncommitted_rows_are_rolled_back(self):
+        self.store().append(self.data_dir)
+        with open(self.out_dir / 'train_manifest.csv', mode='a') as f:
+            f.write('out/chb09_01/0_128.pkl\n')
+        self.store()
+        self.assertEqual(len(self.manifest()), 12)
+
+    def test_adopt_existing_manifests(self):
+        from eeglibrary.src.ingest import IngestPipeline
+        IngestPipeline(self.out_dir, window_size=2.0, n_jobs=1).run(self.data_dir, ratios=(1, 0, 0))
+        store = self.store()
+        self.assertEqual(store.deltas(), ['00000'])
+        self.assertEqual(store.new_recordings(self.data_dir), [])
+        self.assertEqual(len(store.window_index()), 12)
+
+    def test_failed_first_append_is_not_adopted(self):
+        with mock.patch.object(ChangeJournal, 'append', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.store().append(self.data_dir)
+        self.assertEqual(len(self.manifest()), 12)
+
+        store = self.store()
+        self.assertEqual(store.deltas(), [])
+        self.assertEqual((self.out_dir / 'train_manifest.csv').read_text(), '')
+        self.assertEqual(store.append(self.data_dir)['n_windows'], 12)
+        self.assertEqual(len(self.manifest()), 12)
+        self.assertFalse(store.pending_path.exists())
+
+    def test_same_name_in_subdirectories(self):
+        for patient in ['chb01', 'chb02']:
+            (self.data_dir / patient).mkdir()
+            write_recordings(self.data_dir / patient, ['01'])
+        store = self.store()
+        entry = store.append(self.data_dir)
+        self.assertEqual(entry['recordings'], ['chb01/01', 'chb01_01', 'chb01_02', 'chb02/01', 'chb02_01'])
+        self.assertEqual(entry['n_windows'], 20)
+
+        (self.data_dir / 'chb03').mkdir()
+        write_recordings(self.data_dir / 'chb03', ['01'])
+        self.assertEqual(store.new_recordings(self.data_dir), [str(self.data_dir / 'chb03' / '01.pkl')])
+        self.assertEqual(store.append(self.data_dir)['recordings'], ['chb03/01'])
+
+    def test_window_index_without_deltas(self):
+        with self.assertRaises(AssertionError):
+            self.store().window_index()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import numpy as np
+from eeglibrary.src import ingest
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.ingest import IngestPipeline, recording_name
+
+
+def failing_write(*args):
+    raise IOError('disk full')
+
+
+def shm_blocks() -> set:
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+class TestIngestPipeline(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp_dir.name) / 'data'
+        rng = np.random.RandomState(0)
+        # Same file name for two patients
+        for patient in ['chb01', 'chb02', 'chb03']:
+            (self.data_dir / patient).mkdir(parents=True)
+            EEG(rng.randn(2, 512), ['Fp1', 'Fp2'], 8, 64).to_pkl(str(self.data_dir / patient / 'record_01.pkl'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_recordings_with_the_same_name(self):
+        self.assertEqual(recording_name(self.data_dir / 'chb01' / 'record_01.pkl', self.data_dir), 'chb01/record_01')
+        out_dir = Path(self.tmp_dir.name) / 'out'
+        manifests = IngestPipeline(out_dir, window_size=2.0, n_jobs=2).run(self.data_dir, ratios=(1, 0, 0))
+        self.assertEqual(len(Path(manifests['train']).read_text().splitlines()), 12)
+        for patient in ['chb01', 'chb02', 'chb03']:
+            self.assertEqual(len(list((out_dir / patient / 'record_01').glob('*.pkl'))), 4)
+
+    def test_shared_memory_is_released_on_failure(self):
+        before = shm_blocks()
+        with mock.patch.object(ingest, '_write_windows', failing_write):
+            with self.assertRaises(IOError):
+                IngestPipeline(Path(self.tmp_dir.name) / 'out', window_size=2.0, n_jobs=2).run(self.data_dir)
+        self.assertEqual(shm_blocks() - before, set())
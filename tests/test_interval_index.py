@@ -0,0 +1,68 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from eeglibrary.src.interval_index import WindowIndex, parse_window_name
+
+
+class TestWindowIndex(TestCase):
+
+    def setUp(self):
+        # 3 recordings of 2 patients, 10 sec windows at 256 Hz. Paths are given out of order
+        self.paths = [f'out/{recording}/{i * 2560}_{(i + 1) * 2560}.pkl'
+                      for recording, n in [('chb02_01', 30), ('chb01_01', 360), ('chb01_02', 200)]
+                      for i in range(n)][::-1]
+        quality = np.ones(len(self.paths), dtype=bool)
+        quality[self.paths.index('out/chb01_01/2560_5120.pkl')] = False
+        self.index = WindowIndex.from_paths(self.paths, quality=quality, sr=256)
+        self.events = pd.DataFrame(dict(recording=['chb01_01', 'chb01_02', 'chb02_01'], onset=[2996.0, 100.0, 50.0],
+                                        offset=[3036.0, 130.0, 80.0], label=['seiz', 'seiz', 'seiz']))
+        self.index.annotate(self.events)
+
+    def test_parse_window_name(self):
+        self.assertEqual(parse_window_name('out/chb01_01/2560_5120_ch.pkl'), (2560, 5120))
+
+    def test_select(self):
+        self.assertEqual(len(self.index), 590)
+        indices = self.index.select(patients=['chb01'], start=20.0, end=45.0)
+        frame = self.index.to_frame(indices)
+        self.assertEqual(frame['recording'].tolist(), ['out/chb01_01'] * 3 + ['out/chb01_02'] * 3)
+        self.assertEqual(frame['start'].tolist(), [20.0, 30.0, 40.0] * 2)
+        self.assertEqual(len(self.index.select(recordings=['chb01_01'], start=5.0, end=25.0, good_only=False)), 3)
+        self.assertEqual(len(self.index.select(recordings=['chb01_01'], start=5.0, end=25.0)), 2)
+        within = self.index.select(recordings=['chb01_01'], start=5.0, end=25.0, within=True, good_only=False)
+        self.assertEqual(len(within), 1)
+
+    def test_annotate(self):
+        seizures = self.index.to_frame(self.index.select(labels=['seiz'], good_only=False))
+        # 2996-3036 sec covers windows 2990-3040, 100-130 sec covers 100-130
+        self.assertEqual(seizures['start'].tolist(), [2990.0, 3000.0, 3010.0, 3020.0, 3030.0, 100.0, 110.0, 120.0,
+                                                      50.0, 60.0, 70.0])
+
+    def test_around_events(self):
+        indices = self.index.around_events(before=1800, event_labels=['seiz'], patients=['chb01'], labels=['bckg'])
+        frame = self.index.to_frame(indices)
+        self.assertEqual(set(frame['recording']), {'out/chb01_01', 'out/chb01_02'})
+        first = frame[frame['recording'] == 'out/chb01_01']
+        self.assertEqual((first['start'].min(), first['end'].max()), (1200.0, 2990.0))
+        self.assertTrue((frame['label'] == 'bckg').all())
+
+    def test_outputs(self):
+        indices = self.index.select(recordings=['chb02_01'], labels=['seiz'])
+        table = self.index.to_path_table(indices)
+        self.assertEqual(table[0], (['out/chb02_01/12800_15360.pkl'], 'seiz'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_path = self.index.to_manifest(indices[::-1], f'{tmp_dir}/seiz_manifest.csv')
+            manifest = pd.read_csv(manifest_path, header=None)
+            self.assertEqual(manifest.iloc[:, 0].tolist(), [table.paths(i)[0] for i in range(len(table))])
+            self.assertTrue(np.load(f'{tmp_dir}/seiz_manifest.quality.npy').all())
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.index.save(tmp_dir)
+            self.assertTrue(WindowIndex.exists(tmp_dir))
+            loaded = WindowIndex.load(tmp_dir)
+            query = dict(before=600, after=60, event_labels=['seiz'])
+            np.testing.assert_array_equal(loaded.around_events(**query), self.index.around_events(**query))
+            del loaded
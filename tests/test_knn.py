@@ -0,0 +1,45 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+from eeglibrary.src.knn import IndexedKNN
+
+
+class TestIndexedKNN(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.features = rng.randn(500, 8)
+        self.labels = (self.features[:, 0] > 0).astype(int)
+        self.queries = rng.randn(50, 8)
+
+    def brute_force(self, k):
+        dist = np.linalg.norm(self.queries[:, None] - self.features[None], axis=-1)
+        nearest = np.argsort(dist, axis=1)[:, :k]
+        return np.sort(np.take_along_axis(dist, nearest, axis=1), axis=1)
+
+    def test_sharded_matches_brute_force(self):
+        for tree in ['kd_tree', 'ball_tree']:
+            knn = IndexedKNN([0, 1], n_neighbors=5, tree=tree, n_shards=3, n_jobs=1).fit(self.features, self.labels)
+            dist, _ = knn.kneighbors(self.queries)
+            np.testing.assert_allclose(dist, self.brute_force(5))
+
+    def test_partial_fit(self):
+        knn = IndexedKNN([0, 1], n_neighbors=5, n_shards=2, n_jobs=1)
+        for i in range(0, len(self.features), 32):
+            knn.partial_fit(self.features[i:i + 32], self.labels[i:i + 32])
+        self.assertEqual(knn.n_indexed + knn.n_pending, len(self.features))
+        dist, _ = knn.kneighbors(self.queries)
+        np.testing.assert_allclose(dist, self.brute_force(5))
+        self.assertGreater((knn.predict(self.queries) == (self.queries[:, 0] > 0)).mean(), 0.8)
+
+    def test_save_and_load(self):
+        knn = IndexedKNN([0, 1], n_neighbors=3, n_shards=2, n_jobs=1).fit(self.features, self.labels)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = Path(tmp_dir) / 'knn.pkl'
+            knn.save_model(model_path)
+            loaded = IndexedKNN([0, 1])
+            loaded.load_model_(model_path)
+            np.testing.assert_array_equal(loaded.predict_proba(self.queries), knn.predict_proba(self.queries))
+            del loaded
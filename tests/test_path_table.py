@@ -0,0 +1,75 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.path_table import PathTable
+
+
+class TestPathTable(TestCase):
+
+    def setUp(self):
+        self.paths = [f'input/chb01/chb01_{i:02d}_ストレス.pkl' for i in range(6)]
+        self.table = PathTable.from_paths(self.paths, ['seiz', 'bckg', 'seiz'], [[0, 1], [2, 3], [4, 5]])
+
+    def test_items(self):
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table[1], (self.paths[2:4], 'bckg'))
+        self.assertEqual(self.table.get_labels(), ['seiz', 'bckg', 'seiz'])
+        self.assertEqual([paths for paths, label in self.table][2], self.paths[4:])
+
+    def test_save_and_mmap(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.table.save(tmp_dir)
+            loaded = PathTable.load(tmp_dir)
+            self.assertIsInstance(loaded.buffer, np.memmap)
+            self.assertEqual(list(loaded), list(self.table))
+            del loaded
+
+    def test_ragged_items(self):
+        table = PathTable.from_paths(self.paths, ['seiz', 'bckg'], [np.array([0, 1, 2]), np.array([4])])
+        self.assertEqual(table[0], (self.paths[:3], 'seiz'))
+        self.assertEqual(table[1], (self.paths[4:5], 'bckg'))
+        self.assertEqual(table.lengths().tolist(), [3, 1])
+
+
+def seizure_label(row):
+    return 1
+
+
+def background_label(row):
+    return 0
+
+
+class TestDataSetPathTable(TestCase):
+
+    def test_same_manifest_name(self):
+        from eeglibrary.src.eeg_dataset import EEGDataSet
+
+        rng = np.random.RandomState(0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = dict(to_1d=True, sample_rate='same', n_features=None, duration=1.0, n_use_eeg=1, model_type='rnn',
+                        batch_size=2, cache=False, labels=None, scaling_axis=None, window_size=None, reproduce=None,
+                        spect=False, cache_dir=None, path_table_dir=f'{tmp_dir}/tables')
+            manifest_paths = {}
+            for patient, n_windows in [('chb01', 2), ('chb02', 3)]:
+                paths = [f'{tmp_dir}/{patient}/{i * 256}_{(i + 1) * 256}.pkl' for i in range(n_windows)]
+                Path(paths[0]).parent.mkdir()
+                for path in paths:
+                    EEG(rng.randn(3, 256), ['ch1', 'ch2', 'ch3'], 1, 256).to_pkl(path)
+                manifest_paths[patient] = f'{tmp_dir}/{patient}/train_manifest.csv'
+                pd.DataFrame(paths).to_csv(manifest_paths[patient], index=False, header=None)
+
+            # Manifests of different patients with the same name get their own table
+            for patient, n_windows in [('chb01', 2), ('chb02', 3), ('chb01', 2)]:
+                dataset = EEGDataSet(manifest_paths[patient], conf, None, seizure_label, 'train')
+                self.assertEqual(len(dataset), n_windows)
+                self.assertTrue(all(f'/{patient}/' in paths[0] for paths, label in dataset.path_list))
+            self.assertEqual(len(list(Path(conf['path_table_dir']).iterdir())), 2)
+
+            # So do other labels of the same manifest
+            dataset = EEGDataSet(manifest_paths['chb01'], conf, None, background_label, 'train')
+            self.assertEqual(dataset.path_list.get_labels(), [0, 0])
+            self.assertEqual(len(list(Path(conf['path_table_dir']).iterdir())), 3)
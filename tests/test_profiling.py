@@ -0,0 +1,70 @@
+import multiprocessing
+import tempfile
+import tracemalloc
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+from eeglibrary.src.profiling import MemoryProfiler, ProfiledCollate, aggregate_memory_report, current_rss
+
+
+def run_worker(report_dir):
+    profiler = MemoryProfiler(report_dir, role='worker')
+    profiler.set_epoch(1)
+    for _ in range(3):
+        with profiler.stage('preprocess'):
+            np.ones(2 ** 18)
+    profiler.flush()
+
+
+class TestMemoryProfiler(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.report_dir = Path(self.tmp_dir.name) / 'memory'
+
+    def tearDown(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.tmp_dir.cleanup()
+
+    def test_disabled(self):
+        profiler = MemoryProfiler(None)
+        with profiler.stage('parse_eeg'):
+            pass
+        profiler.flush()
+        self.assertEqual(profiler.records, {})
+        self.assertGreater(current_rss(), 0)
+
+    def test_stage_records(self):
+        profiler = MemoryProfiler(self.report_dir, role='main')
+        profiler.set_epoch(1)
+        for _ in range(2):
+            with profiler.stage('parse_eeg'):
+                np.ones(2 ** 20)    # 8 MB
+        record = profiler.records['parse_eeg']
+        self.assertEqual(record['count'], 2)
+        self.assertGreaterEqual(record['peak_max'], 8 * 2 ** 20)
+
+        collate = ProfiledCollate(lambda batch: sum(batch), profiler)
+        self.assertEqual(collate([1, 2, 3]), 6)
+        self.assertEqual(profiler.records['collate']['count'], 1)
+
+        # A new epoch writes the records of the previous one
+        profiler.set_epoch(2)
+        self.assertEqual(profiler.records, {})
+        self.assertEqual(len(list(self.report_dir.glob('epoch1_main_*.json'))), 1)
+
+    def test_aggregate_processes(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=run_worker, args=(str(self.report_dir),)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        report = aggregate_memory_report(self.report_dir, epoch=1, verbose=False)
+        row = report.loc[('worker', 'preprocess')]
+        self.assertEqual((row['n_processes'], row['count']), (2, 6))
+        self.assertGreaterEqual(row['peak_max_mb'], 2.0)
+        self.assertTrue(aggregate_memory_report(self.report_dir, epoch=5, verbose=False).empty)
@@ -0,0 +1,119 @@
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+import torch
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.quality import QUALITY_FLAGS, load_quality_mask, scan_windows
+
+
+class TestQuality(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.sr = 100
+        self.eeg = EEG(rng.randn(4, 10 * self.sr), ['ch1', 'ch2', 'ch3', 'ch4'], 10, self.sr)
+
+    def test_clean_recording(self):
+        flags = self.eeg.scan_quality(window_size=1.0)
+        self.assertEqual(len(flags), len(self.eeg.split(window_size=1.0, n_jobs=1)))
+        self.assertTrue(flags['ok'].all())
+
+    def test_bad_windows(self):
+        values = self.eeg.values.copy()
+        values[0, 50] = np.nan               # window 0
+        values[1, 100:200] = 0.0             # window 1, flat
+        values[2, 220:260] = 10.0            # window 2, stuck at the rail
+        values[3, 300:400] = values[0, 300:400]  # window 3, singular correlation
+        values[0, 450:500] *= 100            # window 4, high amplitude
+        flags = scan_windows(values, np.arange(10) * self.sr, self.sr)
+
+        self.assertTrue(flags['nan_inf'][0])
+        self.assertTrue(flags['flat'][1])
+        self.assertTrue(flags['clipping'][2])
+        self.assertTrue(flags['singular'][3])
+        self.assertEqual(flags['amplitude'].tolist(), [False] * 4 + [True] + [False] * 5)
+        # High amplitude is reported, but the window stays usable
+        self.assertEqual(flags['ok'].tolist(), [False] * 4 + [True] * 6)
+        self.assertFalse(scan_windows(values, np.arange(10) * self.sr, self.sr, ok_flags=QUALITY_FLAGS)['ok'][4])
+
+    def test_clean_slow_rhythms(self):
+        sr = 256
+        t = np.arange(4 * sr) / sr
+        for freq in [0.5, 1, 2, 3]:
+            values = np.stack([np.sin(2 * np.pi * freq * t), np.cos(2 * np.pi * freq * t + 1)])
+            # Also as integer ADC counts, where the peak repeats for a few samples
+            for scaled in [values, np.round(values * 50)]:
+                self.assertTrue(scan_windows(scaled, np.arange(4) * sr, sr)['ok'].all(), freq)
+                self.assertTrue(scan_windows(scaled[:, :sr], [0], sr)['ok'].all(), freq)
+
+    def test_seizure_is_kept(self):
+        sr = 256
+        rng = np.random.RandomState(0)
+        values = rng.randn(2, 60 * sr) * 20
+        t = np.arange(10 * sr) / sr
+        spike_wave = 300 * (np.sin(2 * np.pi * 3 * t) ** 15 - 0.3 * np.sin(2 * np.pi * 3 * t + 1))
+        values[:, 30 * sr:40 * sr] += np.stack([spike_wave, 0.8 * spike_wave])
+        flags = scan_windows(values, np.arange(60) * sr, sr)
+        self.assertTrue(flags['ok'].all())
+
+
+class TestDataSetQuality(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.RandomState(0)
+        self.paths = [f'{self.tmp_dir.name}/{i * 256}_{(i + 1) * 256}.pkl' for i in range(4)]
+        for i, path in enumerate(self.paths):
+            values = rng.randn(3, 256)
+            if i == 2:
+                values[1] = values[0]    # singular correlation
+            EEG(values, ['ch1', 'ch2', 'ch3'], 1, 256).to_pkl(path)
+        self.manifest_path = f'{self.tmp_dir.name}/manifest.csv'
+        pd.DataFrame(self.paths).to_csv(self.manifest_path, index=False, header=None)
+        self.conf = dict(to_1d=True, sample_rate='same', n_features=None, duration=1.0, n_use_eeg=1,
+                         model_type='rnn', batch_size=2, cache=False, labels=None, scaling_axis=None,
+                         window_size=None, reproduce=None, spect=False, cache_dir=None)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def kept(self, phase, **conf):
+        from eeglibrary.src.eeg_dataset import EEGDataSet
+        dataset = EEGDataSet(self.manifest_path, dict(self.conf, **conf), None, lambda row: 0, phase)
+        return [item_paths for item_paths, label in dataset.path_list]
+
+    def test_manifest_without_mask_is_scanned(self):
+        self.assertEqual(self.kept('train'), [[path] for path in self.paths[:2] + self.paths[3:]])
+        self.assertEqual(load_quality_mask(self.manifest_path).tolist(), [True, True, False, True])
+
+    def test_evaluation_keeps_every_window(self):
+        self.assertEqual(self.kept('val'), [[path] for path in self.paths])
+        self.assertIsNone(load_quality_mask(self.manifest_path))
+        self.kept('train')
+        self.assertEqual(self.kept('test'), [[path] for path in self.paths])
+
+    def test_quality_filter_off(self):
+        self.assertEqual(self.kept('train', quality_filter=False), [[path] for path in self.paths])
+        self.assertIsNone(load_quality_mask(self.manifest_path))
+
+    def test_scan_follows_resource_plan(self):
+        import joblib
+        from eeglibrary.src.quality import scan_manifest
+        from eeglibrary.src.resources import ResourcePlan
+
+        calls, Parallel = [], joblib.Parallel
+
+        def parallel(n_jobs=None, **kwargs):
+            calls.append(n_jobs)
+            return Parallel(n_jobs=1, **kwargs)
+
+        threads = torch.get_num_threads()
+        try:
+            with ResourcePlan(n_cores=2, n_workers=0).applied(), mock.patch('joblib.Parallel', parallel):
+                mask = scan_manifest(self.manifest_path)
+        finally:
+            torch.set_num_threads(threads)
+        self.assertEqual(calls, [2])
+        self.assertEqual(mask.tolist(), [True, True, False, True])
@@ -0,0 +1,67 @@
+import argparse
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import torch
+from torch import nn
+from eeglibrary.src.quantize import compare_models, load_quantized, quantize_model, quantized_path, save_quantized
+
+
+class SmallCNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(2, 4, 3)
+        self.fc = nn.Linear(4 * 6 * 6, 2)
+
+    def forward(self, x):
+        return self.fc(torch.relu(self.conv(x)).flatten(1))
+
+
+class SmallRNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.rnn = nn.GRU(8, 16, batch_first=True)
+        self.fc = nn.Linear(16, 2)
+
+    def forward(self, x):
+        return self.fc(self.rnn(x)[0][:, -1])
+
+
+class TestQuantize(TestCase):
+
+    def loader(self, shape):
+        torch.manual_seed(0)
+        inputs = torch.randn(64, *shape)
+        labels = (inputs.flatten(1).mean(dim=1) > 0).long()
+        return [(inputs[i:i + 16], labels[i:i + 16]) for i in range(0, 64, 16)]
+
+    def check(self, model, loader, mode):
+        quantized = quantize_model(model, mode, loader, n_batches=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = quantized_path(Path(tmp_dir) / 'model.pth')
+            save_quantized(quantized, path, loader[0][0])
+            loaded = load_quantized(path)
+            report = compare_models({'float32': model, 'int8': loaded}, loader)
+        outputs, expected = loaded(loader[0][0]), model(loader[0][0])
+        self.assertEqual(outputs.shape, expected.shape)
+        self.assertLess((outputs - expected).abs().max().item(), 0.5)
+        self.assertEqual(report['model'].tolist(), ['float32', 'int8'])
+
+    def test_static_cnn(self):
+        self.check(SmallCNN().eval(), self.loader((2, 8, 8)), 'static')
+
+    def test_dynamic_rnn(self):
+        self.check(SmallRNN().eval(), self.loader((5, 8)), 'auto')
+
+    def test_main_setup(self):
+        from eeglibrary.utils import init_seed, set_eeg_conf
+
+        args = argparse.Namespace(seed=1, model_name='rnn', duration='5.0', sample_rate=256, highpass=0.5)
+        eeg_conf = set_eeg_conf(args)
+        self.assertEqual((eeg_conf['duration'], eeg_conf['sample_rate'], eeg_conf['model_type']), (5.0, 256, 'rnn'))
+        self.assertEqual((eeg_conf['highpass'], eeg_conf['notch']), (0.5, None))
+        init_seed(args)
+        first = torch.rand(3)
+        init_seed(args)
+        self.assertTrue(torch.equal(torch.rand(3), first))
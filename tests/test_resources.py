@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+import torch
+from torch.utils.data import TensorDataset
+from eeglibrary.src.resources import (ResourcePlan, available_cores, benchmark_plans, best_plan, current_plan,
+                                      resolve_n_jobs, worker_threads)
+
+
+class ModeModel(torch.nn.Module):
+    # Records whether forward ran in training mode
+    def __init__(self):
+        super().__init__()
+        self.modes = []
+
+    def forward(self, x):
+        self.modes.append(self.training)
+        return x
+
+
+class TestResourcePlan(TestCase):
+
+    def test_split(self):
+        plan = ResourcePlan(n_cores=32, worker_threads=2)
+        self.assertEqual((plan.n_workers, plan.main_threads, plan.joblib_jobs), (8, 16, 16))
+        plan = ResourcePlan(n_cores=4, n_workers=8)
+        self.assertEqual(plan.main_threads, 1)
+
+    def test_benchmark(self):
+        dataset = TensorDataset(torch.randn(64, 2, 10), torch.zeros(64, dtype=torch.long))
+        threads = torch.get_num_threads()
+        results = benchmark_plans(dataset, torch.nn.Flatten(), batch_size=8, n_batches=4,
+                                  plans=[ResourcePlan(2, 0), ResourcePlan(2, 1)])
+        self.assertEqual(len(results), 2)
+        self.assertIn(best_plan(results).n_workers, [0, 1])
+        self.assertEqual(torch.get_num_threads(), threads)
+        self.assertIsNone(current_plan())
+
+    def test_benchmark_in_eval_mode(self):
+        dataset = TensorDataset(torch.randn(32, 2, 10), torch.zeros(32, dtype=torch.long))
+        model = ModeModel()
+        benchmark_plans(dataset, model, batch_size=8, n_batches=2, plans=[ResourcePlan(2, 0)])
+        self.assertTrue(model.modes)
+        self.assertFalse(any(model.modes))
+        self.assertTrue(model.training)
+
+    def test_n_jobs(self):
+        self.assertEqual(resolve_n_jobs(3), 3)
+        self.assertEqual(resolve_n_jobs(-1), available_cores())
+        self.assertEqual(worker_threads(available_cores()), 1)
+        threads = torch.get_num_threads()
+        try:
+            ResourcePlan(n_cores=8, n_workers=2, worker_threads=2).apply()
+            self.assertEqual((resolve_n_jobs(-1), worker_threads(4)), (4, 2))
+        finally:
+            import eeglibrary.src.resources as resources
+            resources._PLAN = None
+            torch.set_num_threads(threads)
+
+    def test_applied(self):
+        threads = torch.get_num_threads()
+        try:
+            with ResourcePlan(n_cores=2, n_workers=0).applied() as plan:
+                self.assertIs(current_plan(), plan)
+                self.assertEqual((resolve_n_jobs(-1), worker_threads(2)), (2, 1))
+            self.assertIsNone(current_plan())
+        finally:
+            torch.set_num_threads(threads)
@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+import numpy as np
+from eeglibrary.src.sampler import LocalityWeightedSampler, recording_blocks
+
+
+class TestLocalityWeightedSampler(TestCase):
+
+    def setUp(self):
+        self.path_list = [([f'rec{i // 10}/{i}.pkl'], i % 2) for i in range(100)]
+        self.block_ids = recording_blocks(self.path_list)
+
+    def test_recording_blocks(self):
+        self.assertEqual(len(set(self.block_ids)), 10)
+        self.assertEqual(len(set(recording_blocks(self.path_list, block_size=5))), 20)
+
+    def test_locality(self):
+        sampler = LocalityWeightedSampler(np.ones(100), 100, self.block_ids, locality=1.0, replacement=False)
+        order = np.array(list(sampler))
+        self.assertEqual(sorted(order.tolist()), list(range(100)))
+        # Every block is read at once
+        self.assertEqual(np.count_nonzero(np.diff(self.block_ids[order])), 9)
+
+        random_order = np.array(list(LocalityWeightedSampler(np.ones(100), 100, self.block_ids, locality=0.0)))
+        self.assertGreater(np.count_nonzero(np.diff(self.block_ids[random_order])), 50)
+
+    def test_sequential_within_block(self):
+        sampler = LocalityWeightedSampler(np.ones(100), 100, self.block_ids, shuffle_within=False,
+                                          replacement=False)
+        order = sampler.order()
+        for block in range(10):
+            in_block = order[self.block_ids[order] == block]
+            self.assertEqual(in_block.tolist(), sorted(in_block.tolist()))
+
+    def test_resume(self):
+        sampler = LocalityWeightedSampler(np.ones(100), 50, self.block_ids)
+        first = list(sampler)
+        self.assertNotEqual(first, list(sampler))
+        sampler.set_epoch(0)
+        self.assertEqual(first, list(sampler))
@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+import numpy as np
+import torch
+from eeglibrary.src.eeg import EEG
+from eeglibrary.src.filters import FilterBank
+from eeglibrary.src.scan import FilteredValues, RecordingScanner, iter_window_batches, merge_events, overlap_add
+
+
+class AmplitudeModel(torch.nn.Module):
+    # Class 1 logit grows with the amplitude of the window
+    def forward(self, x):
+        amplitude = x.abs().mean(dim=(1, 2))
+        return torch.stack([torch.zeros_like(amplitude), 10 * (amplitude - 1)], dim=1)
+
+
+class RecordingModel(torch.nn.Module):
+    # Keeps every window it is fed
+    def __init__(self):
+        super().__init__()
+        self.windows = []
+
+    def forward(self, x):
+        self.windows.append(x.clone())
+        return torch.zeros(len(x), 2)
+
+
+class TestScan(TestCase):
+
+    def test_window_batches(self):
+        values = np.arange(2 * 20).reshape(2, 20)
+        batches = list(iter_window_batches(values, window=4, stride=3, batch_size=2))
+        starts = np.concatenate([batch_starts for batch_starts, _ in batches])
+        self.assertEqual(starts.tolist(), [0, 3, 6, 9, 12, 15])
+        for batch_starts, windows in batches:
+            for start, window in zip(batch_starts, windows):
+                np.testing.assert_array_equal(window, values[:, start:start + 4])
+
+    def test_overlap_add(self):
+        timeline = overlap_add(np.array([0, 2]), np.array([1.0, 0.0]), window=4, n_samples=8, sr=2)
+        np.testing.assert_allclose(timeline, [1.0, 0.5, 0.0, np.nan])
+
+    def test_merge_events(self):
+        timeline = np.array([0, 0.9, 0.8, 0, 0.7, 0, 0, 0, 0.9, 0])
+        events = merge_events(timeline, thresh=0.5, min_gap=2)
+        self.assertEqual(events[['onset', 'offset']].values.tolist(), [[1, 5], [8, 9]])
+        events = merge_events(timeline, thresh=0.5, min_gap=2, min_duration=2)
+        self.assertEqual(events[['onset', 'offset']].values.tolist(), [[1, 5]])
+
+    def test_detect(self):
+        sr = 100
+        values = np.random.RandomState(0).randn(2, 60 * sr) * 0.1
+        values[:, 20 * sr:30 * sr] *= 30
+        eeg = EEG(values, ['a', 'b'], 60, sr)
+        scanner = RecordingScanner.from_model(AmplitudeModel(), False, 2, window_sec=2, stride_sec=1, batch_size=8)
+        timeline, events = scanner.detect(eeg, thresh=0.5)
+        self.assertEqual(len(timeline), 60)
+        self.assertEqual(events[['onset', 'offset']].values.tolist(), [[20, 30]])
+
+    def test_stride_under_one_sample(self):
+        eeg = EEG(np.ones((2, 40)), ['a', 'b'], 4, 10)
+        scanner = RecordingScanner.from_model(AmplitudeModel(), False, 2, window_sec=1, stride_sec=0.01)
+        starts, probs = scanner.window_probs(eeg)
+        self.assertEqual(starts.tolist(), list(range(31)))
+
+    def test_filtered_windows(self):
+        sr = 100
+        values = np.random.RandomState(0).randn(2, 20 * sr) + 50
+        bank = FilterBank([('highpass', 1.0, 4)], zero_phase=False)
+        filtered = bank.stream(sr).process(values)
+        for stride in [0.5, 3]:
+            model = RecordingModel()
+            scanner = RecordingScanner.from_model(model, False, 2, window_sec=2, stride_sec=stride, batch_size=4,
+                                                  filter_bank=bank)
+            starts, _ = scanner.window_probs(EEG(values, ['a', 'b'], 20, sr))
+            # Windows are cut from the recording filtered as a whole, not filtered one by one
+            windows = torch.cat(model.windows).numpy()
+            expected = np.stack([filtered[:, start:start + 2 * sr] for start in starts])
+            np.testing.assert_allclose(windows, expected, atol=1e-6)
+
+        with self.assertRaises(AssertionError):
+            view = FilteredValues(values, bank.stream(sr))
+            view[:, 100:200]
+            view[:, 50:150]
@@ -0,0 +1,66 @@
+import tempfile
+from unittest import TestCase
+
+import torch
+from eeglibrary.src.feature_cache import FeatureCache, preprocess_key
+from eeglibrary.src.search import SuccessiveHalvingSearch, expand_grid
+
+CALLS = []
+
+
+def trial_func(params, budget):
+    # Lower lr is better. lr 0.3 fails
+    CALLS.append((params['lr'], params['n_use_eeg'], budget))
+    if params['lr'] == 0.3:
+        raise ValueError('diverged')
+    return params['lr'] + 1.0 / budget
+
+
+class TestSuccessiveHalvingSearch(TestCase):
+
+    def setUp(self):
+        CALLS.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        space = dict(lr=[0.1, 0.2, 0.3], n_use_eeg=[1, 2, 3])
+        self.search = SuccessiveHalvingSearch(trial_func, space, min_epochs=1, max_epochs=9, eta=3, n_jobs=1,
+                                              cache_root=f'{self.tmp_dir.name}/cache',
+                                              model_dir=f'{self.tmp_dir.name}/model',
+                                              result_path=f'{self.tmp_dir.name}/search.csv')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_budgets(self):
+        self.assertEqual(len(expand_grid(dict(a=[1, 2], b=[3, 4, 5]))), 6)
+        self.assertEqual(self.search.budgets(), [1, 3, 9])
+
+    def test_run(self):
+        results = self.search.run()
+        self.assertEqual(results.groupby('rung').size().tolist(), [9, 3, 1])
+        final = results[results['rung'] == 2].iloc[0]
+        self.assertEqual((final['lr'], final['budget']), (0.1, 9))
+        # Failed trials are never promoted
+        self.assertFalse(results[results['status'] == 'failed']['promoted'].any())
+
+    def test_one_trial_per_preprocessing_runs_first(self):
+        self.search.run()
+        first_keys = [n_use_eeg for lr, n_use_eeg, budget in CALLS[:3]]
+        self.assertEqual(sorted(first_keys), [1, 2, 3])
+
+
+class TestFeatureCache(TestCase):
+
+    def test_save_and_load(self):
+        conf = dict(sample_rate=256, duration=10.0, to_1d=True, lr=0.1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = FeatureCache(tmp_dir, conf)
+            paths = ['a/0_2560.pkl', 'a/2560_5120.pkl']
+            self.assertIsNone(cache.load(paths))
+            cache.save(paths, torch.arange(6.0).view(2, 3))
+            self.assertIn(paths, cache)
+            self.assertTrue(torch.equal(cache.load(paths), torch.arange(6.0).view(2, 3)))
+            # Options which do not change features share the cache, preprocessing options do not
+            self.assertEqual(FeatureCache(tmp_dir, dict(conf, lr=0.2)).cache_dir, cache.cache_dir)
+            self.assertNotIn(paths, FeatureCache(tmp_dir, dict(conf, sample_rate=128)))
+            self.assertNotEqual(preprocess_key(conf), preprocess_key(dict(conf, duration=5.0)))
+            self.assertEqual(len(list(cache.cache_dir.glob('*.tmp.npy'))), 0)
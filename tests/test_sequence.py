@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+import numpy as np
+import torch
+from eeglibrary.src.eeg_dataset import EEGDataSet
+from eeglibrary.src.sequence import BucketBatchSampler, PackedCollate, SequenceBatch, WindowSequenceRNN
+
+
+class TestBucketBatchSampler(TestCase):
+
+    def setUp(self):
+        self.lengths = np.random.RandomState(0).randint(1, 30, size=200)
+
+    def test_batches_have_similar_lengths(self):
+        sampler = BucketBatchSampler(self.lengths, batch_size=8, pool_batches=25)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(200)))
+        spread = np.mean([np.ptp(self.lengths[batch]) for batch in batches])
+        random_spread = np.mean([np.ptp(self.lengths[i:i + 8]) for i in range(0, 200, 8)])
+        self.assertLess(spread, random_spread / 3)
+
+    def test_epochs_are_reproducible(self):
+        sampler = BucketBatchSampler(self.lengths, batch_size=8, weights=np.ones(200), num_samples=100)
+        first = sampler.batches()
+        self.assertEqual(len(first), len(sampler))
+        sampler.set_epoch(0)
+        self.assertEqual(sampler.batches(), first)
+        sampler.set_epoch(1)
+        self.assertNotEqual(sampler.batches(), first)
+
+
+class TestPackedSequences(TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.xs = [torch.randn(length, 6) for length in [5, 2, 7]]
+
+    def test_collate(self):
+        batch = PackedCollate()([(x, label) for x, label in zip(self.xs, [1, 0, 1])])
+        self.assertIsInstance(batch, SequenceBatch)
+        inputs, labels = batch
+        self.assertEqual(labels.tolist(), [1, 0, 1])
+        self.assertEqual(inputs.data.size(), (14, 6))
+
+        batch = PackedCollate()([(x, ['a.pkl'] * len(x)) for x in self.xs])
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(len(batch.paths[2]), 7)
+
+    def test_packed_output_equals_one_by_one(self):
+        for rnn_type in ['gru', 'lstm']:
+            model = WindowSequenceRNN(6, 2, rnn_type, hidden_size=8, n_layers=2).eval()
+            inputs, _ = PackedCollate()([(x, 0) for x in self.xs])
+            with torch.no_grad():
+                packed = model(inputs)
+                one_by_one = torch.cat([model(x.unsqueeze(0)) for x in self.xs])
+            self.assertTrue(torch.allclose(packed, one_by_one, atol=1e-6))
+
+
+class TestVariableItems(TestCase):
+
+    def test_runs_are_cut(self):
+        paths = [f'chb01/{i}.pkl' for i in range(7)] + [f'chb02/{i}.pkl' for i in range(3)]
+        labels = np.array(['bckg'] * 4 + ['seiz'] * 3 + ['bckg'] * 3)
+        quality = np.ones(10, dtype=bool)
+        quality[8] = False
+        items = EEGDataSet._variable_items(paths, labels, quality, max_len=3, min_len=1)
+        self.assertEqual([item.tolist() for item in items], [[0, 1, 2], [3], [4, 5, 6], [7], [9]])
+
+        items = EEGDataSet._variable_items(paths, labels, quality, max_len=3, min_len=2)
+        self.assertEqual([item.tolist() for item in items], [[0, 1, 2], [4, 5, 6]])
@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+import numpy as np
+from scipy import signal
+from eeglibrary.src.spectral import Spectrum
+
+
+class TestSpectrum(TestCase):
+
+    def setUp(self):
+        self.values = np.random.RandomState(0).randn(4, 400)
+        self.spectrum = Spectrum(self.values, 100)
+
+    def test_resample(self):
+        for num in [200, 201, 800, 801]:
+            resampled = self.spectrum.resample(num)
+            np.testing.assert_allclose(resampled.values, signal.resample(self.values, num, axis=1), atol=1e-10)
+            np.testing.assert_allclose(resampled.rfft, np.fft.rfft(resampled.values, axis=1), atol=1e-8)
+
+    def test_spectrogram_memoized(self):
+        first = self.spectrogram = self.spectrum.spectrogram(nperseg=64)
+        self.assertIs(first, self.spectrum.spectrogram(nperseg=64))
+        self.assertEqual(first[2].shape[0], 4)
+
+    def test_band_powers(self):
+        alpha = np.sin(2 * np.pi * 10 * np.arange(400) / 100)[None, :]
+        powers = Spectrum(alpha, 100).band_powers(relative=True)
+        self.assertEqual(powers.shape, (1, 5))
+        self.assertGreater(powers[0, 2], 0.99)
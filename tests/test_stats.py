@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+import numpy as np
+from eeglibrary.src.stats import RunningStats
+
+
+class TestRunningStats(TestCase):
+
+    def setUp(self):
+        self.samples = np.random.RandomState(0).randn(50, 3, 4, 5) * 10 + 3
+
+    def test_merge(self):
+        left, right = RunningStats(), RunningStats()
+        for x in self.samples[:20]:
+            left.update(x)
+        for x in self.samples[20:]:
+            right.update(x)
+        stats = left.merge(right)
+
+        self.assertEqual(stats.count, 50)
+        np.testing.assert_allclose(stats.mean, self.samples.mean(axis=0))
+        np.testing.assert_allclose(stats.var, self.samples.var(axis=0))
+        np.testing.assert_allclose(stats.min, self.samples.min(axis=0))
+        np.testing.assert_allclose(stats.max, self.samples.max(axis=0))
+
+    def test_reduce_per_channel(self):
+        stats = RunningStats()
+        for x in self.samples:
+            stats.update(x)
+        channel_stats = stats.reduce(keep_axis=0)
+
+        per_channel = self.samples.transpose(1, 0, 2, 3).reshape(3, -1)
+        np.testing.assert_allclose(channel_stats.mean, per_channel.mean(axis=1))
+        np.testing.assert_allclose(channel_stats.var, per_channel.var(axis=1))